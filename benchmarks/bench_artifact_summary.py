@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+
+# -----------------------------------------------------------------------------
+# Copyright (c) 2014--, The Qiita Development Team.
+#
+# Distributed under the terms of the BSD 3-clause License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# -----------------------------------------------------------------------------
+
+"""Benchmarks the retrieval of the artifact summary information
+
+Compares the previous approach of the artifact summary page, which built a
+ProcessingJob for each job of the artifact and read its command, software
+type, status, step and log one query at a time, against
+`get_artifact_summary_info`, which retrieves everything in a single query.
+The jobs are added to an artifact inside a transaction that is always rolled
+back, so the database is not modified.
+
+Run it against a test environment:
+
+    python benchmarks/bench_artifact_summary.py --jobs 10,100,500
+"""
+
+from __future__ import print_function
+from timeit import default_timer
+
+import click
+
+import qiita_db as qdb
+
+
+def _add_jobs(artifact_id, n_jobs):
+    """Adds `n_jobs` jobs with `artifact_id` as input, in different status"""
+    # The failed jobs need a log entry, so they all share the same one
+    log_id = qdb.logger.LogEntry.create(
+        'Runtime', 'Benchmark error message').id
+    sql = """INSERT INTO qiita.processing_job
+                (email, command_id, command_parameters,
+                 processing_job_status_id, step, logging_id)
+             VALUES ('test@foo.bar', 1, '{}'::json, %s, %s, %s)
+             RETURNING processing_job_id"""
+    statuses = ['queued', 'running', 'success', 'error']
+    status_ids = {s: qdb.util.convert_to_id(s, "processing_job_status")
+                  for s in statuses}
+    sql_args = []
+    for i in range(n_jobs):
+        status = statuses[i % len(statuses)]
+        sql_args.append([status_ids[status], 'step %d' % i,
+                         log_id if status == 'error' else None])
+    idx = qdb.sql_connection.TRN.index
+    qdb.sql_connection.TRN.add(sql, sql_args, many=True)
+    job_ids = [row[0][0] for row in qdb.sql_connection.TRN.execute()[idx:]]
+
+    sql = """INSERT INTO qiita.artifact_processing_job
+                (artifact_id, processing_job_id)
+             VALUES (%s, %s)"""
+    qdb.sql_connection.TRN.add(
+        sql, [[artifact_id, j_id] for j_id in job_ids], many=True)
+    qdb.sql_connection.TRN.execute()
+
+
+def _legacy_summary(artifact_id):
+    """The per-job information retrieval that the single query replaced"""
+    artifact = qdb.artifact.Artifact(artifact_id)
+    artifact.study.id
+    artifact.visibility
+    processing_jobs = []
+    for j in artifact.jobs():
+        if j.command.software.type == "artifact transformation":
+            status = j.status
+            if status == 'success':
+                continue
+            j_msg = j.log.msg if status == 'error' else None
+            processing_jobs.append(
+                [j.id, j.command.name, j.status, j.step, j_msg])
+    artifact.html_summary_fp
+    artifact.can_be_submitted_to_ebi
+    artifact.can_be_submitted_to_vamps
+    artifact.filepaths
+    artifact.artifact_type
+    artifact.study.id
+    artifact.prep_templates[0].id
+    return processing_jobs
+
+
+def _time(func, repeats):
+    start = default_timer()
+    for _ in range(repeats):
+        func()
+    return (default_timer() - start) / repeats
+
+
+@click.command()
+@click.option('--jobs', default='10,100,500',
+              help='Comma separated list of the number of jobs to add')
+@click.option('--artifact', default=1, type=int,
+              help='The artifact to which the jobs are added')
+@click.option('--repeats', default=5, type=int,
+              help='Number of times each approach is timed')
+def bench(jobs, artifact, repeats):
+    """Compares the time to retrieve the artifact summary information"""
+    print('jobs\tper job objects (s)\tsingle query (s)\tspeedup')
+    for n_jobs in [int(j) for j in jobs.split(',')]:
+        with qdb.sql_connection.TRN:
+            _add_jobs(artifact, n_jobs)
+            t_legacy = _time(lambda: _legacy_summary(artifact), repeats)
+            t_query = _time(
+                lambda: qdb.meta_util.get_artifact_summary_info(artifact),
+                repeats)
+            qdb.sql_connection.TRN.rollback()
+        print('%d\t%.4f\t%.4f\t%.1fx' % (n_jobs, t_legacy, t_query,
+                                         t_legacy / t_query))
+
+
+if __name__ == '__main__':
+    bench()
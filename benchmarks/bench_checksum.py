@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+
+# -----------------------------------------------------------------------------
+# Copyright (c) 2014--, The Qiita Development Team.
+#
+# Distributed under the terms of the BSD 3-clause License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# -----------------------------------------------------------------------------
+
+"""Benchmarks the computation of the file checksums
+
+Compares the previous `compute_checksum`, which fed crc32 line by line from a
+file opened in universal newlines mode, against the block based
+`compute_checksum` (one file at a time) and `compute_checksums` (several
+files in parallel). It writes synthetic FASTQ-like files (short lines) and
+binary-like files (no newlines) and reports the throughput of each approach.
+
+It doesn't need a database:
+
+    python benchmarks/bench_checksum.py --size 512 --files 4
+"""
+
+from __future__ import print_function
+from binascii import crc32
+from os import urandom
+from shutil import rmtree
+from tempfile import mkdtemp
+from os.path import join
+from timeit import default_timer
+
+import click
+
+import qiita_db as qdb
+
+
+def _write_fastq(fp, size_mb):
+    record = '@seq\nACGTACGTACGTACGTACGTACGTACGTACGT\n+\n%s\n' % ('I' * 32)
+    n_records = size_mb * 1024 * 1024 // len(record)
+    with open(fp, 'w') as f:
+        for _ in range(n_records):
+            f.write(record)
+
+
+def _write_binary(fp, size_mb):
+    block = urandom(1024 * 1024).replace(b'\n', b'\x00')
+    with open(fp, 'wb') as f:
+        for _ in range(size_mb):
+            f.write(block)
+
+
+def _legacy_checksum(path):
+    """The line based checksum that the block based one replaced"""
+    crc = 0
+    with open(path, "Ub") as f:
+        for line in f:
+            crc = crc32(line, crc)
+    return crc & 0xffffffff
+
+
+def _time(func):
+    start = default_timer()
+    result = func()
+    return default_timer() - start, result
+
+
+@click.command()
+@click.option('--size', default=512, type=int,
+              help='Size of each file, in megabytes')
+@click.option('--files', default=4, type=int,
+              help='Number of files of each kind')
+@click.option('--algorithm', default='crc32',
+              type=click.Choice(qdb.util.CHECKSUM_ALGORITHMS),
+              help='Algorithm used by the new implementation')
+def bench(size, files, algorithm):
+    """Compares the throughput of the checksum implementations"""
+    base = mkdtemp()
+    try:
+        for kind, writer in [('fastq', _write_fastq),
+                             ('binary', _write_binary)]:
+            paths = [join(base, '%s_%d' % (kind, i)) for i in range(files)]
+            for fp in paths:
+                writer(fp, size)
+            total = size * files
+
+            t_legacy, _ = _time(lambda: [_legacy_checksum(fp)
+                                         for fp in paths])
+            t_serial, _ = _time(lambda: [
+                qdb.util.compute_checksum(fp, algorithm) for fp in paths])
+            t_parallel, _ = _time(
+                lambda: qdb.util.compute_checksums(paths, algorithm))
+
+            print('%s files: %d x %d MB' % (kind, files, size))
+            print('implementation\ttime (s)\tthroughput (MB/s)')
+            for name, elapsed in [('line based crc32', t_legacy),
+                                  ('block based %s' % algorithm, t_serial),
+                                  ('parallel %s' % algorithm, t_parallel)]:
+                print('%s\t%.3f\t%.1f' % (name, elapsed, total / elapsed))
+            print()
+    finally:
+        rmtree(base)
+
+
+if __name__ == '__main__':
+    bench()
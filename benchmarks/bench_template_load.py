@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+
+# -----------------------------------------------------------------------------
+# Copyright (c) 2014--, The Qiita Development Team.
+#
+# Distributed under the terms of the BSD 3-clause License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# -----------------------------------------------------------------------------
+
+"""Benchmarks the loading of metadata template values into the database
+
+Compares the COPY based loader used by the metadata templates against
+inserting the rows with `TRN.add(..., many=True)`. The values are loaded in a
+temporary table with the same shape as the qiita.sample_<id> tables and the
+transaction is always rolled back, so the database is not modified.
+
+Run it against a test environment:
+
+    python benchmarks/bench_template_load.py --samples 1000,10000,100000
+"""
+
+from __future__ import print_function
+from timeit import default_timer
+
+import click
+
+import qiita_db as qdb
+
+
+def _build_rows(n_samples, n_columns):
+    """Builds the rows of a synthetic template with mixed column types"""
+    types = ['varchar', 'float8', 'integer', 'bool']
+    columns = ['col_%d' % i for i in range(n_columns)]
+    dtypes = [types[i % len(types)] for i in range(n_columns)]
+    generators = {'varchar': lambda s, c: 'value %d.%d\twith tab' % (s, c),
+                  'float8': lambda s, c: s * 0.5 + c,
+                  'integer': lambda s, c: s + c,
+                  'bool': lambda s, c: (s + c) % 2 == 0}
+    rows = [['1.sample.%d' % s] + [generators[d](s, c)
+                                   for c, d in enumerate(dtypes)]
+            for s in range(n_samples)]
+    return columns, dtypes, rows
+
+
+def _create_table(columns, dtypes):
+    sql = "CREATE TEMP TABLE bench_template (sample_id varchar NOT NULL, %s)"
+    qdb.sql_connection.TRN.add(
+        sql % ', '.join('%s %s' % cd for cd in zip(columns, dtypes)))
+    qdb.sql_connection.TRN.execute()
+
+
+def _load_insert(columns, rows):
+    sql = "INSERT INTO bench_template (sample_id, %s) VALUES (%%s, %s)" % (
+        ', '.join(columns), ', '.join(['%s'] * len(columns)))
+    qdb.sql_connection.TRN.add(sql, rows, many=True)
+    qdb.sql_connection.TRN.execute()
+
+
+def _load_copy(columns, rows):
+    qdb.sql_connection.TRN.copy_from(
+        'bench_template', ['sample_id'] + columns, iter(rows))
+
+
+def _time_loader(loader, columns, dtypes, rows):
+    with qdb.sql_connection.TRN:
+        _create_table(columns, dtypes)
+        start = default_timer()
+        loader(columns, rows)
+        elapsed = default_timer() - start
+        qdb.sql_connection.TRN.rollback()
+    return elapsed
+
+
+@click.command()
+@click.option('--samples', default='1000,10000,100000',
+              help='Comma separated list of the number of samples to load')
+@click.option('--columns', default=30, type=int,
+              help='Number of metadata columns of the template')
+def bench(samples, columns):
+    """Compares the time to load templates of different sizes"""
+    print('samples\tcolumns\tinsert (s)\tcopy (s)\tspeedup')
+    for n_samples in [int(s) for s in samples.split(',')]:
+        cols, dtypes, rows = _build_rows(n_samples, columns)
+        t_insert = _time_loader(_load_insert, cols, dtypes, rows)
+        t_copy = _time_loader(_load_copy, cols, dtypes, rows)
+        print('%d\t%d\t%.3f\t%.3f\t%.1fx' % (
+            n_samples, columns, t_insert, t_copy, t_insert / t_copy))
+
+
+if __name__ == '__main__':
+    bench()
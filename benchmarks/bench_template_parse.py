@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+
+# -----------------------------------------------------------------------------
+# Copyright (c) 2014--, The Qiita Development Team.
+#
+# Distributed under the terms of the BSD 3-clause License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# -----------------------------------------------------------------------------
+
+"""Benchmarks the parsing of large metadata template files
+
+Compares `load_template_to_dataframe`, which streams the file lines into the
+pandas parser, against the previous approach of reading the whole file with
+`readlines()`, stripping every line and parsing the joined text from a
+`StringIO`. Each parser runs in its own process so the peak memory reported
+(the maximum resident set size of the process) is not shared between them.
+
+It doesn't need a database:
+
+    python benchmarks/bench_template_parse.py --size 100,300
+"""
+
+from __future__ import print_function
+from multiprocessing import Process, Queue
+from os import close, remove
+from resource import getrusage, RUSAGE_SELF
+from tempfile import mkstemp
+from timeit import default_timer
+
+import click
+import pandas as pd
+from six import StringIO
+
+import qiita_db as qdb
+
+
+def _write_template(fp, size_mb, n_columns):
+    """Writes a synthetic template of approximately `size_mb` megabytes"""
+    headers = ['sample_name', 'collection_timestamp', 'latitude', 'longitude',
+               'host_subject_id', 'description']
+    headers.extend('column_%d' % c for c in range(n_columns))
+    size = 0
+    with open(fp, 'w') as f:
+        line = '\t'.join(headers) + '\n'
+        f.write(line)
+        size += len(line)
+        sample = 0
+        while size < size_mb * 1024 * 1024:
+            values = ['Sample.%d' % sample, '2014-05-29 12:24:51 ',
+                      str(sample % 90), str(sample % 180), ' host %d' % sample,
+                      'Description of sample %d' % sample]
+            values.extend(' value %d ' % ((sample + c) % 100)
+                          if c % 2 else str(sample * 0.5 + c)
+                          for c in range(n_columns))
+            line = '\t'.join(values) + '\n'
+            f.write(line)
+            size += len(line)
+            sample += 1
+    return sample
+
+
+def _legacy_load(fp):
+    """The readlines based approach that the streaming parser replaced"""
+    with open(fp, 'U') as f:
+        holdfile = f.readlines()
+    for pos, line in enumerate(holdfile):
+        holdfile[pos] = '\t'.join(d.strip(" \r\x0b\x0c")
+                                  for d in line.split('\t'))
+    return pd.read_csv(
+        StringIO(''.join(holdfile)), sep='\t', encoding='utf-8',
+        infer_datetime_format=True, keep_default_na=False,
+        na_values=qdb.metadata_template.constants.NA_VALUES,
+        true_values=qdb.metadata_template.constants.TRUE_VALUES,
+        false_values=qdb.metadata_template.constants.FALSE_VALUES,
+        parse_dates=True, index_col=False, comment='\t',
+        mangle_dupe_cols=False,
+        converters={'sample_name': lambda x: str(x).strip(),
+                    'host_subject_id': str, 'description': str})
+
+
+def _streaming_load(fp):
+    return qdb.metadata_template.util.load_template_to_dataframe(fp)
+
+
+def _run(loader, fp, queue):
+    start = default_timer()
+    df = loader(fp)
+    elapsed = default_timer() - start
+    # ru_maxrss is reported in kilobytes on linux
+    queue.put((elapsed, getrusage(RUSAGE_SELF).ru_maxrss / 1024, df.shape))
+
+
+def _measure(loader, fp):
+    queue = Queue()
+    process = Process(target=_run, args=(loader, fp, queue))
+    process.start()
+    result = queue.get()
+    process.join()
+    return result
+
+
+@click.command()
+@click.option('--size', default='100,300',
+              help='Comma separated list of template sizes, in megabytes')
+@click.option('--columns', default=40, type=int,
+              help='Number of extra metadata columns of the template')
+def bench(size, columns):
+    """Compares the time and peak memory needed to parse large templates"""
+    print('size (MB)\tsamples\tparser\ttime (s)\tpeak memory (MB)')
+    for size_mb in [int(s) for s in size.split(',')]:
+        fd, fp = mkstemp(suffix='.txt')
+        close(fd)
+        try:
+            n_samples = _write_template(fp, size_mb, columns)
+            for name, loader in [('readlines', _legacy_load),
+                                 ('streaming', _streaming_load)]:
+                elapsed, peak, _ = _measure(loader, fp)
+                print('%d\t%d\t%s\t%.3f\t%.1f' % (size_mb, n_samples, name,
+                                                  elapsed, peak))
+        finally:
+            remove(fp)
+
+
+if __name__ == '__main__':
+    bench()
@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+
+# -----------------------------------------------------------------------------
+# Copyright (c) 2014--, The Qiita Development Team.
+#
+# Distributed under the terms of the BSD 3-clause License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# -----------------------------------------------------------------------------
+
+"""Benchmarks MetadataTemplate.update on a large sample template
+
+Creates a sample template with a synthetic study, edits a handful of its
+columns in a fraction of the samples and times the update. The template files
+are not generated and the transaction is always rolled back, so neither the
+database nor the mountpoints are modified.
+
+Run it against a test environment:
+
+    python benchmarks/bench_template_update.py --samples 20000 --edited 5
+"""
+
+from __future__ import print_function
+from timeit import default_timer
+
+import click
+import numpy as np
+import pandas as pd
+
+import qiita_db as qdb
+
+
+class _BenchSampleTemplate(qdb.metadata_template.sample_template.
+                           SampleTemplate):
+    """Sample template that does not write the template files"""
+
+    def generate_files(self):
+        pass
+
+
+def _build_template(n_samples, n_columns):
+    """Builds a synthetic template with mixed column types"""
+    index = ['Sample%d' % s for s in range(n_samples)]
+    data = {'collection_timestamp': ['2014-05-29 12:24:51'] * n_samples,
+            'physical_specimen_location': ['location1'] * n_samples,
+            'physical_specimen_remaining': [True] * n_samples,
+            'dna_extracted': [True] * n_samples,
+            'sample_type': ['type1'] * n_samples,
+            'host_subject_id': ['NotIdentified'] * n_samples,
+            'description': ['Sample %d' % s for s in range(n_samples)],
+            'latitude': np.linspace(-90, 90, n_samples),
+            'longitude': np.linspace(-180, 180, n_samples),
+            'taxon_id': [9606] * n_samples,
+            'scientific_name': ['homo sapiens'] * n_samples}
+    for c in range(n_columns):
+        if c % 2:
+            data['float_col_%d' % c] = np.arange(n_samples) * 0.5 + c
+        else:
+            data['str_col_%d' % c] = ['value %d' % (s % 50)
+                                      for s in range(n_samples)]
+    return pd.DataFrame(data, index=index)
+
+
+def _create_study():
+    info = {"timeseries_type_id": 1,
+            "metadata_complete": True,
+            "mixs_compliant": True,
+            "number_samples_collected": 25,
+            "number_samples_promised": 28,
+            "study_alias": "BENCH",
+            "study_description": "Benchmark study",
+            "study_abstract": "Benchmark study",
+            "emp_person_id": qdb.study.StudyPerson(2),
+            "principal_investigator_id": qdb.study.StudyPerson(3),
+            "lab_person_id": qdb.study.StudyPerson(1)}
+    return qdb.study.Study.create(
+        qdb.user.User('test@foo.bar'), "Benchmark study", [1], info)
+
+
+def _edit(template, n_edited, fraction):
+    """Edits `n_edited` columns in a `fraction` of the samples"""
+    edited = template.copy()
+    cols = [c for c in edited.columns if c.startswith(('str_col',
+                                                       'float_col'))]
+    rows = edited.index[::max(1, int(round(1 / fraction)))]
+    for col in cols[:n_edited]:
+        if col.startswith('str_col'):
+            edited.loc[rows, col] = 'edited'
+        else:
+            edited.loc[rows, col] = -1.0
+    return edited, len(rows) * min(n_edited, len(cols))
+
+
+@click.command()
+@click.option('--samples', default=20000, type=int,
+              help='Number of samples of the template')
+@click.option('--columns', default=30, type=int,
+              help='Number of extra metadata columns of the template')
+@click.option('--edited', default=5, type=int,
+              help='Number of columns edited')
+@click.option('--fraction', default=0.1, type=float,
+              help='Fraction of the samples edited on each column')
+def bench(samples, columns, edited, fraction):
+    """Times the update of a large sample template"""
+    template = _build_template(samples, columns)
+    new_template, n_cells = _edit(template, edited, fraction)
+    with qdb.sql_connection.TRN:
+        study = _create_study()
+        st = _BenchSampleTemplate.create(template, study)
+
+        start = default_timer()
+        st.update(template)
+        t_noop = default_timer() - start
+
+        start = default_timer()
+        st.update(new_template)
+        t_update = default_timer() - start
+
+        qdb.sql_connection.TRN.rollback()
+
+    print('samples\tcolumns\tcells edited\tno-op update (s)\tupdate (s)')
+    print('%d\t%d\t%d\t%.3f\t%.3f' % (samples, columns + 11, n_cells,
+                                      t_noop, t_update))
+
+
+if __name__ == '__main__':
+    bench()
@@ -56,6 +56,11 @@ class ConfigurationManager(object):
         The host where the database lives
     port : int
         The port used to connect to the postgres database in the previous host
+    pool_min_size : int
+        The number of postgres connections kept open by the transaction pool
+    pool_max_size : int
+        The maximum number of postgres connections that the transaction pool
+        can have open at the same time
     ipyc_demo : str
         The IPython demo cluster profile
     ipyc_demo_n : int
@@ -116,6 +121,12 @@ class ConfigurationManager(object):
         The filepath to the portal styling config file
     plugin_launcher : str
         The script used to start the plugins
+    search_metadata_index : bool
+        If true, the study search and the portal statistics query the
+        cross-study sample metadata index instead of each study table
+    use_nginx : bool
+        If true, the downloads are served by nginx through the
+        X-Accel-Redirect header, otherwise Qiita streams the files
     """
     def __init__(self):
         # If conf_fp is None, we default to the test configuration file
@@ -169,6 +180,13 @@ class ConfigurationManager(object):
         self.max_upload_size = config.getint('main', 'MAX_UPLOAD_SIZE')
         self.require_approval = config.getboolean('main', 'REQUIRE_APPROVAL')
         self.plugin_launcher = config.get('main', 'PLUGIN_LAUNCHER')
+        self.search_metadata_index = False
+        if config.has_option('main', 'SEARCH_METADATA_INDEX'):
+            self.search_metadata_index = config.getboolean(
+                'main', 'SEARCH_METADATA_INDEX')
+        self.use_nginx = True
+        if config.has_option('main', 'USE_NGINX'):
+            self.use_nginx = config.getboolean('main', 'USE_NGINX')
 
         self.valid_upload_extension = [ve.strip() for ve in config.get(
             'main', 'VALID_UPLOAD_EXTENSION').split(',')]
@@ -209,6 +227,23 @@ class ConfigurationManager(object):
         self.host = config.get('postgres', 'HOST')
         self.port = config.getint('postgres', 'PORT')
 
+        # The pool options were added after the initial release of the
+        # configuration file, so default them for older configuration files
+        self.pool_min_size = 1
+        if config.has_option('postgres', 'POOL_MIN_SIZE'):
+            self.pool_min_size = config.getint('postgres', 'POOL_MIN_SIZE')
+        self.pool_max_size = 10
+        if config.has_option('postgres', 'POOL_MAX_SIZE'):
+            self.pool_max_size = config.getint('postgres', 'POOL_MAX_SIZE')
+
+        if self.pool_max_size < 1:
+            raise ValueError("POOL_MAX_SIZE should be at least 1, found %d"
+                             % self.pool_max_size)
+        if not 0 <= self.pool_min_size <= self.pool_max_size:
+            raise ValueError("POOL_MIN_SIZE should be between 0 and "
+                             "POOL_MAX_SIZE (%d), found %d"
+                             % (self.pool_max_size, self.pool_min_size))
+
     def _get_redis(self, config):
         """Get the configuration of the redis section"""
         sec_get = partial(config.get, 'redis')
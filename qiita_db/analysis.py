@@ -20,10 +20,13 @@ from __future__ import division
 from itertools import product
 from os.path import join, basename
 from tarfile import open as taropen
+from multiprocessing import Pool
 
 from future.utils import viewitems
-from biom import load_table
-from biom.util import biom_open
+from biom import load_table, Table
+from biom.util import biom_open, is_hdf5_file
+from scipy.sparse import coo_matrix
+import numpy as np
 import pandas as pd
 
 from qiita_core.exceptions import IncompetentQiitaDeveloperError
@@ -31,6 +34,151 @@ from qiita_core.qiita_settings import qiita_config
 import qiita_db as qdb
 
 
+# Maximum number of processes used to load the BIOM tables of an analysis
+BUILD_FILES_PROCESSES = 4
+
+
+def _load_biom_subset(biom_fp, samples):
+    """Loads the selected samples of a BIOM table
+
+    Parameters
+    ----------
+    biom_fp : str
+        The path to the BIOM table
+    samples : iterable of str
+        The ids of the samples to load
+
+    Returns
+    -------
+    biom.Table or None
+        The table with the selected samples that are present in the file,
+        and only the observations with non-zero values among them. None if
+        none of the selected samples is present in the file
+
+    Notes
+    -----
+    If the table is stored in HDF5 only the columns of the selected samples
+    are read, so the memory used depends on the number of selected samples
+    instead of the size of the table. Otherwise, the full table is loaded
+    and filtered.
+    """
+    if is_hdf5_file(biom_fp):
+        with biom_open(biom_fp) as f:
+            samples = set(samples)
+            selected_samples = [sid for sid in f['sample/ids'][:]
+                                if sid in samples]
+            if not selected_samples:
+                return None
+            table = Table.from_hdf5(f, ids=selected_samples, axis='sample')
+    else:
+        table = load_table(biom_fp)
+        selected_samples = set(table.ids()).intersection(samples)
+        table.filter(selected_samples, axis='sample', inplace=True)
+        if len(table.ids()) == 0:
+            return None
+
+    non_zero = table.matrix_data.getnnz(axis=1) > 0
+    if not non_zero.all():
+        table.filter(table.ids(axis='observation')[non_zero],
+                     axis='observation', inplace=True)
+    return table
+
+
+def _load_biom_part(args):
+    """Loads a BIOM table keeping only the selected samples
+
+    Parameters
+    ----------
+    args : tuple of (str, int, int, str, iterable of str, bool)
+        The group label, the position of the table in the group, the artifact
+        id, the BIOM filepath, the selected samples and whether the sample ids
+        should be prefixed with the artifact id
+
+    Returns
+    -------
+    tuple of (str, int, tuple or None)
+        The group label, the position of the table in the group and the
+        (matrix, observation ids, sample ids, observation metadata, sample
+        metadata) of the filtered table, or None if no sample was selected
+
+    Notes
+    -----
+    It is executed in the worker processes, so it doesn't access the database
+    and returns the components of the table, which are cheap to pickle
+    """
+    label, pos, aid, biom_fp, samples, rename_dup_samples = args
+    # loading only the samples selected by the user
+    table = _load_biom_subset(biom_fp, samples)
+    if table is None:
+        return label, pos, None
+
+    sample_ids = list(table.ids())
+    if rename_dup_samples:
+        sample_ids = ["%d.%s" % (aid, _id) for _id in sample_ids]
+    return label, pos, (table.matrix_data.tocoo(),
+                        list(table.ids(axis='observation')), sample_ids,
+                        table.metadata(axis='observation'),
+                        table.metadata(axis='sample'))
+
+
+def _merge_biom_parts(parts):
+    """Merges several tables in a single pass
+
+    Parameters
+    ----------
+    parts : list of tuples
+        The (matrix, observation ids, sample ids, observation metadata,
+        sample metadata) of each table, as returned by `_load_biom_part`
+
+    Returns
+    -------
+    biom.Table
+        The merged table
+
+    Notes
+    -----
+    The result is the same as merging the tables one after the other with
+    `biom.Table.merge`: the ids are kept in order of appearance, the values of
+    the repeated (observation, sample) pairs are added and the metadata of the
+    first table in which an id appears is kept. However, the matrices are only
+    combined once, instead of building a new table on each merge.
+    """
+    obs_index, obs_ids, obs_md = {}, [], []
+    sample_index, sample_ids, sample_md = {}, [], []
+    rows, cols, data = [], [], []
+    for matrix, p_obs_ids, p_sample_ids, p_obs_md, p_sample_md in parts:
+        maps = []
+        for ids, md, index, all_ids, all_md in [
+                (p_obs_ids, p_obs_md, obs_index, obs_ids, obs_md),
+                (p_sample_ids, p_sample_md, sample_index, sample_ids,
+                 sample_md)]:
+            id_map = np.empty(len(ids), dtype=np.int64)
+            for i, _id in enumerate(ids):
+                if _id not in index:
+                    index[_id] = len(all_ids)
+                    all_ids.append(_id)
+                    all_md.append(md[i] if md is not None else None)
+                id_map[i] = index[_id]
+            maps.append(id_map)
+        rows.append(maps[0][matrix.row])
+        cols.append(maps[1][matrix.col])
+        data.append(matrix.data)
+
+    # the conversion to csr adds the values of the repeated positions
+    matrix = coo_matrix(
+        (np.concatenate(data), (np.concatenate(rows), np.concatenate(cols))),
+        shape=(len(obs_ids), len(sample_ids))).tocsr()
+
+    def clean_md(md):
+        if all(m is None for m in md):
+            return None
+        return [m if m is not None else {} for m in md]
+
+    return Table(matrix, obs_ids, sample_ids,
+                 observation_metadata=clean_md(obs_md),
+                 sample_metadata=clean_md(sample_md))
+
+
 class Analysis(qdb.base.QiitaStatusObject):
     """
     Analysis object to access to the Qiita Analysis information
@@ -232,6 +380,7 @@ class Analysis(qdb.base.QiitaStatusObject):
             qdb.sql_connection.TRN.add(sql, args)
 
             qdb.sql_connection.TRN.execute()
+            cls._forget_validated(_id)
 
     @classmethod
     def exists(cls, analysis_id):
@@ -692,6 +841,7 @@ class Analysis(qdb.base.QiitaStatusObject):
                      VALUES (%s, %s)"""
             qdb.sql_connection.TRN.add(sql, [self._id, user.id])
             qdb.sql_connection.TRN.execute()
+            qdb.util.invalidate_filepath_access(user)
 
     def unshare(self, user):
         """Unshare the analysis with another user
@@ -706,6 +856,7 @@ class Analysis(qdb.base.QiitaStatusObject):
                      WHERE analysis_id = %s AND email = %s"""
             qdb.sql_connection.TRN.add(sql, [self._id, user.id])
             qdb.sql_connection.TRN.execute()
+            qdb.util.invalidate_filepath_access(user)
 
     def add_samples(self, samples):
         """Adds samples to the analysis
@@ -894,19 +1045,25 @@ class Analysis(qdb.base.QiitaStatusObject):
 
     def _build_biom_tables(self, grouped_samples, rarefaction_depth=None,
                            rename_dup_samples=False):
-        """Build tables and add them to the analysis"""
+        """Build tables and add them to the analysis
+
+        Notes
+        -----
+        The tables of all the groups are loaded and filtered in parallel, in
+        up to `BUILD_FILES_PROCESSES` processes. The tables of each group are
+        merged in a single pass as soon as all of them have been loaded.
+        """
         with qdb.sql_connection.TRN:
             base_fp = qdb.util.get_work_base_dir()
 
             _, base_fp = qdb.util.get_mountpoint(self._table)[0]
+
+            # Retrieve the biom tables from the DB before starting to load
+            # them in the worker processes
+            jobs = []
             for label, tables in viewitems(grouped_samples):
-                data_type, reference_id, command_id = label.split('.')
-                new_table = None
-                artifact_ids = []
-                for aid, samples in tables:
+                for pos, (aid, samples) in enumerate(tables):
                     artifact = qdb.artifact.Artifact(aid)
-                    artifact_ids.append(str(aid))
-
                     # the next loop is assuming that an artifact can have only
                     # one biom, which is a safe assumption until we generate
                     # artifacts from multiple bioms and even then we might
@@ -920,72 +1077,119 @@ class Analysis(qdb.base.QiitaStatusObject):
                         raise RuntimeError(
                             "Artifact %s does not have a biom table associated"
                             % aid)
+                    jobs.append((label, pos, aid, biom_table_fp, samples,
+                                 rename_dup_samples))
 
-                    # loading the found biom table
-                    biom_table = load_table(biom_table_fp)
-                    # filtering samples to keep those selected by the user
-                    biom_table_samples = set(biom_table.ids())
-                    selected_samples = biom_table_samples.intersection(samples)
-                    biom_table.filter(selected_samples, axis='sample',
-                                      inplace=True)
-                    if len(biom_table.ids()) == 0:
-                        continue
+            processes = min(BUILD_FILES_PROCESSES, len(jobs))
+            pool = Pool(processes) if processes > 1 else None
+            try:
+                results = (pool.imap_unordered(_load_biom_part, jobs)
+                           if pool is not None else
+                           (_load_biom_part(job) for job in jobs))
+                parts = {label: [None] * len(tables)
+                         for label, tables in viewitems(grouped_samples)}
+                pending = {label: len(tables)
+                           for label, tables in viewitems(grouped_samples)}
+                for label, pos, part in results:
+                    parts[label][pos] = part
+                    pending[label] -= 1
+                    if pending[label] == 0:
+                        # All the tables of the group have been loaded, so
+                        # they can be merged and written out
+                        self._write_biom_table(
+                            label, grouped_samples[label],
+                            parts.pop(label), rarefaction_depth, base_fp)
+            finally:
+                if pool is not None:
+                    pool.terminate()
+                    pool.join()
+
+    def _write_biom_table(self, label, tables, parts, rarefaction_depth,
+                          base_fp):
+        """Merges the tables of a group and adds the result to the analysis
 
-                    if rename_dup_samples:
-                        ids_map = {_id: "%d.%s" % (aid, _id)
-                                   for _id in biom_table.ids()}
-                        biom_table.update_ids(ids_map, 'sample', True, True)
-
-                    if new_table is None:
-                        new_table = biom_table
-                    else:
-                        new_table = new_table.merge(biom_table)
-
-                if not new_table or len(new_table.ids()) == 0:
-                    # if we get to this point the only reason for failure is
-                    # rarefaction
-                    raise RuntimeError("All samples filtered out from "
-                                       "analysis due to rarefaction level")
-
-                # add the metadata column for study the samples come from,
-                # this is useful in case the user download the bioms
-                study_md = {'study': artifact.study.title,
-                            'artifact_ids': ', '.join(artifact_ids),
-                            'reference_id': reference_id,
-                            'command_id': command_id}
-                samples_md = {sid: study_md for sid in new_table.ids()}
-                new_table.add_metadata(samples_md, axis='sample')
-
-                if rarefaction_depth is not None:
-                    new_table = new_table.subsample(rarefaction_depth)
-                    if len(new_table.ids()) == 0:
-                        raise RuntimeError(
-                            "All samples filtered out due to rarefacion level")
-
-                # write out the file
-                fn = "%d_analysis_dt-%s_r-%s_c-%s.biom" % (
-                    self._id, data_type, reference_id, command_id)
-                biom_fp = join(base_fp, fn)
-                with biom_open(biom_fp, 'w') as f:
-                    new_table.to_hdf5(
-                        f, "Generated by Qiita. Analysis %d Datatype %s "
-                        "Reference %s Command %s" % (self._id, data_type,
-                                                     reference_id, command_id))
-                self._add_file(fn, "biom", data_type=data_type)
+        Parameters
+        ----------
+        label : str
+            The group label, in the form data_type.reference_id.command_id
+        tables : list of tuples (int, list of str)
+            The artifact ids and selected samples of the group
+        parts : list of tuples or None
+            The tables of the group, as returned by `_load_biom_part`
+        rarefaction_depth : int or None
+            If not None, rarefy all samples to this number of observations
+        base_fp : str
+            The path of the analysis mountpoint
+
+        Raises
+        ------
+        RuntimeError
+            If all samples are filtered out
+        """
+        data_type, reference_id, command_id = label.split('.')
+        parts = [p for p in parts if p is not None]
+        if not parts:
+            # if we get to this point the only reason for failure is
+            # rarefaction
+            raise RuntimeError("All samples filtered out from "
+                               "analysis due to rarefaction level")
+        new_table = _merge_biom_parts(parts)
+
+        # add the metadata column for study the samples come from,
+        # this is useful in case the user download the bioms
+        artifact = qdb.artifact.Artifact(tables[-1][0])
+        study_md = {'study': artifact.study.title,
+                    'artifact_ids': ', '.join(str(aid) for aid, _ in tables),
+                    'reference_id': reference_id,
+                    'command_id': command_id}
+        samples_md = {sid: study_md for sid in new_table.ids()}
+        new_table.add_metadata(samples_md, axis='sample')
+
+        if rarefaction_depth is not None:
+            new_table = new_table.subsample(rarefaction_depth)
+            if len(new_table.ids()) == 0:
+                raise RuntimeError(
+                    "All samples filtered out due to rarefacion level")
+
+        # write out the file
+        fn = "%d_analysis_dt-%s_r-%s_c-%s.biom" % (
+            self._id, data_type, reference_id, command_id)
+        biom_fp = join(base_fp, fn)
+        with biom_open(biom_fp, 'w') as f:
+            new_table.to_hdf5(
+                f, "Generated by Qiita. Analysis %d Datatype %s "
+                "Reference %s Command %s" % (self._id, data_type,
+                                             reference_id, command_id))
+        self._add_file(fn, "biom", data_type=data_type)
 
     def _build_mapping_file(self, samples, rename_dup_samples=False):
         """Builds the combined mapping file for all samples
            Code modified slightly from qiime.util.MetadataMap.__add__"""
         with qdb.sql_connection.TRN:
+            artifact_ids = list(samples)
+            qiime_maps = qdb.util.get_qiime_mapping_files(artifact_ids)
+
+            # retrieving the study metadata of all the artifacts at once
+            sql = """SELECT artifact_id, study_title, study_alias,
+                            qu.name, sp.name
+                     FROM qiita.study_artifact
+                        JOIN qiita.study USING (study_id)
+                        JOIN qiita.qiita_user qu USING (email)
+                        JOIN qiita.study_person sp
+                            ON principal_investigator_id = study_person_id
+                     WHERE artifact_id IN %s"""
+            qdb.sql_connection.TRN.add(sql, [tuple(artifact_ids)])
+            study_md = {row[0]: row[1:] for row in
+                        qdb.sql_connection.TRN.execute_fetchindex()}
+
             all_ids = set()
             to_concat = []
             for aid, samps in viewitems(samples):
-                qiime_map_fp = qdb.artifact.Artifact(
-                    aid).prep_templates[0].qiime_map_fp
+                _, fp_id, qiime_map_fp, checksum = qiime_maps[aid][0]
 
                 # Parse the mapping file
-                qm = qdb.metadata_template.util.load_template_to_dataframe(
-                    qiime_map_fp, index='#SampleID')
+                qm = qdb.metadata_template.util.load_qiime_mapping_file(
+                    fp_id, qiime_map_fp, checksum)
 
                 # if we are not going to merge the duplicated samples
                 # append the aid to the sample name
@@ -1000,14 +1204,11 @@ class Analysis(qdb.base.QiitaStatusObject):
                     all_ids.update(samps)
 
                 # appending study metadata to the analysis
-                study = qdb.artifact.Artifact(aid).study
-                study_owner = study.owner
-                study_info = study.info
-                pi = study_info['principal_investigator']
-                qm['qiita_study_title'] = study.title
-                qm['qiita_study_alias'] = study.info['study_alias']
-                qm['qiita_owner'] = study_owner.info['name']
-                qm['qiita_principal_investigator'] = pi.name
+                title, alias, owner_name, pi_name = study_md[aid]
+                qm['qiita_study_title'] = title
+                qm['qiita_study_alias'] = alias
+                qm['qiita_owner'] = owner_name
+                qm['qiita_principal_investigator'] = pi_name
 
                 qm = qm.loc[samps]
                 to_concat.append(qm)
@@ -1143,6 +1344,7 @@ class Collection(qdb.base.QiitaStatusObject):
                 qdb.sql_connection.TRN.add(sql.format(table), [id_])
 
             qdb.sql_connection.TRN.execute()
+            cls._forget_validated(id_)
 
     # --- Properties ---
     @property
@@ -141,6 +141,7 @@ class Artifact(qdb.base.QiitaObject):
                      VALUES (%s, %s)"""
             sql_args = [prep_template.study_id, a_id]
             qdb.sql_connection.TRN.add(sql, sql_args)
+            qdb.util.invalidate_search_cache(prep_template.study_id)
 
             # Associate the artifact with its filepaths
             filepaths = [(fp, f_type) for _, fp, f_type in artifact.filepaths]
@@ -171,9 +172,10 @@ class Artifact(qdb.base.QiitaObject):
 
         Parameters
         ----------
-        filepaths : iterable of tuples (str, int)
+        filepaths : iterable of tuples (str, int) or StagedFilepaths
             A list of 2-tuples in which the first element is the artifact
-            file path and the second one is the file path type id
+            file path and the second one is the file path type id, or the
+            filepaths already staged with `qiita_db.util.stage_filepaths`
         artifact_type : str
             The type of the artifact
         name : str, optional
@@ -210,6 +212,9 @@ class Artifact(qdb.base.QiitaObject):
         The visibility of the artifact is set by default to `sandbox`
         The timestamp of the artifact is set by default to `datetime.now()`
         The value of `submitted_to_vamps` is set by default to `False`
+        The files are moved to the DB directory and their checksums computed
+        before starting the transaction, unless `filepaths` was already
+        staged by the caller
         """
         # We need at least one file
         if not filepaths:
@@ -238,7 +243,15 @@ class Artifact(qdb.base.QiitaObject):
 
         timestamp = datetime.now()
 
+        # Moving the files and computing their checksums can take a long time,
+        # so it is done before the transaction starts
+        if not isinstance(filepaths, qdb.util.StagedFilepaths):
+            filepaths = qdb.util.stage_filepaths(filepaths, artifact_type)
+
         with qdb.sql_connection.TRN:
+            # If the transaction fails, return the files that have not been
+            # inserted yet to their original location
+            qdb.sql_connection.TRN.add_post_rollback_func(filepaths.unstage)
             visibility_id = qdb.util.convert_to_id("sandbox", "visibility")
             artifact_type_id = qdb.util.convert_to_id(
                 artifact_type, "artifact_type")
@@ -306,6 +319,7 @@ class Artifact(qdb.base.QiitaObject):
                      VALUES (%s, %s)"""
             sql_args = [study_id, a_id]
             qdb.sql_connection.TRN.add(sql, sql_args)
+            qdb.util.invalidate_search_cache(study_id)
 
             # Associate the artifact with its filepaths
             fp_ids = qdb.util.insert_filepaths(
@@ -440,10 +454,12 @@ class Artifact(qdb.base.QiitaObject):
             # Detach the artifact from the study_artifact table
             sql = "DELETE FROM qiita.study_artifact WHERE artifact_id = %s"
             qdb.sql_connection.TRN.add(sql, [artifact_id])
+            qdb.util.invalidate_search_cache(study.id)
 
             # Delete the row in the artifact table
             sql = "DELETE FROM qiita.artifact WHERE artifact_id = %s"
             qdb.sql_connection.TRN.add(sql, [artifact_id])
+            cls._forget_validated(artifact_id)
 
     @property
     def name(self):
@@ -561,6 +577,11 @@ class Artifact(qdb.base.QiitaObject):
             qdb.sql_connection.TRN.add(
                 sql, [qdb.util.convert_to_id(value, "visibility"), self.id])
             qdb.sql_connection.TRN.execute()
+            # The public files have changed for all the users
+            qdb.util.invalidate_filepath_access()
+            study = self.study
+            if study is not None:
+                qdb.util.invalidate_search_cache(study.id)
             # In order to correctly propagate the visibility upstream, we need
             # to go one step at a time. By setting up the visibility of our
             # parents first, we accomplish that, since they will propagate
@@ -49,11 +49,22 @@ class QiitaObject(object):
     create
     delete
     exists
+    instantiate_many
     _check_subclass
     _check_id
+    _check_ids
     __eq__
     __neq__
 
+    Notes
+    -----
+    The ids validated when instantiating an object are cached in the active
+    transaction (see `qiita_db.sql_connection.Transaction.cache`), so
+    instantiating the same object again in the same transaction doesn't
+    query the database. The cache is wiped out on rollback and when leaving
+    the transaction; subclasses should call `_forget_validated` when the
+    object is deleted.
+
     Raises
     ------
     IncompetentQiitaDeveloperError
@@ -137,6 +148,159 @@ class QiitaObject(object):
             qdb.sql_connection.TRN.add(sql, [id_])
             return qdb.sql_connection.TRN.execute_fetchlast()
 
+    @classmethod
+    def _check_ids(cls, ids):
+        r"""Returns which of the provided IDs exist on the database
+
+        Parameters
+        ----------
+        ids : list of object
+            The IDs to test
+
+        Returns
+        -------
+        set of object
+            The IDs in `ids` that exist on the database
+
+        Notes
+        -----
+        This is the bulk counterpart of `_check_id`, and the subclasses that
+        overwrite `_check_id` should overwrite this one as well.
+        """
+        with qdb.sql_connection.TRN:
+            sql = """SELECT {0}_id FROM qiita.{0}
+                     WHERE {0}_id IN %s""".format(cls._table)
+            qdb.sql_connection.TRN.add(sql, [tuple(ids)])
+            return set(qdb.sql_connection.TRN.execute_fetchflatten())
+
+    @classmethod
+    def _check_portals(cls, ids):
+        """Returns which of the provided IDs are accessible in current portal
+
+        Parameters
+        ----------
+        ids : list of object
+            The IDs to test
+
+        Returns
+        -------
+        set of object
+            The IDs in `ids` accessible in the current portal
+        """
+        if cls._portal_table is None:
+            # assume not portal limited object
+            return set(ids)
+
+        with qdb.sql_connection.TRN:
+            sql = """SELECT {1}_id
+                     FROM qiita.{0}
+                        JOIN qiita.portal_type USING (portal_type_id)
+                     WHERE {1}_id IN %s AND portal = %s
+                    """.format(cls._portal_table, cls._table)
+            qdb.sql_connection.TRN.add(
+                sql, [tuple(ids), qiita_config.portal])
+            return set(qdb.sql_connection.TRN.execute_fetchflatten())
+
+    @classmethod
+    def _validated(cls):
+        """The ids of this class validated in the current transaction
+
+        Returns
+        -------
+        set of (object, str)
+            The validated ids with the portal they were validated in
+        """
+        return qdb.sql_connection.TRN.cache.setdefault(
+            ('validated', cls), set())
+
+    @classmethod
+    def _forget_validated(cls, id_=None):
+        """Removes `id_` from the validated ids of the current transaction
+
+        Parameters
+        ----------
+        id_ : object, optional
+            The id to forget. If not provided, all the ids of this class
+            are forgotten (e.g. when the portal of the objects changes)
+        """
+        with qdb.sql_connection.TRN:
+            validated = cls._validated()
+            if id_ is None:
+                validated.clear()
+            else:
+                validated.difference_update(
+                    [(v_id, p) for v_id, p in validated if v_id == id_])
+
+    @staticmethod
+    def _normalize_id(id_, cls_name):
+        """Checks the type of `id_` and casts numerical ids to int
+
+        Most IDs in the database are numerical, but some (e.g., IDs used for
+        the User object) are strings. Moreover, some integer IDs are passed
+        as strings (e.g., '5'). Therefore, explicit type-checking is needed
+        here to accommodate these possibilities.
+        """
+        if not isinstance(id_, (int, long, str, unicode)):
+            raise TypeError("id_ must be a numerical or text type (not %s) "
+                            "when instantiating "
+                            "%s" % (id_.__class__.__name__, cls_name))
+
+        if isinstance(id_, (str, unicode)):
+            if id_.isdigit():
+                id_ = int(id_)
+        elif isinstance(id_, long):
+            id_ = int(id_)
+        return id_
+
+    @classmethod
+    def instantiate_many(cls, ids):
+        r"""Instantiates the objects with the given ids
+
+        All the ids are validated at once, using two queries regardless of
+        the number of ids, instead of two queries per object.
+
+        Parameters
+        ----------
+        ids : iterable of int, long, str, or unicode
+            The object identifiers
+
+        Returns
+        -------
+        list of QiitaObject
+            The objects, in the same order as `ids`
+
+        Raises
+        ------
+        QiitaDBUnknownIDError
+            If any of the `ids` does not correspond to any object
+        QiitaDBError
+            If any of the objects is not accessible in the current portal
+        """
+        ids = [cls._normalize_id(id_, cls.__name__) for id_ in ids]
+
+        with qdb.sql_connection.TRN:
+            cls._check_subclass()
+            validated = cls._validated()
+            portal = qiita_config.portal
+            to_check = {id_ for id_ in ids if (id_, portal) not in validated}
+
+            if to_check:
+                missing = to_check - cls._check_ids(to_check)
+                if missing:
+                    raise qdb.exceptions.QiitaDBUnknownIDError(
+                        ', '.join(map(str, sorted(missing))), cls._table)
+
+                inaccessible = to_check - cls._check_portals(to_check)
+                if inaccessible:
+                    raise qdb.exceptions.QiitaDBError(
+                        "%s with ids %s inaccessible in current portal: %s"
+                        % (cls.__name__,
+                           ', '.join(map(str, sorted(inaccessible))), portal))
+
+                validated.update((id_, portal) for id_ in to_check)
+
+            return [cls(id_) for id_ in ids]
+
     def _check_portal(self, id_):
         """Checks that object is accessible in current portal
 
@@ -172,31 +336,22 @@ class QiitaObject(object):
         QiitaDBUnknownIDError
             If `id_` does not correspond to any object
         """
-        # Most IDs in the database are numerical, but some (e.g., IDs used for
-        # the User object) are strings. Moreover, some integer IDs are passed
-        # as strings (e.g., '5'). Therefore, explicit type-checking is needed
-        # here to accommodate these possibilities.
-        if not isinstance(id_, (int, long, str, unicode)):
-            raise TypeError("id_ must be a numerical or text type (not %s) "
-                            "when instantiating "
-                            "%s" % (id_.__class__.__name__,
-                                    self.__class__.__name__))
-
-        if isinstance(id_, (str, unicode)):
-            if id_.isdigit():
-                id_ = int(id_)
-        elif isinstance(id_, long):
-            id_ = int(id_)
+        id_ = self._normalize_id(id_, self.__class__.__name__)
 
         with qdb.sql_connection.TRN:
             self._check_subclass()
-            if not self._check_id(id_):
-                raise qdb.exceptions.QiitaDBUnknownIDError(id_, self._table)
-
-            if not self._check_portal(id_):
-                raise qdb.exceptions.QiitaDBError(
-                    "%s with id %d inaccessible in current portal: %s"
-                    % (self.__class__.__name__, id_, qiita_config.portal))
+            validated = self._validated()
+            key = (id_, qiita_config.portal)
+            if key not in validated:
+                if not self._check_id(id_):
+                    raise qdb.exceptions.QiitaDBUnknownIDError(
+                        id_, self._table)
+
+                if not self._check_portal(id_):
+                    raise qdb.exceptions.QiitaDBError(
+                        "%s with id %d inaccessible in current portal: %s"
+                        % (self.__class__.__name__, id_, qiita_config.portal))
+                validated.add(key)
 
         self._id = id_
 
@@ -274,6 +429,8 @@ class QiitaStatusObject(QiitaObject):
                      WHERE {0}_id = %s""".format(self._table)
             qdb.sql_connection.TRN.add(sql, [status, self._id])
             qdb.sql_connection.TRN.execute()
+            # The status controls who can access the files of an analysis
+            qdb.util.invalidate_filepath_access()
 
     def check_status(self, status, exclude=False):
         r"""Checks status of object.
@@ -321,6 +321,12 @@ def drop_and_rebuild_tst_database():
             qdb.sql_connection.TRN.add(f.read())
 
         qdb.sql_connection.TRN.execute()
+        # All the tables have been recreated
+        qdb.util.invalidate_schema_cache()
+        # and the values cached in redis don't reflect them anymore
+        qdb.util.invalidate_template_summary()
+        qdb.util.invalidate_filepath_access()
+        qdb.util.invalidate_search_cache()
 
 
 def reset_test_database(wrapped_fn):
@@ -368,6 +374,8 @@ def patch(patches_dir=PATCHES_DIR, verbose=False):
     patches found in the patches directory.
     """
     with qdb.sql_connection.TRN:
+        # The patches can modify any table
+        qdb.util.invalidate_schema_cache()
         qdb.sql_connection.TRN.add("SELECT current_patch FROM settings")
         current_patch = qdb.sql_connection.TRN.execute_fetchlast()
         current_sql_patch_fp = join(patches_dir, current_patch)
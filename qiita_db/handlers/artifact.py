@@ -122,12 +122,13 @@ class ArtifactMappingHandler(OauthBaseHandler):
             # of generating such artifact. This operation will be
             # eventually supported, but in interest of time we are not
             # going to implement that here.
-            prep_templates = artifact.prep_templates
-            if len(prep_templates) > 1:
+            qiime_maps = qdb.util.get_qiime_mapping_files(
+                [artifact.id])[artifact.id]
+            if len(qiime_maps) > 1:
                 raise NotImplementedError(
                     "Artifact %d has more than one prep template")
 
-            fp = prep_templates[0].qiime_map_fp
+            _, _, fp, _ = qiime_maps[0]
 
             response = {'mapping': fp}
 
@@ -210,6 +210,7 @@ class Job(qdb.base.QiitaStatusObject):
             qdb.sql_connection.TRN.add(sql, args)
 
             qdb.sql_connection.TRN.execute()
+            cls._forget_validated(jobid)
 
             # remove files/folders attached to job
             _, basedir = qdb.util.get_mountpoint("job")[0]
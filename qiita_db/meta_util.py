@@ -14,6 +14,8 @@ Methods
     :toctree: generated/
 
     get_accessible_filepath_ids
+    check_filepath_access
+    get_artifact_summary_info
     get_lat_longs
 """
 # -----------------------------------------------------------------------------
@@ -26,6 +28,9 @@ Methods
 from __future__ import division
 
 from itertools import chain
+from os.path import join
+
+from moi import r_client
 
 from qiita_core.qiita_settings import qiita_config
 import qiita_db as qdb
@@ -80,48 +85,243 @@ def get_accessible_filepath_ids(user):
                 "SELECT filepath_id FROM qiita.filepath")
             return set(qdb.sql_connection.TRN.execute_fetchflatten())
 
-        # First, the studies
-        # There are private and shared studies
-        studies = user.user_studies | user.shared_studies
-
-        filepath_ids = set()
-        for study in studies:
-            # Add the sample template files
-            if study.sample_template:
-                filepath_ids.update(
-                    {fid for fid, _ in study.sample_template.get_filepaths()})
-
-            # Add the prep template filepaths
-            for pt in study.prep_templates():
-                filepath_ids.update({fid for fid, _ in pt.get_filepaths()})
-
-            # Add the artifact filepaths
-            for artifact in study.artifacts():
-                filepath_ids.update({fid for fid, _, _ in artifact.filepaths})
-
-        # Next, the public artifacts
-        for artifact in qdb.artifact.Artifact.iter_public():
-            # Add the filepaths of the artifact
-            filepath_ids.update({fid for fid, _, _ in artifact.filepaths})
+        # The files of the studies owned by or shared with the user (sample
+        # template, prep templates and artifacts), the files of the public
+        # artifacts along with their prep and sample templates, and the files
+        # of the public, private and shared analyses. The prep templates are
+        # attached to the root artifacts, so the ancestors of the public
+        # artifacts are needed to find them
+        study_sql, study_args = qdb.util.study_access_sql(
+            user, ['owned', 'shared'])
+        sql = """WITH RECURSIVE user_study AS ({0}),
+                public_artifact AS (
+                    SELECT artifact_id
+                    FROM qiita.artifact
+                        JOIN qiita.visibility USING (visibility_id)
+                    WHERE visibility = 'public'),
+                public_ancestor(artifact_id) AS (
+                    SELECT artifact_id FROM public_artifact
+                    UNION
+                    SELECT parent_id
+                    FROM qiita.parent_artifact
+                        JOIN public_ancestor USING (artifact_id)),
+                user_analysis AS (
+                    SELECT analysis_id
+                    FROM qiita.analysis
+                        JOIN qiita.analysis_status USING (analysis_status_id)
+                        JOIN qiita.analysis_portal USING (analysis_id)
+                        JOIN qiita.portal_type USING (portal_type_id)
+                    WHERE portal = %s AND (
+                        status = 'public'
+                        OR (email = %s AND dflt = false)
+                        OR analysis_id IN (SELECT analysis_id
+                                           FROM qiita.analysis_users
+                                           WHERE email = %s)))
+            SELECT filepath_id
+            FROM qiita.sample_template_filepath
+            WHERE study_id IN (SELECT study_id FROM user_study)
+                OR study_id IN (SELECT study_id
+                                FROM qiita.study_artifact
+                                    JOIN public_artifact USING (artifact_id))
+            UNION
+            SELECT filepath_id
+            FROM qiita.prep_template_filepath
+            WHERE prep_template_id IN (
+                    SELECT prep_template_id
+                    FROM qiita.study_prep_template
+                        JOIN user_study USING (study_id))
+                OR prep_template_id IN (
+                    SELECT prep_template_id
+                    FROM qiita.prep_template
+                        JOIN public_ancestor USING (artifact_id))
+            UNION
+            SELECT filepath_id
+            FROM qiita.artifact_filepath
+            WHERE artifact_id IN (SELECT artifact_id
+                                  FROM qiita.study_artifact
+                                    JOIN user_study USING (study_id))
+                OR artifact_id IN (SELECT artifact_id FROM public_artifact)
+            UNION
+            SELECT filepath_id
+            FROM qiita.analysis_filepath
+                JOIN user_analysis USING (analysis_id)
+            UNION
+            SELECT filepath_id
+            FROM qiita.analysis_job
+                JOIN user_analysis USING (analysis_id)
+                JOIN qiita.job_results_filepath USING (job_id)""".format(
+            study_sql)
+        qdb.sql_connection.TRN.add(
+            sql, study_args + [qiita_config.portal, user.id, user.id])
+        return set(qdb.sql_connection.TRN.execute_fetchflatten())
+
+
+def check_filepath_access(user, filepath_id):
+    """Checks if a user has access to a filepath
+
+    The filepaths accessible by the user are cached in redis, so the check
+    only queries the database when the filepath is not in the cached set.
 
-            # Then add the filepaths of the prep templates
-            for pt in artifact.prep_templates:
-                filepath_ids.update({fid for fid, _ in pt.get_filepaths()})
+    Parameters
+    ----------
+    user : User object
+        The user we are interested in
+    filepath_id : int
+        The filepath to check
 
-            # Then add the filepaths of the sample template
-            filepath_ids.update(
-                {fid
-                 for fid, _ in artifact.study.sample_template.get_filepaths()})
+    Returns
+    -------
+    bool
+        Whether the user has access to the filepath
 
-        # Next, analyses
-        # Same as before, there are public, private, and shared
-        analyses = qdb.analysis.Analysis.get_by_status('public') | \
-            user.private_analyses | user.shared_analyses
+    See Also
+    --------
+    get_accessible_filepath_ids
+    qiita_db.util.invalidate_filepath_access
+    """
+    # The key is retrieved before querying the database, so if the access
+    # changes while the set is rebuilt, the set is stored under an outdated
+    # version and never read
+    key = qdb.util.filepath_access_key(user.id)
+    if r_client.sismember(key, filepath_id):
+        return True
+
+    # The set might be missing or outdated (e.g. the file has just been
+    # created), so it is rebuilt
+    filepath_ids = get_accessible_filepath_ids(user)
+    pipe = r_client.pipeline()
+    pipe.delete(key)
+    if filepath_ids:
+        pipe.sadd(key, *filepath_ids)
+        pipe.expire(key, qdb.util.FILEPATH_ACCESS_TTL)
+    pipe.execute()
+    return filepath_id in filepath_ids
+
+
+def get_artifact_summary_info(artifact_id):
+    """Retrieves the information shown in the artifact summary page
+
+    All the information is retrieved in a single query, without building the
+    artifact, job, command or study objects.
 
-        for analysis in analyses:
-            filepath_ids.update(analysis.all_associated_filepath_ids)
+    Parameters
+    ----------
+    artifact_id : int
+        The artifact id
 
-        return filepath_ids
+    Returns
+    -------
+    dict
+        {'name': str,
+         'artifact_type': str,
+         'visibility': str,
+         'can_be_submitted_to_ebi': bool,
+         'is_submitted_to_ebi': bool,
+         'can_be_submitted_to_vamps': bool,
+         'is_submitted_to_vamps': bool,
+         'study_id': int,
+         'prep_template_ids': list of int,
+         'html_generator_id': int or None,
+         'filepaths': list of (int, str, str),
+         'jobs': list of dict}
+        `filepaths` holds the (filepath id, filepath, filepath type) of the
+        artifact files, and `jobs` holds the jobs that used the artifact as
+        input as {'id': str, 'command_id': int, 'command': str,
+        'software_type': str, 'status': str, 'step': str, 'log': str}, where
+        'log' is only set for the jobs in 'error' status
+
+    Raises
+    ------
+    QiitaDBUnknownIDError
+        If the artifact does not exist
+    """
+    with qdb.sql_connection.TRN:
+        sql = """SELECT a.name, artifact_type, visibility,
+                        can_be_submitted_to_ebi,
+                        EXISTS(SELECT *
+                               FROM qiita.ebi_run_accession e
+                               WHERE e.artifact_id = a.artifact_id),
+                        can_be_submitted_to_vamps, submitted_to_vamps,
+                        sa.study_id,
+                        (SELECT array_agg(prep_template_id
+                                          ORDER BY prep_template_id)
+                         FROM qiita.prep_template
+                         WHERE artifact_id IN (
+                            SELECT *
+                            FROM qiita.find_artifact_roots(a.artifact_id))),
+                        (SELECT command_id
+                         FROM qiita.software_command
+                            JOIN qiita.software_artifact_type
+                                USING (software_id)
+                         WHERE artifact_type_id = a.artifact_type_id
+                            AND name = 'Generate HTML summary'
+                         ORDER BY command_id DESC
+                         LIMIT 1),
+                        (SELECT json_agg(f)
+                         FROM (SELECT filepath_id, filepath, filepath_type,
+                                      mountpoint, subdirectory
+                               FROM qiita.artifact_filepath af
+                                JOIN qiita.filepath USING (filepath_id)
+                                JOIN qiita.filepath_type
+                                    USING (filepath_type_id)
+                                JOIN qiita.data_directory
+                                    USING (data_directory_id)
+                               WHERE af.artifact_id = a.artifact_id
+                               ORDER BY filepath_id) AS f),
+                        (SELECT json_agg(j)
+                         FROM (SELECT processing_job_id AS id, command_id,
+                                      sc.name AS command, software_type,
+                                      processing_job_status AS status, step,
+                                      CASE WHEN processing_job_status = 'error'
+                                        THEN l.msg END AS log
+                               FROM qiita.artifact_processing_job apj
+                                JOIN qiita.processing_job pj
+                                    USING (processing_job_id)
+                                JOIN qiita.processing_job_status
+                                    USING (processing_job_status_id)
+                                JOIN qiita.software_command sc
+                                    USING (command_id)
+                                JOIN qiita.software USING (software_id)
+                                JOIN qiita.software_type
+                                    USING (software_type_id)
+                                LEFT JOIN qiita.logging l
+                                    ON pj.logging_id = l.logging_id
+                               WHERE apj.artifact_id = a.artifact_id
+                               ORDER BY processing_job_id) AS j)
+                 FROM qiita.artifact a
+                    JOIN qiita.artifact_type USING (artifact_type_id)
+                    JOIN qiita.visibility USING (visibility_id)
+                    JOIN qiita.study_artifact sa USING (artifact_id)
+                 WHERE artifact_id = %s"""
+        qdb.sql_connection.TRN.add(sql, [artifact_id])
+        res = qdb.sql_connection.TRN.execute_fetchindex()
+        if not res:
+            raise qdb.exceptions.QiitaDBUnknownIDError(artifact_id, 'artifact')
+        (name, artifact_type, visibility, can_ebi, is_ebi, can_vamps,
+         is_vamps, study_id, pt_ids, html_generator_id, filepaths,
+         jobs) = res[0]
+
+        db_dir = qdb.util.get_db_files_base_dir()
+        filepaths = [
+            (f['filepath_id'],
+             join(db_dir, f['mountpoint'], str(artifact_id), f['filepath'])
+             if f['subdirectory'] else
+             join(db_dir, f['mountpoint'], f['filepath']),
+             f['filepath_type'])
+            for f in filepaths or []]
+
+        return {'name': name,
+                'artifact_type': artifact_type,
+                'visibility': visibility,
+                'can_be_submitted_to_ebi': can_ebi,
+                'is_submitted_to_ebi': is_ebi,
+                'can_be_submitted_to_vamps': can_vamps,
+                'is_submitted_to_vamps': is_vamps,
+                'study_id': study_id,
+                'prep_template_ids': pt_ids or [],
+                'html_generator_id': html_generator_id,
+                'filepaths': filepaths,
+                'jobs': jobs or []}
 
 
 def get_lat_longs():
@@ -136,6 +336,19 @@ def get_lat_longs():
         s.id for s in qdb.portal.Portal(qiita_config.portal).get_studies()]
 
     with qdb.sql_connection.TRN:
+        if qiita_config.search_metadata_index:
+            sql = """SELECT lat.value_num, lon.value_num
+                     FROM qiita.sample_metadata_index lat
+                        JOIN qiita.sample_metadata_index lon
+                            USING (sample_id)
+                     WHERE lat.column_name = 'latitude'
+                        AND lon.column_name = 'longitude'
+                        AND lat.value_num IS NOT NULL
+                        AND lon.value_num IS NOT NULL
+                        AND lat.study_id IN %s"""
+            qdb.sql_connection.TRN.add(sql, [tuple(portal_table_ids)])
+            return qdb.sql_connection.TRN.execute_fetchindex()
+
         sql = """SELECT DISTINCT table_name
                  FROM information_schema.columns
                  WHERE table_name SIMILAR TO 'sample_[0-9]+'
@@ -36,20 +36,114 @@ Methods
 # -----------------------------------------------------------------------------
 
 from __future__ import division
-from future.utils import viewitems, viewvalues
+from future.utils import viewitems
 from future.builtins import zip
 from itertools import chain
 from copy import deepcopy
+from json import loads, dumps
 
 import pandas as pd
 import numpy as np
 from skbio.util import find_duplicates
+from natsort import natsorted
+from moi import r_client
 import warnings
 
 from qiita_core.exceptions import IncompetentQiitaDeveloperError
 import qiita_db as qdb
 
 
+# String columns with at most this ratio of distinct values per sample are
+# returned as categoricals by MetadataTemplate.to_dataframe
+CATEGORICAL_RATIO = 0.5
+
+
+# Maximum number of samples updated by a single UPDATE statement in
+# MetadataTemplate.update
+UPDATE_PAGE_SIZE = 5000
+
+
+def _as_objects(array):
+    """Converts a typed numpy array to an array of python objects"""
+    if array.dtype.kind == 'M':
+        # datetime64[ns] is converted to integers, but using microseconds
+        # (the precision of postgres) converts them to datetime objects
+        array = array.astype('datetime64[us]')
+    return array.astype(object)
+
+
+def _columns_from_chunks(chunks, dtypes):
+    """Stacks the rows in `chunks` into a numpy array per column
+
+    Parameters
+    ----------
+    chunks : iterable of list of tuple
+        The rows to stack, in chunks
+    dtypes : list of numpy dtype or None
+        The dtype of each column. None means that the column values are
+        stored as python objects
+
+    Returns
+    -------
+    list of numpy array
+        The values of each column
+
+    Notes
+    -----
+    Each chunk is converted to the column dtype as soon as it is received,
+    so only a chunk of rows is held as python objects at any time. If a
+    column contains a missing value (or a value that cannot be converted to
+    its dtype) the whole column falls back to python objects.
+    """
+    dtypes = list(dtypes)
+    parts = [[] for _ in dtypes]
+    for chunk in chunks:
+        for i, values in enumerate(zip(*chunk)):
+            array = None
+            if dtypes[i] is not None and None not in values:
+                try:
+                    array = np.array(values, dtype=dtypes[i])
+                except (TypeError, ValueError):
+                    pass
+            if array is None:
+                if dtypes[i] is not None:
+                    dtypes[i] = None
+                    parts[i] = [_as_objects(p) for p in parts[i]]
+                array = np.empty(len(values), dtype=object)
+                array[:] = values
+            parts[i].append(array)
+
+    return [np.concatenate(p) if p else np.empty(0, dtype=d or object)
+            for p, d in zip(parts, dtypes)]
+
+
+def _changed_cells(current, new):
+    """Identifies the cells that differ between two aligned columns
+
+    Parameters
+    ----------
+    current : pandas Series
+        The values stored in the DB
+    new : pandas Series
+        The new values, with the same index than `current`
+
+    Returns
+    -------
+    numpy array of bool
+        True for the cells in which the value changes. Cells missing in both
+        `current` and `new` (None or NaN) are considered equal
+    """
+    current_null = pd.isnull(current).values
+    new_null = pd.isnull(new).values
+    changed = current_null != new_null
+    present = ~(current_null | new_null)
+    if present.any():
+        changed[present] = np.asarray(
+            _as_objects(current.values[present]) !=
+            _as_objects(new.values[present]), dtype=bool)
+    return changed
+
+
 class BaseSample(qdb.base.QiitaObject):
     r"""Sample object that accesses the db to get the information of a sample
     belonging to a PrepTemplate or a SampleTemplate.
@@ -76,6 +170,14 @@ class BaseSample(qdb.base.QiitaObject):
     items
     get
 
+    Notes
+    -----
+    The samples returned by `MetadataTemplate.items` and
+    `MetadataTemplate.values` are backed by the metadata values retrieved
+    when iterating over the template, so reading them does not query the
+    database. Setting a value on one of these samples writes it to the
+    database and drops the in-memory values.
+
     See Also
     --------
     QiitaObject
@@ -86,6 +188,8 @@ class BaseSample(qdb.base.QiitaObject):
     _table_prefix = None
     _column_table = None
     _id_column = None
+    # The in-memory metadata values of the sample, if retrieved in bulk
+    _values = None
 
     def _check_template_class(self, md_template):
         r"""Checks that md_template is of the correct type
@@ -133,6 +237,36 @@ class BaseSample(qdb.base.QiitaObject):
         self._dynamic_table = "%s%d" % (self._table_prefix,
                                         self._md_template.id)
 
+    @classmethod
+    def _from_values(cls, sample_id, md_template, values):
+        r"""Creates a sample backed by already retrieved metadata values
+
+        Parameters
+        ----------
+        sample_id : str
+            The sample id
+        md_template : MetadataTemplate
+            The metadata template in which the sample is present
+        values : dict of {str: object}
+            The metadata values of the sample, keyed by category
+
+        Returns
+        -------
+        BaseSample
+            The sample, which will not query the database to read its values
+
+        Notes
+        -----
+        No check is performed, the caller is responsible of retrieving the
+        values of `sample_id` from `md_template`
+        """
+        sample = cls.__new__(cls)
+        sample._id = sample_id
+        sample._md_template = md_template
+        sample._dynamic_table = "%s%d" % (cls._table_prefix, md_template.id)
+        sample._values = values
+        return sample
+
     def __hash__(self):
         r"""Defines the hash function so samples are hashable"""
         return hash(self._id)
@@ -180,6 +314,8 @@ class BaseSample(qdb.base.QiitaObject):
         set of str
             The set of all available metadata categories
         """
+        if self._values is not None:
+            return set(self._values)
         # Get all the columns
         cols = qdb.util.get_table_cols(self._dynamic_table)
         # Remove the sample_id column as this column is used internally for
@@ -195,6 +331,9 @@ class BaseSample(qdb.base.QiitaObject):
         dict of {str: str}
             A dictionary of the form {category: value}
         """
+        if self._values is not None:
+            return dict(self._values)
+
         with qdb.sql_connection.TRN:
             sql = "SELECT * FROM qiita.{0} WHERE sample_id=%s".format(
                 self._dynamic_table)
@@ -247,6 +386,9 @@ class BaseSample(qdb.base.QiitaObject):
                     "Metadata category %s does not exists for sample %s"
                     " in template %d" % (key, self._id, self._md_template.id))
 
+            if self._values is not None:
+                return self._values[key]
+
             sql = """SELECT {0} FROM qiita.{1}
                      WHERE sample_id=%s""".format(key, self._dynamic_table)
             qdb.sql_connection.TRN.add(sql, [self._id])
@@ -279,6 +421,12 @@ class BaseSample(qdb.base.QiitaObject):
                      SET {1}=%s
                      WHERE sample_id=%s""".format(self._dynamic_table, column)
             qdb.sql_connection.TRN.add(sql, [value, self._id])
+            self._md_template._index_metadata(samples=[self._id],
+                                              columns=[column])
+            self._md_template._metadata_changed(samples=[self._id],
+                                                columns=[column])
+            # The in-memory values are not up to date anymore
+            self._values = None
 
     def __setitem__(self, column, value):
         r"""Sets the metadata value for the category `column`
@@ -472,6 +620,15 @@ class MetadataTemplate(qdb.base.QiitaObject):
             qdb.sql_connection.TRN.add(sql, [id_])
             return qdb.sql_connection.TRN.execute_fetchlast()
 
+    @classmethod
+    def _check_ids(cls, ids):
+        r"""Returns which of the MetadataTemplate ids exist on the database"""
+        with qdb.sql_connection.TRN:
+            sql = "SELECT DISTINCT {1} FROM qiita.{0} WHERE {1} IN %s".format(
+                cls._table, cls._id_column)
+            qdb.sql_connection.TRN.add(sql, [tuple(ids)])
+            return set(qdb.sql_connection.TRN.execute_fetchflatten())
+
     @classmethod
     def _table_name(cls, obj_id):
         r"""Returns the dynamic table name
@@ -594,10 +751,9 @@ class MetadataTemplate(qdb.base.QiitaObject):
             headers = sorted(md_template.keys().tolist())
 
             # Insert values on template_sample table
-            values = [[obj_id, s_id] for s_id in sample_ids]
-            sql = """INSERT INTO qiita.{0} ({1}, sample_id)
-                     VALUES (%s, %s)""".format(cls._table, cls._id_column)
-            qdb.sql_connection.TRN.add(sql, values, many=True)
+            qdb.sql_connection.TRN.copy_from(
+                "qiita.%s" % cls._table, [cls._id_column, 'sample_id'],
+                ([obj_id, s_id] for s_id in sample_ids))
 
             # Insert rows on *_columns table
             datatypes = qdb.metadata_template.util.get_datatypes(
@@ -623,17 +779,17 @@ class MetadataTemplate(qdb.base.QiitaObject):
                             ON UPDATE CASCADE
                      )""".format(table_name, ', '.join(column_datatype))
             qdb.sql_connection.TRN.add(sql)
+            qdb.util.invalidate_schema_cache(table_name)
 
-            # Insert values on custom table
+            # Insert values on custom table. The values are streamed to the
+            # database using COPY, which is much faster than inserting them
+            # row by row on large templates
             values = qdb.metadata_template.util.as_python_types(md_template,
                                                                 headers)
             values.insert(0, sample_ids)
-            values = [list(v) for v in zip(*values)]
-            sql = """INSERT INTO qiita.{0} (sample_id, {1})
-                     VALUES (%s, {2})""".format(
-                table_name, ", ".join(headers),
-                ', '.join(["%s"] * len(headers)))
-            qdb.sql_connection.TRN.add(sql, values, many=True)
+            qdb.sql_connection.TRN.copy_from(
+                "qiita.%s" % table_name, ['sample_id'] + headers,
+                zip(*values))
 
             # Execute all the steps
             qdb.sql_connection.TRN.execute()
@@ -681,6 +837,103 @@ class MetadataTemplate(qdb.base.QiitaObject):
             "The method 'can_be_updated' should be implemented in "
             "the subclasses")
 
+    def _index_metadata(self, samples=None, columns=None):
+        r"""Adds to the transaction the queries that refresh the search index
+
+        The query is only added to the transaction, so the caller should
+        execute it along with the changes to the metadata.
+
+        Parameters
+        ----------
+        samples : iterable of str, optional
+            The samples to refresh. Default: all the template samples
+        columns : iterable of str, optional
+            The columns to refresh. Default: all the template columns
+
+        Notes
+        -----
+        Only the sample templates are indexed, so this method does nothing
+        unless it is overridden by the subclasses
+        """
+        pass
+
+    def _metadata_changed(self, samples=None, columns=None):
+        r"""Drops the cached data that depends on the changed metadata
+
+        The cached summary of the changed columns and the cached searches of
+        the study are dropped once the transaction commits.
+
+        Parameters
+        ----------
+        samples : iterable of str, optional
+            The changed samples. Default: all the template samples
+        columns : iterable of str, optional
+            The changed columns. Default: all the template columns
+        """
+        qdb.util.invalidate_template_summary(
+            self._table_name(self._id), columns)
+        qdb.util.invalidate_search_cache(self.study_id)
+
+    def summary(self, columns=None):
+        r"""Returns the number of times each value is seen in the columns
+
+        Parameters
+        ----------
+        columns : iterable of str, optional
+            The columns to summarize. Default: all the template columns
+
+        Returns
+        -------
+        dict of {str: list of (str, int)}
+            The observed values of each column, naturally sorted, and the
+            number of samples with that value. Missing values are not counted
+
+        Notes
+        -----
+        The summary of each column is cached in redis and only computed again
+        when the values of the column change
+        """
+        with qdb.sql_connection.TRN:
+            table_name = self._table_name(self._id)
+            columns = self.categories() if columns is None else list(columns)
+            if not columns:
+                return {}
+            # The version is read before the values, so the summary is not
+            # cached if the values change while it is computed
+            version = qdb.util.template_summary_version(table_name)
+            key = qdb.util.template_summary_key(table_name)
+
+            summary = {}
+            missing = []
+            for column, cached in zip(columns, r_client.hmget(key, columns)):
+                if cached is None:
+                    missing.append(column)
+                else:
+                    summary[column] = [tuple(v) for v in loads(cached)]
+
+            if missing:
+                idx = qdb.sql_connection.TRN.index
+                for column in missing:
+                    sql = """SELECT {0}, count(*)
+                             FROM qiita.{1}
+                             WHERE {0} IS NOT NULL
+                             GROUP BY {0}""".format(column, table_name)
+                    qdb.sql_connection.TRN.add(sql)
+                results = qdb.sql_connection.TRN.execute()[idx:]
+                to_cache = {}
+                for column, counts in zip(missing, results):
+                    counts = dict(counts)
+                    summary[column] = [(str(value), counts[value])
+                                       for value in natsorted(counts)]
+                    to_cache[column] = dumps(summary[column])
+                # The summary is only cached if the values it was computed
+                # from are committed
+                qdb.sql_connection.TRN.add_post_commit_func(
+                    qdb.util.cache_template_summary, table_name, version,
+                    to_cache)
+
+            return summary
+
     def _common_extend_steps(self, md_template):
         r"""executes the common extend steps
 
@@ -730,6 +983,7 @@ class MetadataTemplate(qdb.base.QiitaObject):
                         sql_cols, [self._id, category, dtype])
                     qdb.sql_connection.TRN.add(
                         sql_alter.format(table_name, category, dtype))
+                qdb.util.invalidate_schema_cache(table_name)
 
                 if existing_samples:
                     # The values for the new columns are the only ones that get
@@ -764,22 +1018,28 @@ class MetadataTemplate(qdb.base.QiitaObject):
                 md_template = md_template.loc[new_samples]
 
                 # Insert values on required columns
-                values = [[self._id, s_id] for s_id in new_samples]
-                sql = """INSERT INTO qiita.{0} ({1}, sample_id)
-                         VALUES (%s, %s)""".format(self._table,
-                                                   self._id_column)
-                qdb.sql_connection.TRN.add(sql, values, many=True)
+                qdb.sql_connection.TRN.copy_from(
+                    "qiita.%s" % self._table, [self._id_column, 'sample_id'],
+                    ([self._id, s_id] for s_id in new_samples))
 
                 # Insert values on custom table
                 values = qdb.metadata_template.util.as_python_types(
                     md_template, headers)
                 values.insert(0, new_samples)
-                values = [list(v) for v in zip(*values)]
-                sql = """INSERT INTO qiita.{0} (sample_id, {1})
-                         VALUES (%s, {2})""".format(
-                    table_name, ", ".join(headers),
-                    ', '.join(["%s"] * len(headers)))
-                qdb.sql_connection.TRN.add(sql, values, many=True)
+                qdb.sql_connection.TRN.copy_from(
+                    "qiita.%s" % table_name, ['sample_id'] + headers,
+                    zip(*values))
+
+            if new_cols:
+                self._index_metadata(columns=new_cols)
+            if new_samples:
+                self._index_metadata(samples=new_samples)
+            if new_cols or new_samples:
+                # The new samples change the summary of all the columns,
+                # while the new columns are set for all the samples
+                self._metadata_changed(
+                    samples=new_samples if new_samples else None,
+                    columns=None if new_samples else new_cols)
 
             # Execute all the steps
             qdb.sql_connection.TRN.execute()
@@ -904,7 +1164,13 @@ class MetadataTemplate(qdb.base.QiitaObject):
             True if the sample id `key` is in the metadata template, false
             otherwise
         """
-        return key in self._get_sample_ids()
+        with qdb.sql_connection.TRN:
+            sql = """SELECT EXISTS(
+                        SELECT * FROM qiita.{0}
+                        WHERE {1}=%s AND sample_id=%s)""".format(
+                self._table, self._id_column)
+            qdb.sql_connection.TRN.add(sql, [self._id, key])
+            return qdb.sql_connection.TRN.execute_fetchlast()
 
     def keys(self):
         r"""Iterator over the sorted sample ids
@@ -920,29 +1186,85 @@ class MetadataTemplate(qdb.base.QiitaObject):
         """
         return self.__iter__()
 
-    def values(self):
+    def _iter_rows(self, page_size=None):
+        r"""Iterator over the metadata values of the samples, in sample order
+
+        Parameters
+        ----------
+        page_size : int, optional
+            The number of samples retrieved from the database at once. By
+            default, all the samples are retrieved in a single query
+
+        Returns
+        -------
+        Iterator
+            Iterator over (sample_id, {category: value}) tuples
+        """
+        # The samples are compared byte by byte (collation "C"), which is the
+        # order in which python sorts them, so the last sample of a page is
+        # also the last one in the database order regardless of the locale
+        sql = """SELECT * FROM qiita.{0}
+                 WHERE sample_id COLLATE "C" > %s""".format(
+            self._table_name(self._id))
+        if page_size is not None:
+            sql += """ ORDER BY sample_id COLLATE "C" LIMIT {0}""".format(
+                int(page_size))
+        last = ''
+        while True:
+            with qdb.sql_connection.TRN:
+                qdb.sql_connection.TRN.add(sql, [last])
+                rows = self._transform_to_dict(
+                    qdb.sql_connection.TRN.execute_fetchindex())
+            for sample_id in sorted(rows):
+                yield sample_id, rows[sample_id]
+            if page_size is None or len(rows) < page_size:
+                break
+            last = sample_id
+
+    def values(self, page_size=None):
         r"""Iterator over the metadata values
 
+        Parameters
+        ----------
+        page_size : int, optional
+            The number of samples retrieved from the database at once. By
+            default, all the samples are retrieved in a single query
+
         Returns
         -------
         Iterator
             Iterator over Sample obj
+
+        Notes
+        -----
+        The samples are backed by the metadata values retrieved while
+        iterating, so reading their values does not query the database
         """
-        with qdb.sql_connection.TRN:
-            return iter(self._sample_cls(sample_id, self)
-                        for sample_id in self._get_sample_ids())
+        return (self._sample_cls._from_values(sample_id, self, values)
+                for sample_id, values in self._iter_rows(page_size))
 
-    def items(self):
+    def items(self, page_size=None):
         r"""Iterator over (sample_id, values) tuples, in sample id order
 
+        Parameters
+        ----------
+        page_size : int, optional
+            The number of samples retrieved from the database at once. By
+            default, all the samples are retrieved in a single query
+
         Returns
         -------
         Iterator
             Iterator over (sample_ids, values) tuples
+
+        Notes
+        -----
+        The samples are backed by the metadata values retrieved while
+        iterating, so reading their values does not query the database
         """
-        with qdb.sql_connection.TRN:
-            return iter((sample_id, self._sample_cls(sample_id, self))
-                        for sample_id in self._get_sample_ids())
+        return ((sample_id,
+                 self._sample_cls._from_values(sample_id, self, values))
+                for sample_id, values in self._iter_rows(page_size))
 
     def get(self, key):
         r"""Returns the metadata values for sample id `key`, or None if the
@@ -1018,9 +1340,7 @@ class MetadataTemplate(qdb.base.QiitaObject):
             file
         """
         with qdb.sql_connection.TRN:
-            df = self.to_dataframe()
-            if samples is not None:
-                df = df.loc[samples]
+            df = self.to_dataframe(samples=samples)
 
             # Sorting the dataframe so multiple serializations of the metadata
             # template are consistent.
@@ -1031,25 +1351,85 @@ class MetadataTemplate(qdb.base.QiitaObject):
             df.to_csv(fp, index_label='sample_name', na_rep="", sep='\t',
                       encoding='utf-8')
 
-    def to_dataframe(self):
+    def to_dataframe(self, columns=None, samples=None, categorical=False):
         """Returns the metadata template as a dataframe
 
+        Parameters
+        ----------
+        columns : iterable of str, optional
+            The columns to retrieve. Defaults to all the template columns
+        samples : iterable of str, optional
+            The samples to retrieve. Defaults to all the template samples
+        categorical : bool, optional
+            If True, the string columns in which the values are repeated
+            across samples are returned as pandas categoricals. Default: False
+
         Returns
         -------
         pandas DataFrame
             The metadata in the template,indexed on sample id
+
+        Raises
+        ------
+        QiitaDBColumnError
+            If any of `columns` is not present in the template
+
+        Notes
+        -----
+        Only the requested columns and samples are retrieved from the DB, and
+        the rows are read in chunks through a server-side cursor and stored
+        column by column. The integer, float, boolean and timestamp columns
+        without missing values get the dtype that matches the column type
+        stored in the DB; the rest of the columns hold python objects.
         """
         with qdb.sql_connection.TRN:
-            cols = sorted(qdb.util.get_table_cols(self._table_name(self._id)))
-            # Get all metadata for the template
-            sql = "SELECT {0} FROM qiita.{1}".format(", ".join(cols),
-                                                     self._table_name(self.id))
+            table_name = self._table_name(self._id)
+            table_cols = set(qdb.util.get_table_cols(table_name))
+            table_cols.discard('sample_id')
+            if columns is None:
+                cols = sorted(table_cols)
+            else:
+                cols = sorted(set(columns) - {'sample_id'})
+                missing = set(cols).difference(table_cols)
+                if missing:
+                    raise qdb.exceptions.QiitaDBColumnError(
+                        "The template doesn't have the columns: %s"
+                        % ', '.join(sorted(missing)))
+
+            sql = """SELECT column_name, column_type
+                     FROM qiita.{0}
+                     WHERE {1} = %s""".format(self._column_table,
+                                              self._id_column)
             qdb.sql_connection.TRN.add(sql, [self._id])
-            meta = qdb.sql_connection.TRN.execute_fetchindex()
-
-            # Create the dataframe and clean it up a bit
-            df = pd.DataFrame((list(x) for x in meta), columns=cols)
-            df.set_index('sample_id', inplace=True, drop=True)
+            sql_types = dict(qdb.sql_connection.TRN.execute_fetchindex())
+            dtypes = [None] + [
+                qdb.metadata_template.util.dtype_lookup(sql_types.get(c))
+                for c in cols]
+
+            sql = "SELECT {0} FROM qiita.{1}".format(
+                ", ".join(['sample_id'] + cols), table_name)
+            sql_args = None
+            if samples is not None:
+                sql += " WHERE sample_id = ANY(%s::varchar[])"
+                sql_args = [list(samples)]
+            sql += " ORDER BY sample_id"
+
+            data = _columns_from_chunks(
+                qdb.sql_connection.TRN.execute_fetch_chunks(sql, sql_args),
+                dtypes)
+
+            index = pd.Index(data[0], name='sample_id')
+            df = pd.DataFrame(dict(zip(cols, data[1:])), index=index,
+                              columns=cols)
+
+            if categorical:
+                for col, dtype in zip(cols, dtypes[1:]):
+                    # Only the columns that do not map to a numpy dtype hold
+                    # strings. Categoricals save memory when each distinct
+                    # value is shared across several samples
+                    if dtype is None and \
+                            df[col].nunique() <= len(df) * CATEGORICAL_RATIO:
+                        df[col] = df[col].astype('category')
 
             return df
 
@@ -1129,12 +1509,16 @@ class MetadataTemplate(qdb.base.QiitaObject):
             passed md_template
         """
         with qdb.sql_connection.TRN:
+            current_columns = self.categories()
             # Clean and validate the metadata template given
             new_map = self._clean_validate_template(
                 md_template, self.study_id, self.columns_restrictions,
-                current_columns=self.categories())
-            # Retrieving current metadata
-            current_map = self.to_dataframe()
+                current_columns=current_columns)
+            # Retrieving the current metadata of the samples and columns
+            # present in the new template
+            current_map = self.to_dataframe(
+                columns=set(new_map.columns).intersection(current_columns),
+                samples=new_map.index)
 
             # simple validations of sample ids and column names
             samples_diff = set(new_map.index).difference(current_map.index)
@@ -1144,58 +1528,30 @@ class MetadataTemplate(qdb.base.QiitaObject):
                     'in database by these samples names: %s'
                     % ', '.join(samples_diff))
 
-            if not set(current_map.columns).issuperset(new_map.columns):
-                columns_diff = set(new_map.columns).difference(
-                    current_map.columns)
+            columns_diff = set(new_map.columns).difference(current_columns)
+            if columns_diff:
                 raise qdb.exceptions.QiitaDBError(
                     'Some of the columns in your template are not present in '
                     'the system. Use "extend" if you want to add more columns '
                     'to the template. Missing columns: %s'
                     % ', '.join(columns_diff))
 
-            # In order to speed up some computation, let's compare only the
-            # common columns and rows. current_map.columns and
-            # current_map.index are supersets of new_map.columns and
-            # new_map.index, respectivelly, so this will not fail
-            current_map = current_map[new_map.columns].loc[new_map.index]
-
-            # Get the values that we need to change
-            # diff_map is a DataFrame that hold boolean values. If a cell is
-            # True, means that the new_map is different from the current_map
-            # while False means that the cell has the same value
-            diff_map = current_map != new_map
-            # ne_stacked holds a MultiIndexed DataFrame in which the first
-            # level of indexing is the sample_name and the second one is the
-            # columns. We only have 1 column, which holds if that
-            # (sample, column) pair has been modified or not (i.e. cell)
-            ne_stacked = diff_map.stack()
-            # by using ne_stacked to index himself, we get only the columns
-            # that did change (see boolean indexing in pandas docs)
-            changed = ne_stacked[ne_stacked]
-            if changed.empty:
+            current_map = current_map.loc[new_map.index]
+
+            # Get the cells that we need to change, column by column. The
+            # cells that are missing both in the DB and in the new template
+            # are not considered changes
+            changed = [(col, _changed_cells(current_map[col], new_map[col]))
+                       for col in new_map.columns]
+            changed = [(col, mask) for col, mask in changed if mask.any()]
+            if not changed:
                 warnings.warn(
                     "There are no differences between the data stored in the "
                     "DB and the new data provided",
                     qdb.exceptions.QiitaDBWarning)
                 return
 
-            changed.index.names = ['sample_name', 'column']
-            # the combination of np.where and boolean indexing produces
-            # a numpy array with only the values that actually changed
-            # between the current_map and new_map
-            changed_to = new_map.values[np.where(diff_map)]
-
-            # to_update is a MultiIndexed DataFrame, in which the index 0 is
-            # the samples and the index 1 is the columns, we define these
-            # variables here so we don't put magic numbers across the code
-            sample_idx = 0
-            col_idx = 1
-            to_update = pd.DataFrame({'to': changed_to}, index=changed.index)
-
-            # Get the columns that we need to change
-            indices = list(set(to_update.index.labels[col_idx]))
-            cols_to_update = to_update.index.levels[col_idx][indices]
-
+            cols_to_update = [col for col, _ in changed]
             if not self.can_be_updated(columns=set(cols_to_update)):
                 raise qdb.exceptions.QiitaDBError(
                     'The new template is modifying fields that cannot be '
@@ -1203,35 +1559,25 @@ class MetadataTemplate(qdb.base.QiitaObject):
                     'deleting the processed data. You are trying to modify: %s'
                     % ', '.join(cols_to_update))
 
-            # Get the samples that we need to change
-            indices = list(set(to_update.index.labels[sample_idx]))
-            samples_to_update = to_update.index.levels[sample_idx][indices]
-
-            sql_eq_cols = ', '.join(
-                ["{0} = c.{0}".format(col) for col in cols_to_update])
-            # We add 1 because we need to add the sample name
-            single_value = "(%s)" % ', '.join(
-                ["%s"] * (len(cols_to_update) + 1))
-            sql_values = ', '.join([single_value] * len(samples_to_update))
-            sql_cols = ', '.join(cols_to_update)
-
-            sql = """UPDATE qiita.{0} AS t SET
-                        {1}
-                     FROM (VALUES {2})
-                        AS c(sample_id, {3})
-                     WHERE c.sample_id = t.sample_id
-                    """.format(self._table_name(self._id), sql_eq_cols,
-                               sql_values, sql_cols)
-            sql_args = []
-            for sample in samples_to_update:
-                sample_vals = [
-                    qdb.metadata_template.util.cast_to_python(
-                        new_map[col][sample])
-                    for col in cols_to_update]
-                sample_vals.insert(0, sample)
-                sql_args.extend(sample_vals)
-
-            qdb.sql_connection.TRN.add(sql, sql_args)
+            # Only the changed cells are written, using a single UPDATE per
+            # column (and page of samples)
+            sql = """UPDATE qiita.{0} AS t SET {1} = c.value
+                     FROM (VALUES {2}) AS c(sample_id, value)
+                     WHERE c.sample_id = t.sample_id"""
+            table_name = self._table_name(self._id)
+            for col, mask in changed:
+                values = new_map[col][mask]
+                for i in range(0, len(values), UPDATE_PAGE_SIZE):
+                    page = values.iloc[i:i + UPDATE_PAGE_SIZE]
+                    sql_args = list(chain.from_iterable(
+                        (sample, qdb.metadata_template.util.cast_to_python(v))
+                        for sample, v in zip(page.index, page)))
+                    qdb.sql_connection.TRN.add(
+                        sql.format(table_name, col,
+                                   ', '.join(['(%s, %s)'] * len(page))),
+                        sql_args)
+            self._index_metadata(columns=cols_to_update)
+            self._metadata_changed(columns=cols_to_update)
             qdb.sql_connection.TRN.execute()
 
             self.generate_files()
@@ -1251,57 +1597,69 @@ class MetadataTemplate(qdb.base.QiitaObject):
         QiitaDBUnknownIDError
             If a sample_id is included in values that is not in the template
         QiitaDBColumnError
-            If the column does not exist in the table. This is implicit, and
-            can be thrown by the contained Samples.
+            If the column does not exist in the table
         ValueError
             If one of the new values cannot be inserted in the DB due to
             different types
         """
         with qdb.sql_connection.TRN:
-            if not set(self.keys()).issuperset(samples_and_values):
-                missing = set(self.keys()) - set(samples_and_values)
-                table_name = self._table_name(self._id)
+            table_name = self._table_name(self._id)
+            sql = """SELECT sample_id
+                     FROM unnest(%s::varchar[]) AS s(sample_id)
+                     EXCEPT
+                     SELECT sample_id FROM qiita.{0}""".format(table_name)
+            qdb.sql_connection.TRN.add(sql, [list(samples_and_values)])
+            missing = set(qdb.sql_connection.TRN.execute_fetchflatten())
+            if missing:
                 raise qdb.exceptions.QiitaDBUnknownIDError(missing, table_name)
 
-            for k, v in viewitems(samples_and_values):
-                sample = self[k]
-                if isinstance(v, np.generic):
-                    v = np.asscalar(v)
-                sample.setitem(category, v)
-
-            try:
-                qdb.sql_connection.TRN.execute()
-            except ValueError as e:
-                # catching error so we can check if the error is due to
-                # different column type or something else
-
-                value_types = set(
-                    qdb.metadata_template.util.type_lookup(type(value))
-                    for value in viewvalues(samples_and_values))
-
-                sql = """SELECT udt_name
-                         FROM information_schema.columns
-                         WHERE column_name = %s
-                            AND table_schema = 'qiita'
-                            AND (table_name = %s OR table_name = %s)"""
-                qdb.sql_connection.TRN.add(
-                    sql, [category, self._table, self._table_name(self._id)])
-                column_type = qdb.sql_connection.TRN.execute_fetchlast()
-
-                if any([column_type != vt for vt in value_types]):
-                    value_str = ', '.join(
-                        [str(value)
-                         for value in viewvalues(samples_and_values)])
-                    value_types_str = ', '.join(value_types)
-
-                    raise ValueError(
-                        'The new values being added to column: "%s" are "%s" '
-                        '(types: "%s"). However, this column in the DB is of '
-                        'type "%s". Please change the values in your updated '
-                        'template or reprocess your template.'
-                        % (category, value_str, value_types_str, column_type))
-
-                raise e
+            if category not in self.categories():
+                raise qdb.exceptions.QiitaDBColumnError(
+                    "Column %s does not exist in %s" % (category, table_name))
+
+            sql = """SELECT column_type
+                     FROM qiita.{0}
+                     WHERE {1} = %s AND column_name = %s""".format(
+                self._column_table, self._id_column)
+            qdb.sql_connection.TRN.add(sql, [self._id, category])
+            column_type = qdb.sql_connection.TRN.execute_fetchflatten()
+            column_type = column_type[0] if column_type else 'varchar'
+
+            # Check all the values against the column type before touching
+            # the DB, so all the offending values are reported together
+            samples = []
+            values = []
+            invalid = []
+            for sample, value in viewitems(samples_and_values):
+                try:
+                    values.append(qdb.metadata_template.util.as_sql_text(
+                        value, column_type))
+                    samples.append(sample)
+                except ValueError:
+                    invalid.append(value)
+
+            if invalid:
+                value_str = ', '.join([str(value) for value in invalid])
+                value_types_str = ', '.join(
+                    sorted(set(type(value).__name__ for value in invalid)))
+                raise ValueError(
+                    'The new values being added to column: "%s" are "%s" '
+                    '(types: "%s"). However, this column in the DB is of '
+                    'type "%s". Please change the values in your updated '
+                    'template or reprocess your template.'
+                    % (category, value_str, value_types_str, column_type))
+
+            # All the values are written by a single statement, sending them
+            # as two arrays of text that postgres casts to the column type
+            sql = """UPDATE qiita.{0} AS t SET {1} = c.value::{2}
+                     FROM (SELECT unnest(%s::varchar[]) AS sample_id,
+                                  unnest(%s::varchar[]) AS value) AS c
+                     WHERE c.sample_id = t.sample_id""".format(
+                table_name, category, column_type)
+            qdb.sql_connection.TRN.add(sql, [samples, values])
+            self._index_metadata(samples=samples, columns=[category])
+            self._metadata_changed(samples=samples, columns=[category])
+            qdb.sql_connection.TRN.execute()
 
     def get_category(self, category):
         """Returns the values of all samples for the given category
@@ -152,6 +152,7 @@ class PrepTemplate(MetadataTemplate):
             qdb.sql_connection.TRN.add(sql, [study.id, prep_id])
 
             qdb.sql_connection.TRN.execute()
+            qdb.util.invalidate_search_cache(study.id)
 
             pt = cls(prep_id)
             pt.generate_files()
@@ -218,12 +219,19 @@ class PrepTemplate(MetadataTemplate):
 
             # Delete the prep template filepaths
             sql = """DELETE FROM qiita.prep_template_filepath
-                     WHERE prep_template_id = %s"""
+                     WHERE prep_template_id = %s
+                     RETURNING filepath_id"""
             qdb.sql_connection.TRN.add(sql, args)
+            # The parsed QIIME mapping files are not used anymore
+            qdb.sql_connection.TRN.add_post_commit_func(
+                qdb.metadata_template.util.remove_qiime_mapping_file_cache,
+                qdb.sql_connection.TRN.execute_fetchflatten())
 
             # Drop the prep_X table
             sql = "DROP TABLE qiita.{0}".format(table_name)
             qdb.sql_connection.TRN.add(sql)
+            qdb.util.invalidate_schema_cache(table_name)
+            qdb.util.invalidate_template_summary(table_name)
 
             # Remove the rows from prep_template_samples
             sql = "DELETE FROM qiita.{0} WHERE {1} = %s".format(
@@ -246,6 +254,7 @@ class PrepTemplate(MetadataTemplate):
             qdb.sql_connection.TRN.add(sql, args)
 
             qdb.sql_connection.TRN.execute()
+            cls._forget_validated(id_)
 
     def data_type(self, ret_id=False):
         """Returns the data_type or the data_type id
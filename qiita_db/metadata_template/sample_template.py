@@ -104,6 +104,9 @@ class SampleTemplate(MetadataTemplate):
             cls._common_creation_steps(md_template, study.id)
 
             st = cls(study.id)
+            st._index_metadata()
+            st._metadata_changed()
+            qdb.sql_connection.TRN.execute()
             st.generate_files()
 
             return st
@@ -150,6 +153,9 @@ class SampleTemplate(MetadataTemplate):
 
             sql = "DROP TABLE qiita.{0}".format(table_name)
             qdb.sql_connection.TRN.add(sql)
+            qdb.util.invalidate_schema_cache(table_name)
+            qdb.util.invalidate_template_summary(table_name)
+            qdb.util.invalidate_search_cache(id_)
 
             sql = "DELETE FROM qiita.{0} WHERE {1} = %s".format(
                 cls._table, cls._id_column)
@@ -160,6 +166,7 @@ class SampleTemplate(MetadataTemplate):
             qdb.sql_connection.TRN.add(sql, args)
 
             qdb.sql_connection.TRN.execute()
+            cls._forget_validated(id_)
 
     @property
     def study_id(self):
@@ -234,6 +241,25 @@ class SampleTemplate(MetadataTemplate):
         """
         return True, ""
 
+    def _index_metadata(self, samples=None, columns=None):
+        r"""Adds to the transaction the queries that refresh the search index
+
+        The query is only added to the transaction, so the caller should
+        execute it along with the changes to the metadata.
+
+        Parameters
+        ----------
+        samples : iterable of str, optional
+            The samples to refresh. Default: all the template samples
+        columns : iterable of str, optional
+            The columns to refresh. Default: all the template columns
+        """
+        samples = None if samples is None else list(samples)
+        columns = None if columns is None else list(columns)
+        sql = """SELECT qiita.index_sample_metadata(
+                    %s, %s::varchar[], %s::varchar[])"""
+        qdb.sql_connection.TRN.add(sql, [self._id, samples, columns])
+
     def generate_files(self):
         r"""Generates all the files that contain data from this template
         """
@@ -7,6 +7,11 @@
 # -----------------------------------------------------------------------------
 
 from unittest import TestCase, main
+from datetime import datetime
+
+import numpy as np
+import numpy.testing as npt
+import pandas as pd
 
 from qiita_core.exceptions import IncompetentQiitaDeveloperError
 import qiita_db as qdb
@@ -68,5 +73,42 @@ class TestMetadataTemplateReadOnly(TestCase):
             MT._clean_validate_template(None, 1, None)
 
 
+class TestHelpers(TestCase):
+    """Tests the module level helpers"""
+
+    def test_changed_cells(self):
+        index = ['s1', 's2', 's3', 's4', 's5']
+        current = pd.Series([1.5, np.nan, None, 2.0, 'a'], index=index)
+        new = pd.Series([1.5, None, 3.0, 4.0, 'b'], index=index)
+        obs = qdb.metadata_template.base_metadata_template._changed_cells(
+            current, new)
+        npt.assert_equal(obs, [False, False, True, True, True])
+
+        current = pd.Series(np.array(['2015-09-01', '2015-08-01'],
+                                     dtype='datetime64[ns]'))
+        new = pd.Series([datetime(2015, 9, 1), datetime(2015, 9, 1)])
+        obs = qdb.metadata_template.base_metadata_template._changed_cells(
+            current, new)
+        npt.assert_equal(obs, [False, True])
+
+    def test_columns_from_chunks(self):
+        chunks = [[('s1', 1, 1.5, 'a'), ('s2', 2, 2.5, 'b')],
+                  [('s3', None, 3.5, 'c')]]
+        dtypes = [None, np.dtype(np.int64), np.dtype(np.float64), None]
+        obs = qdb.metadata_template.base_metadata_template.\
+            _columns_from_chunks(chunks, dtypes)
+        self.assertEqual([o.dtype for o in obs],
+                         [object, object, np.float64, object])
+        self.assertEqual([o.tolist() for o in obs],
+                         [['s1', 's2', 's3'], [1, 2, None], [1.5, 2.5, 3.5],
+                          ['a', 'b', 'c']])
+        # the values of the column that fell back to objects are python ints
+        self.assertIsInstance(obs[1][0], int)
+
+        obs = qdb.metadata_template.base_metadata_template.\
+            _columns_from_chunks([], dtypes)
+        self.assertEqual([len(o) for o in obs], [0, 0, 0, 0])
+
+
 if __name__ == '__main__':
     main()
@@ -17,6 +17,7 @@ from copy import deepcopy
 import numpy.testing as npt
 import pandas as pd
 from pandas.util.testing import assert_frame_equal
+from moi import r_client
 
 from qiita_core.util import qiita_test_checker
 from qiita_core.exceptions import IncompetentQiitaDeveloperError
@@ -1154,7 +1155,11 @@ class TestPrepTemplateReadWrite(BaseTestPrepTemplate):
         """Deletes prep template 2"""
         pt = qdb.metadata_template.prep_template.PrepTemplate.create(
             self.metadata, self.test_study, self.data_type_id)
+        key = qdb.util.template_summary_key('prep_%d' % pt.id)
+        pt.summary()
+        self.assertTrue(r_client.exists(key))
         qdb.metadata_template.prep_template.PrepTemplate.delete(pt.id)
+        self.assertFalse(r_client.exists(key))
 
         obs = self.conn_handler.execute_fetchall(
             "SELECT * FROM qiita.prep_template WHERE prep_template_id=%s",
@@ -1268,6 +1273,20 @@ class TestPrepTemplateReadWrite(BaseTestPrepTemplate):
         self.assertEqual(self.tester['1.SKB8.640193']['center_name'], 'FOO')
         self.assertEqual(self.tester['1.SKD8.640184']['center_name'], 'BAR')
 
+    def test_update_category_metadata_changed(self):
+        key = qdb.util.template_summary_key('prep_%d' % self.tester.id)
+        self.tester.summary(['barcode', 'center_name'])
+        self.tester.update_category('barcode',
+                                    {'1.SKB8.640193': 'AAAAAAAAAAAA'})
+        # Only the summary of the updated column is dropped
+        self.assertFalse(r_client.hexists(key, 'barcode'))
+        self.assertTrue(r_client.hexists(key, 'center_name'))
+        # The prep templates are never indexed
+        obs = self.conn_handler.execute_fetchall(
+            "SELECT count(*) FROM qiita.sample_metadata_index "
+            "WHERE column_name = 'barcode'")
+        self.assertEqual(obs, [[0]])
+
     def test_qiime_map_fp(self):
         pt = qdb.metadata_template.prep_template.PrepTemplate(1)
         exp = join(qdb.util.get_mountpoint('templates')[0][1],
@@ -12,11 +12,13 @@ from datetime import datetime
 from tempfile import mkstemp
 from os import close, remove
 from collections import Iterable
+import warnings
 
 import numpy as np
 import numpy.testing as npt
 import pandas as pd
 from pandas.util.testing import assert_frame_equal
+from moi import r_client
 
 from qiita_core.util import qiita_test_checker
 from qiita_core.exceptions import IncompetentQiitaDeveloperError
@@ -712,6 +714,43 @@ class TestSampleTemplateReadOnly(BaseTestSampleTemplate):
         for o, e in zip(sorted(list(obs)), sorted(exp)):
             self.assertEqual(o, e)
 
+    def test_items_page_size(self):
+        """items returns the same samples regardless of the page size"""
+        exp = [(sid, s._to_dict()) for sid, s in self.tester.items()]
+        self.assertEqual(len(exp), 27)
+        # Ordered by sample id
+        self.assertEqual([sid for sid, _ in exp],
+                         sorted(self.tester.keys()))
+        for page_size in (1, 5, 27, 100):
+            obs = [(sid, s._to_dict())
+                   for sid, s in self.tester.items(page_size=page_size)]
+            self.assertEqual(obs, exp)
+
+    def test_values_in_memory(self):
+        """The samples returned by values do not read from the database"""
+        obs = next(self.tester.values())
+        exp = qdb.metadata_template.sample_template.Sample(obs.id,
+                                                           self.tester)
+        self.assertEqual(obs, exp)
+        self.assertEqual(obs._to_dict(), exp._to_dict())
+        self.assertEqual(obs._get_categories(), exp._get_categories())
+        self.assertEqual(len(obs), len(exp))
+        self.assertEqual(obs['DEPTH'], exp['depth'])
+        self.assertEqual(obs.get('Not_a_Category'), None)
+        with self.assertRaises(KeyError):
+            obs['Not_a_Category']
+
+        # Modify the in-memory values to make sure they're used
+        obs._values['depth'] = 'in memory'
+        self.assertEqual(obs['depth'], 'in memory')
+
+        # Setting a value writes it in the database and drops the
+        # in-memory values
+        obs['tot_nitro'] = '1234.5'
+        self.assertIsNone(obs._values)
+        self.assertEqual(obs['tot_nitro'], 1234.5)
+        self.assertEqual(exp['tot_nitro'], 1234.5)
+
     def test_get(self):
         """get returns the correct sample object"""
         obs = self.tester.get('1.SKM7.640188')
@@ -1356,6 +1395,113 @@ class TestSampleTemplateReadWrite(BaseTestSampleTemplate):
 
         self.assertEqual(before, after)
 
+    def test_update_category_types(self):
+        st = qdb.metadata_template.sample_template.SampleTemplate.create(
+            self.metadata, self.new_study)
+        s_id = '%d.Sample%%d' % self.new_study.id
+
+        st.update_category('latitude', {s_id % 1: '1.5', s_id % 2: 2,
+                                        s_id % 3: np.float64(3.25)})
+        st.update_category('int_column', {s_id % 1: np.int64(10),
+                                          s_id % 3: '30'})
+        st.update_category('dna_extracted', {s_id % 2: False})
+        st.update_category('str_column', {s_id % 3: None})
+        obs = st.to_dataframe(
+            columns=['latitude', 'int_column', 'dna_extracted', 'str_column'])
+        self.assertEqual(obs['latitude'].tolist(), [1.5, 2.0, 3.25])
+        self.assertEqual(obs['int_column'].tolist(), [10, 2, 30])
+        self.assertEqual(obs['dna_extracted'].tolist(), [True, False, True])
+        self.assertEqual(obs['str_column'].tolist(),
+                         ['Value for sample 1', 'Value for sample 2', None])
+
+        # All the values that don't match the column type are reported
+        with self.assertRaises(ValueError) as cm:
+            st.update_category('int_column', {s_id % 1: 'a', s_id % 2: 5,
+                                              s_id % 3: 1.5})
+        self.assertIn('are "', str(cm.exception))
+        self.assertIn('type "integer"', str(cm.exception))
+        self.assertEqual(st[s_id % 2]['int_column'], 2)
+
+    def test_items_page_size_case(self):
+        """Paging does not depend on the collation of the database"""
+        # The locale collations sort these ids differently than python
+        self.metadata.index = ['SampleB', 'samplea', 'Samplec']
+        st = qdb.metadata_template.sample_template.SampleTemplate.create(
+            self.metadata, self.new_study)
+        exp = sorted(st.keys())
+        for page_size in (1, 2):
+            obs = [sid for sid, _ in st.items(page_size=page_size)]
+            self.assertEqual(obs, exp)
+
+    def test_summary(self):
+        st = qdb.metadata_template.sample_template.SampleTemplate.create(
+            self.metadata, self.new_study)
+        s_id = '%d.Sample%%d' % self.new_study.id
+        key = qdb.util.template_summary_key('sample_%d' % self.new_study.id)
+
+        obs = st.summary(['int_column', 'str_column'])
+        exp = {'int_column': [('1', 1), ('2', 1), ('3', 1)],
+               'str_column': [('Value for sample 1', 1),
+                              ('Value for sample 2', 1),
+                              ('Value for sample 3', 1)]}
+        self.assertEqual(obs, exp)
+        self.assertTrue(r_client.hexists(key, 'int_column'))
+        self.assertTrue(r_client.hexists(key, 'str_column'))
+        self.assertTrue(
+            0 < r_client.ttl(key) <= qdb.util.TEMPLATE_SUMMARY_TTL)
+        self.assertEqual(set(st.summary()), set(st.categories()))
+
+        # A summary computed before the template is invalidated is not cached
+        table_name = 'sample_%d' % self.new_study.id
+        version = qdb.util.template_summary_version(table_name)
+        qdb.util.invalidate_template_summary(table_name, ['str_column'])
+        qdb.util.cache_template_summary(
+            table_name, version, {'str_column': 'outdated'})
+        self.assertFalse(r_client.hexists(key, 'str_column'))
+
+        # Only the summary of the updated column is dropped
+        st.summary(['str_column'])
+        st.update_category('int_column', {s_id % 1: 3})
+        self.assertFalse(r_client.hexists(key, 'int_column'))
+        self.assertTrue(r_client.hexists(key, 'str_column'))
+        obs = st.summary(['int_column', 'str_column'])
+        exp['int_column'] = [('2', 1), ('3', 2)]
+        self.assertEqual(obs, exp)
+
+        qdb.metadata_template.sample_template.SampleTemplate.delete(st.id)
+        self.assertFalse(r_client.exists(key))
+
+    def test_index_metadata(self):
+        st = qdb.metadata_template.sample_template.SampleTemplate.create(
+            self.metadata, self.new_study)
+        s_id = '%d.Sample%%d' % self.new_study.id
+        sql = """SELECT sample_id, value_text, value_num
+                 FROM qiita.sample_metadata_index
+                 WHERE study_id = %s AND column_name = %s
+                 ORDER BY sample_id"""
+
+        obs = self.conn_handler.execute_fetchall(
+            sql, [self.new_study.id, 'int_column'])
+        self.assertEqual(obs, [[s_id % 1, '1', 1.0], [s_id % 2, '2', 2.0],
+                               [s_id % 3, '3', 3.0]])
+
+        st.update_category('int_column', {s_id % 1: 10})
+        st.update_category('str_column', {s_id % 3: None})
+        obs = self.conn_handler.execute_fetchall(
+            sql, [self.new_study.id, 'int_column'])
+        self.assertEqual(obs, [[s_id % 1, '10', 10.0], [s_id % 2, '2', 2.0],
+                               [s_id % 3, '3', 3.0]])
+        obs = self.conn_handler.execute_fetchall(
+            sql, [self.new_study.id, 'str_column'])
+        self.assertEqual(obs, [[s_id % 1, 'Value for sample 1', None],
+                               [s_id % 2, 'Value for sample 2', None]])
+
+        qdb.metadata_template.sample_template.SampleTemplate.delete(st.id)
+        obs = self.conn_handler.execute_fetchall(
+            "SELECT count(*) FROM qiita.sample_metadata_index "
+            "WHERE study_id = %s", [self.new_study.id])
+        self.assertEqual(obs, [[0]])
+
     def test_update_equal(self):
         """It doesn't fail with the exact same template"""
         # Create a new sample tempalte
@@ -1410,6 +1556,30 @@ class TestSampleTemplateReadWrite(BaseTestSampleTemplate):
         obs = {s_id: st[s_id]._to_dict() for s_id in st}
         self.assertEqual(obs, exp)
 
+    def test_update_changed_cells(self):
+        """Only the cells that changed are updated"""
+        metadata = self.metadata.copy()
+        metadata.loc['Sample2', 'latitude'] = np.nan
+        st = qdb.metadata_template.sample_template.SampleTemplate.create(
+            metadata, self.new_study)
+
+        # The missing latitude of Sample2 is not considered a change
+        with warnings.catch_warnings(record=True) as warns:
+            warnings.simplefilter('always')
+            st.update(metadata)
+        self.assertTrue(any('There are no differences' in str(w.message)
+                            for w in warns))
+
+        metadata.loc['Sample1', 'str_column'] = 'Changed value'
+        metadata.loc['Sample3', 'int_column'] = 30
+        st.update(metadata)
+        s_id = '%d.Sample%%d' % self.new_study.id
+        self.assertEqual(st[s_id % 1]['str_column'], 'Changed value')
+        self.assertEqual(st[s_id % 1]['int_column'], 1)
+        self.assertEqual(st[s_id % 2]['str_column'], 'Value for sample 2')
+        self.assertEqual(st[s_id % 3]['str_column'], 'Value for sample 3')
+        self.assertEqual(st[s_id % 3]['int_column'], 30)
+
     def test_update_numpy(self):
         """Update values in existing mapping file with numpy values"""
         metadata_dict = {
@@ -2091,6 +2261,50 @@ class TestSampleTemplateReadWrite(BaseTestSampleTemplate):
             'anonymized_name', 'tot_org_carb', 'description_duplicate',
             'env_feature', 'scientific_name'})
 
+    def test_to_dataframe_columns_samples(self):
+        st = qdb.metadata_template.sample_template.SampleTemplate.create(
+            self.metadata, self.new_study)
+        obs = st.to_dataframe(columns=['int_column', 'latitude',
+                                       'collection_timestamp'],
+                              samples=['2.Sample3', '2.Sample1'])
+        exp = pd.DataFrame.from_dict(
+            {'2.Sample1': {'int_column': 1, 'latitude': 42.42,
+                           'collection_timestamp':
+                           datetime(2014, 5, 29, 12, 24, 51)},
+             '2.Sample3': {'int_column': 3, 'latitude': 4.8,
+                           'collection_timestamp':
+                           datetime(2014, 5, 29, 12, 24, 51)}},
+            orient='index')
+        exp.index.name = 'sample_id'
+        exp.sort_index(axis=1, inplace=True)
+        assert_frame_equal(obs, exp)
+
+        obs = st.to_dataframe(columns=['str_column'], samples=[])
+        self.assertEqual(obs.shape, (0, 1))
+
+        with self.assertRaises(qdb.exceptions.QiitaDBColumnError):
+            st.to_dataframe(columns=['int_column', 'not_a_column'])
+
+    def test_to_dataframe_dtypes(self):
+        obs = self.tester.to_dataframe(categorical=True)
+        self.assertEqual(obs['latitude'].dtype, np.float64)
+        self.assertEqual(obs['dna_extracted'].dtype, np.bool_)
+        self.assertEqual(obs['collection_timestamp'].dtype,
+                         np.dtype('datetime64[ns]'))
+        # all the samples share the same value
+        self.assertEqual(obs['country'].dtype.name, 'category')
+        self.assertEqual(list(obs['country'].cat.categories),
+                         ['GAZ:United States of America'])
+        # each sample has its own value
+        self.assertEqual(obs['anonymized_name'].dtype, object)
+
+        # Missing values are kept as None
+        self.tester['1.SKB1.640202']['ph'] = None
+        obs = self.tester.to_dataframe(columns=['ph'])
+        self.assertEqual(obs['ph'].dtype, object)
+        self.assertIsNone(obs.loc['1.SKB1.640202', 'ph'])
+        self.assertEqual(obs.loc['1.SKB2.640194', 'ph'], 6.94)
+
     def test_check_restrictions(self):
         obs = self.tester.check_restrictions(
             [qdb.metadata_template.constants.SAMPLE_TEMPLATE_COLUMNS['EBI']])
@@ -9,6 +9,9 @@
 from six import StringIO
 from unittest import TestCase, main
 from datetime import datetime
+from tempfile import mkstemp
+from os import close, remove, utime
+from os.path import exists
 
 import numpy as np
 import numpy.testing as npt
@@ -39,6 +42,41 @@ class TestUtil(TestCase):
         self.assertEqual(qdb.metadata_template.util.type_lookup(
             self.metadata_map['str_col'].dtype), 'varchar')
 
+    def test_dtype_lookup(self):
+        """Correctly returns the numpy dtype of the passed SQL datatype"""
+        obs = [qdb.metadata_template.util.dtype_lookup(t)
+               for t in ['integer', 'float8', 'bool', 'timestamp', 'varchar',
+                         None]]
+        exp = [np.dtype(np.int64), np.dtype(np.float64), np.dtype(np.bool_),
+               np.dtype('datetime64[ns]'), None, None]
+        self.assertEqual(obs, exp)
+
+    def test_as_sql_text(self):
+        """Correctly returns the text of the value for the SQL datatype"""
+        as_sql_text = qdb.metadata_template.util.as_sql_text
+        self.assertIsNone(as_sql_text(None, 'integer'))
+        self.assertEqual(as_sql_text(np.int64(3), 'integer'), '3')
+        self.assertEqual(as_sql_text('3', 'integer'), '3')
+        self.assertEqual(as_sql_text(3.0, 'integer'), '3')
+        self.assertEqual(as_sql_text(0.1, 'float8'), '0.1')
+        self.assertEqual(as_sql_text('4.2', 'float8'), '4.2')
+        self.assertEqual(as_sql_text(np.bool_(False), 'bool'), 'false')
+        self.assertEqual(as_sql_text('TRUE', 'bool'), 'TRUE')
+        self.assertEqual(as_sql_text(datetime(2015, 9, 1, 10), 'timestamp'),
+                         '2015-09-01T10:00:00')
+        self.assertEqual(as_sql_text('09/01/15', 'timestamp'), '09/01/15')
+        self.assertEqual(as_sql_text(True, 'varchar'), 'true')
+        self.assertEqual(as_sql_text(1.5, 'varchar'), '1.5')
+        self.assertEqual(as_sql_text(7, 'varchar'), '7')
+        self.assertEqual(as_sql_text('value', 'varchar'), 'value')
+
+        for value, sql_type in [('no_value', 'integer'), (1.5, 'integer'),
+                                (True, 'integer'), ('a', 'float8'),
+                                (1, 'bool'), ('maybe', 'bool'),
+                                (1, 'timestamp')]:
+            with self.assertRaises(ValueError):
+                as_sql_text(value, sql_type)
+
     def test_get_datatypes(self):
         """Correctly returns the data types of each column"""
         obs = qdb.metadata_template.util.get_datatypes(
@@ -188,6 +226,31 @@ class TestUtil(TestCase):
         exp.rename(columns={"str_column": "str_CoLumn"}, inplace=True)
         assert_frame_equal(obs, exp)
 
+    def test_load_template_to_dataframe_filepath(self):
+        fd, fp = mkstemp(suffix='.txt')
+        close(fd)
+        try:
+            with open(fp, 'w') as f:
+                f.write(EXP_SAMPLE_TEMPLATE_SPACES)
+            obs = qdb.metadata_template.util.load_template_to_dataframe(fp)
+        finally:
+            remove(fp)
+        exp = pd.DataFrame.from_dict(SAMPLE_TEMPLATE_DICT_FORM)
+        exp.index.name = 'sample_name'
+        assert_frame_equal(obs, exp)
+
+    def test_clean_template_lines(self):
+        lines = ['Sample_Name\tDescription \tother\n',
+                 ' s1 \t\x0bdesc\r\t other \n']
+        obs = list(qdb.metadata_template.util._clean_template_lines(
+            lines, True))
+        self.assertEqual(obs, ['sample_name\tdescription\tother\n',
+                               's1\tdesc\tother \n'])
+        obs = list(qdb.metadata_template.util._clean_template_lines(
+            lines, False))
+        self.assertEqual(obs, ['sample_name\tDescription \tother\n',
+                               ' s1 \t\x0bdesc\r\t other \n'])
+
     def test_load_template_to_dataframe_non_utf8(self):
         bad = EXP_SAMPLE_TEMPLATE.replace('Test Sample 2', 'Test Sample\x962')
         with self.assertRaises(qdb.exceptions.QiitaDBError):
@@ -290,6 +353,73 @@ class TestUtil(TestCase):
         self.assertEqual(obs, exp)
 
 
+class TestLoadQiimeMappingFile(TestCase):
+    def setUp(self):
+        fd, self.fp = mkstemp(suffix='_qiime.txt')
+        close(fd)
+        with open(self.fp, 'w') as f:
+            f.write(QIIME_TUTORIAL_MAP_SUBSET)
+        self.cache_fp = qdb.metadata_template.util._qiime_map_cache_fp(
+            1000, 'test')
+        self.files_to_remove = [self.fp, self.cache_fp]
+
+    def tearDown(self):
+        qdb.metadata_template.util._QIIME_MAP_CACHE.clear()
+        for fp in self.files_to_remove:
+            if exists(fp):
+                remove(fp)
+
+    def test_load_qiime_mapping_file(self):
+        exp = qdb.metadata_template.util.load_template_to_dataframe(
+            self.fp, index='#SampleID')
+        obs = qdb.metadata_template.util.load_qiime_mapping_file(
+            1000, self.fp, 'test')
+        assert_frame_equal(obs, exp)
+        self.assertTrue(exists(self.cache_fp))
+
+        # the returned frame is a copy, so the cached one is not modified
+        obs['new_col'] = 'value'
+        obs = qdb.metadata_template.util.load_qiime_mapping_file(
+            1000, self.fp, 'test')
+        assert_frame_equal(obs, exp)
+
+        # the pickled file is used when the frame is not in memory
+        remove(self.fp)
+        qdb.metadata_template.util._QIIME_MAP_CACHE.clear()
+        obs = qdb.metadata_template.util.load_qiime_mapping_file(
+            1000, self.fp, 'test')
+        assert_frame_equal(obs, exp)
+
+    def test_load_qiime_mapping_file_prune(self):
+        old_fp = qdb.metadata_template.util._qiime_map_cache_fp(1001, 'old')
+        used_fp = qdb.metadata_template.util._qiime_map_cache_fp(1002, 'used')
+        new_fp = qdb.metadata_template.util._qiime_map_cache_fp(1000, 'new')
+        self.files_to_remove.extend([old_fp, used_fp, new_fp])
+        qdb.metadata_template.util.load_qiime_mapping_file(
+            1000, self.fp, 'test')
+        for fp in (old_fp, used_fp):
+            with open(fp, 'w') as f:
+                f.write('\n')
+        # last used long ago
+        utime(old_fp, (1, 1))
+
+        # Parsing the file with a new checksum drops the file with the old
+        # checksum and the files that have not been used for a long time
+        qdb.metadata_template.util.load_qiime_mapping_file(
+            1000, self.fp, 'new')
+        self.assertTrue(exists(new_fp))
+        self.assertFalse(exists(self.cache_fp))
+        self.assertFalse(exists(old_fp))
+        self.assertTrue(exists(used_fp))
+
+    def test_remove_qiime_mapping_file_cache(self):
+        qdb.metadata_template.util.load_qiime_mapping_file(
+            1000, self.fp, 'test')
+        qdb.metadata_template.util.remove_qiime_mapping_file_cache([1000])
+        self.assertFalse(exists(self.cache_fp))
+        self.assertEqual(qdb.metadata_template.util._QIIME_MAP_CACHE, {})
+
+
 QIIME_TUTORIAL_MAP_SUBSET = (
     "#SampleID\tBarcodeSequence\tLinkerPrimerSequence\tTreatment\tDOB\t"
     "Description\n"
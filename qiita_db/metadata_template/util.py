@@ -7,9 +7,16 @@
 # -----------------------------------------------------------------------------
 
 from __future__ import division
-from collections import defaultdict
+from collections import defaultdict, OrderedDict
+from itertools import chain
+from os import close, listdir, makedirs, remove, rename, utime
+from os.path import dirname, exists, getmtime, join
+from tempfile import mkstemp
+from threading import Lock
+from time import time
 from future.utils import PY3, viewitems
-from six import StringIO
+from six import string_types, text_type
+from datetime import date, datetime
 
 import pandas as pd
 import numpy as np
@@ -25,6 +32,11 @@ else:
     from string import letters, digits
 
 
+# The text representations of booleans accepted by postgres
+_SQL_BOOL_VALUES = {'t', 'true', 'y', 'yes', 'on', '1',
+                    'f', 'false', 'n', 'no', 'off', '0'}
+
+
 def type_lookup(dtype):
     """Lookup function to transform from python type to SQL type
 
@@ -50,6 +62,26 @@ def type_lookup(dtype):
         return 'varchar'
 
 
+def dtype_lookup(sql_type):
+    """Lookup function to transform from SQL type to numpy dtype
+
+    Parameters
+    ----------
+    sql_type : str
+        The SQL type, as stored in the *_columns tables
+
+    Returns
+    -------
+    numpy dtype or None
+        The numpy dtype that can hold the values of the column if it does not
+        contain NULLs, None if the values should be kept as python objects
+    """
+    return {'integer': np.dtype(np.int64),
+            'float8': np.dtype(np.float64),
+            'bool': np.dtype(np.bool_),
+            'timestamp': np.dtype('datetime64[ns]')}.get(sql_type)
+
+
 def get_datatypes(metadata_map):
     r"""Returns the datatype of each metadata_map column
 
@@ -84,6 +116,68 @@ def cast_to_python(value):
     return value
 
 
+def as_sql_text(value, sql_type):
+    """Returns the text representation of `value` as a value of `sql_type`
+
+    Parameters
+    ----------
+    value : object
+        The python value
+    sql_type : str
+        The SQL type of the column in which the value is going to be stored,
+        as stored in the *_columns tables
+
+    Returns
+    -------
+    str or None
+        The text that postgres can cast to `sql_type`. None for missing values
+
+    Raises
+    ------
+    ValueError
+        If `value` cannot be stored in a column of type `sql_type`
+    """
+    value = cast_to_python(value)
+    if value is None:
+        return None
+
+    try:
+        if sql_type == 'integer':
+            if isinstance(value, bool) or (isinstance(value, float) and
+                                           not value.is_integer()):
+                raise ValueError()
+            return str(int(value))
+        elif sql_type == 'float8':
+            if isinstance(value, bool):
+                raise ValueError()
+            return repr(float(value))
+        elif sql_type == 'bool':
+            if isinstance(value, bool):
+                return 'true' if value else 'false'
+            elif isinstance(value, string_types) and \
+                    value.strip().lower() in _SQL_BOOL_VALUES:
+                return value
+            raise ValueError()
+        elif sql_type == 'timestamp':
+            if isinstance(value, (datetime, date)):
+                return value.isoformat()
+            elif isinstance(value, string_types):
+                # postgres accepts multiple formats, so the string is
+                # validated by the DB
+                return value
+            raise ValueError()
+    except (TypeError, ValueError):
+        raise ValueError("%r can't be stored as %s" % (value, sql_type))
+
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    elif isinstance(value, float):
+        return repr(value)
+    elif isinstance(value, string_types):
+        return value
+    return text_type(value)
+
+
 def as_python_types(metadata_map, headers):
     r"""Converts the values of metadata_map pointed by headers from numpy types
     to python types.
@@ -153,6 +247,64 @@ def prefix_sample_names_with_id(md_template, study_id):
         md_template.index.name = None
 
 
+def _clean_template_lines(lines, strip_whitespace):
+    """Strips the cells of the template lines and fixes the controlled columns
+
+    Parameters
+    ----------
+    lines : iterable of str
+        The lines of the template, starting with the header
+    strip_whitespace : bool
+        Whether or not to strip whitespace from the values
+
+    Yields
+    ------
+    str
+        The cleaned lines
+    """
+    controlled_cols = {'sample_name'}
+    controlled_cols.update(qdb.metadata_template.constants.CONTROLLED_COLS)
+    for pos, line in enumerate(lines):
+        # Strip all values in the cells in the input file, if requested
+        if strip_whitespace:
+            line = '\t'.join(d.strip(" \r\x0b\x0c")
+                             for d in line.split('\t'))
+        # get and clean the controlled columns
+        if pos == 0:
+            line = '\t'.join(c.lower() if c.lower() in controlled_cols else c
+                             for c in line.split('\t'))
+        yield line
+
+
+def _non_utf8_error(lines):
+    """Builds the error listing the rows and columns with non UTF-8 characters
+
+    Parameters
+    ----------
+    lines : iterable of str
+        The lines of the template, starting with the header
+
+    Returns
+    -------
+    QiitaDBError
+        The error describing where the non UTF-8 characters are
+    """
+    lines = iter(lines)
+    header = next(lines)
+    headers = header.strip().split('\t')
+    errors = defaultdict(list)
+    for row, line in enumerate(chain([header], lines), 1):
+        for col, cell in enumerate(line.split('\t')):
+            try:
+                cell.encode('utf-8')
+            except UnicodeError:
+                errors[headers[col]].append(row)
+    lines = ['%s: row(s) %s' % (h, ', '.join(map(str, rows)))
+             for h, rows in viewitems(errors)]
+    return qdb.exceptions.QiitaDBError(
+        'Non UTF-8 characters found in columns:\n' + '\n'.join(lines))
+
+
 def load_template_to_dataframe(fn, strip_whitespace=True, index='sample_name'):
     """Load a sample/prep template or a QIIME mapping file into a data frame
 
@@ -221,87 +373,75 @@ def load_template_to_dataframe(fn, strip_whitespace=True, index='sample_name'):
     |             longitude |        float |
     +-----------------------+--------------+
     """
-    # Load in file lines
-    holdfile = None
     with open_file(fn, mode='U') as f:
-        holdfile = f.readlines()
-    if not holdfile:
-        raise ValueError('Empty file passed!')
-
-    # Strip all values in the cells in the input file, if requested
-    if strip_whitespace:
-        for pos, line in enumerate(holdfile):
-            holdfile[pos] = '\t'.join(d.strip(" \r\x0b\x0c")
-                                      for d in line.split('\t'))
-
-    # get and clean the controlled columns
-    cols = holdfile[0].split('\t')
-    controlled_cols = {'sample_name'}
-    controlled_cols.update(qdb.metadata_template.constants.CONTROLLED_COLS)
-    holdfile[0] = '\t'.join(c.lower() if c.lower() in controlled_cols else c
-                            for c in cols)
-
-    if index == "#SampleID":
-        # We're going to parse a QIIME mapping file. We are going to first
-        # parse it with the QIIME function so we can remove the comments
-        # easily and make sure that QIIME will accept this as a mapping file
-        data, headers, comments = _parse_mapping_file(holdfile)
-        holdfile = ["%s\n" % '\t'.join(d) for d in data]
-        holdfile.insert(0, "%s\n" % '\t'.join(headers))
-        # The QIIME parser fixes the index and removes the #
-        index = 'SampleID'
-
-    # index_col:
-    #   is set as False, otherwise it is cast as a float and we want a string
-    # keep_default:
-    #   is set as False, to avoid inferring empty/NA values with the defaults
-    #   that Pandas has.
-    # na_values:
-    #   the values that should be considered as empty
-    # true_values:
-    #   the values that should be considered "True" for boolean columns
-    # false_values:
-    #   the values that should be considered "False" for boolean columns
-    # converters:
-    #   ensure that sample names are not converted into any other types but
-    #   strings and remove any trailing spaces. Don't let pandas try to guess
-    #   the dtype of the other columns, force them to be a str.
-    # comment:
-    #   using the tab character as "comment" we remove rows that are
-    #   constituted only by delimiters i. e. empty rows.
-    try:
-        template = pd.read_csv(
-            StringIO(''.join(holdfile)), sep='\t', encoding='utf-8',
-            infer_datetime_format=True, keep_default_na=False,
-            na_values=qdb.metadata_template.constants.NA_VALUES,
-            true_values=qdb.metadata_template.constants.TRUE_VALUES,
-            false_values=qdb.metadata_template.constants.FALSE_VALUES,
-            parse_dates=True, index_col=False, comment='\t',
-            mangle_dupe_cols=False,
-            converters={index: lambda x: str(x).strip(),
-                        # required sample template information
-                        'physical_location': str,
-                        'sample_type': str,
-                        # collection_timestamp is not added here
-                        'host_subject_id': str,
-                        'description': str,
-                        # common prep template information
-                        'center_name': str,
-                        'center_projct_name': str})
-    except UnicodeDecodeError:
-        # Find row number and col number for utf-8 encoding errors
-        headers = holdfile[0].strip().split('\t')
-        errors = defaultdict(list)
-        for row, line in enumerate(holdfile, 1):
-            for col, cell in enumerate(line.split('\t')):
-                try:
-                    cell.encode('utf-8')
-                except UnicodeError:
-                    errors[headers[col]].append(row)
-        lines = ['%s: row(s) %s' % (header, ', '.join(map(str, rows)))
-                 for header, rows in viewitems(errors)]
-        raise qdb.exceptions.QiitaDBError(
-            'Non UTF-8 characters found in columns:\n' + '\n'.join(lines))
+        # The file is read line by line while pandas parses it, so the
+        # template is never held in memory as text
+        first_line = f.readline()
+        if not first_line:
+            raise ValueError('Empty file passed!')
+        lines = _clean_template_lines(chain([first_line], f),
+                                      strip_whitespace)
+
+        if index == "#SampleID":
+            # We're going to parse a QIIME mapping file. We are going to first
+            # parse it with the QIIME function so we can remove the comments
+            # easily and make sure that QIIME will accept this as a mapping
+            # file
+            data, headers, comments = _parse_mapping_file(list(lines))
+            holdfile = ["%s\n" % '\t'.join(d) for d in data]
+            holdfile.insert(0, "%s\n" % '\t'.join(headers))
+            lines = iter(holdfile)
+            # The QIIME parser fixes the index and removes the #
+            index = 'SampleID'
+
+        # index_col:
+        #   is set as False, otherwise it is cast as a float and we want a
+        #   string
+        # keep_default:
+        #   is set as False, to avoid inferring empty/NA values with the
+        #   defaults that Pandas has.
+        # na_values:
+        #   the values that should be considered as empty
+        # true_values:
+        #   the values that should be considered "True" for boolean columns
+        # false_values:
+        #   the values that should be considered "False" for boolean columns
+        # converters:
+        #   ensure that sample names are not converted into any other types
+        #   but strings and remove any trailing spaces. Don't let pandas try
+        #   to guess the dtype of the other columns, force them to be a str.
+        # comment:
+        #   using the tab character as "comment" we remove rows that are
+        #   constituted only by delimiters i. e. empty rows.
+        try:
+            template = pd.read_csv(
+                qdb.sql_connection.LineStream(lines, ''), sep='\t',
+                encoding='utf-8', infer_datetime_format=True,
+                keep_default_na=False,
+                na_values=qdb.metadata_template.constants.NA_VALUES,
+                true_values=qdb.metadata_template.constants.TRUE_VALUES,
+                false_values=qdb.metadata_template.constants.FALSE_VALUES,
+                parse_dates=True, index_col=False, comment='\t',
+                mangle_dupe_cols=False,
+                converters={index: lambda x: str(x).strip(),
+                            # required sample template information
+                            'physical_location': str,
+                            'sample_type': str,
+                            # collection_timestamp is not added here
+                            'host_subject_id': str,
+                            'description': str,
+                            # common prep template information
+                            'center_name': str,
+                            'center_projct_name': str})
+        except UnicodeDecodeError:
+            # Go over the file again to find row number and col number for
+            # utf-8 encoding errors
+            if index == 'SampleID':
+                lines = holdfile
+            else:
+                f.seek(0)
+                lines = _clean_template_lines(f, strip_whitespace)
+            raise _non_utf8_error(lines)
 
     # Check that we don't have duplicate columns
     if len(set(template.columns)) != len(template.columns):
@@ -355,6 +495,144 @@ def load_template_to_dataframe(fn, strip_whitespace=True, index='sample_name'):
     return template
 
 
+# Maximum number of parsed QIIME mapping files kept in memory
+QIIME_MAP_CACHE_SIZE = 32
+
+# Seconds that a parsed QIIME mapping file is kept in the work directory
+# since it was last used
+QIIME_MAP_CACHE_MAX_AGE = 30 * 24 * 60 * 60
+
+# Process-wide cache of the parsed QIIME mapping files, keyed by
+# (filepath_id, checksum), in order of use
+_QIIME_MAP_CACHE = OrderedDict()
+_QIIME_MAP_CACHE_LOCK = Lock()
+
+
+def _qiime_map_cache_fp(filepath_id, checksum):
+    """Returns the path of the parsed QIIME mapping file in the work dir"""
+    return join(qdb.util.get_work_base_dir(), 'qiime_map_cache',
+                '%d_%s.pkl' % (filepath_id, checksum))
+
+
+def _remove_qiime_map_cache_files(keep):
+    """Removes the parsed QIIME mapping files for which `keep` is False
+
+    Parameters
+    ----------
+    keep : callable
+        Called with the filepath id and the path of each parsed file
+    """
+    cache_dir = dirname(_qiime_map_cache_fp(0, ''))
+    if not exists(cache_dir):
+        return
+    for fn in listdir(cache_dir):
+        if not fn.endswith('.pkl'):
+            continue
+        fp = join(cache_dir, fn)
+        try:
+            if not keep(int(fn.split('_', 1)[0]), fp):
+                remove(fp)
+        except (OSError, ValueError):
+            # the file has been removed by another process, or it is not a
+            # parsed mapping file
+            pass
+
+
+def remove_qiime_mapping_file_cache(filepath_ids):
+    """Removes the parsed QIIME mapping files of the given filepaths
+
+    It should be called once the filepaths are removed from the database
+
+    Parameters
+    ----------
+    filepath_ids : iterable of int
+        The filepath ids of the QIIME mapping files
+    """
+    filepath_ids = set(filepath_ids)
+    with _QIIME_MAP_CACHE_LOCK:
+        for key in list(_QIIME_MAP_CACHE):
+            if key[0] in filepath_ids:
+                del _QIIME_MAP_CACHE[key]
+    _remove_qiime_map_cache_files(
+        lambda fp_id, fp: fp_id not in filepath_ids)
+
+
+def _prune_qiime_map_cache(filepath_id):
+    """Removes the outdated parsed QIIME mapping files
+
+    The files of `filepath_id` (i.e. those parsed with a different checksum)
+    and the files unused for `QIIME_MAP_CACHE_MAX_AGE` seconds are removed
+    """
+    oldest = time() - QIIME_MAP_CACHE_MAX_AGE
+    _remove_qiime_map_cache_files(
+        lambda fp_id, fp: fp_id != filepath_id and getmtime(fp) > oldest)
+
+
+def load_qiime_mapping_file(filepath_id, filepath, checksum):
+    """Loads a QIIME mapping file stored in the database into a DataFrame
+
+    Parameters
+    ----------
+    filepath_id : int
+        The filepath id of the QIIME mapping file
+    filepath : str
+        The path to the QIIME mapping file
+    checksum : str
+        The checksum of the QIIME mapping file, as stored in the database
+
+    Returns
+    -------
+    pandas.DataFrame
+        The mapping file, indexed by '#SampleID'. It is a copy, so it can be
+        modified by the caller
+
+    Notes
+    -----
+    The parsed files are cached in memory, up to `QIIME_MAP_CACHE_SIZE`, and
+    pickled in the work directory, keyed by their filepath id and checksum,
+    so a file is only parsed once while its contents don't change. The
+    pickled files are removed when their filepath is removed, when the file
+    is parsed again with a new checksum, or after `QIIME_MAP_CACHE_MAX_AGE`
+    seconds without being used
+    """
+    key = (filepath_id, checksum)
+    with _QIIME_MAP_CACHE_LOCK:
+        df = _QIIME_MAP_CACHE.pop(key, None)
+        if df is not None:
+            _QIIME_MAP_CACHE[key] = df
+            return df.copy()
+
+    cache_fp = _qiime_map_cache_fp(filepath_id, checksum)
+    df = None
+    if exists(cache_fp):
+        try:
+            df = pd.read_pickle(cache_fp)
+            # mark the file as used, so it is not pruned
+            utime(cache_fp, None)
+        except Exception:
+            # a corrupted cache file is not an error, the mapping file is
+            # parsed again and the cache file overwritten
+            df = None
+    if df is None:
+        df = load_template_to_dataframe(filepath, index='#SampleID')
+        cache_dir = dirname(cache_fp)
+        if not exists(cache_dir):
+            makedirs(cache_dir)
+        _prune_qiime_map_cache(filepath_id)
+        # Write to a temporary file and rename, so concurrent readers never
+        # see a partially written file
+        fd, tmp_fp = mkstemp(dir=cache_dir, suffix='.tmp')
+        close(fd)
+        df.to_pickle(tmp_fp)
+        rename(tmp_fp, cache_fp)
+
+    with _QIIME_MAP_CACHE_LOCK:
+        _QIIME_MAP_CACHE[key] = df
+        while len(_QIIME_MAP_CACHE) > QIIME_MAP_CACHE_SIZE:
+            _QIIME_MAP_CACHE.popitem(last=False)
+    return df.copy()
+
+
 def get_invalid_sample_names(sample_names):
     """Get a list of sample names that are not QIIME compliant
 
@@ -175,6 +175,8 @@ class Portal(qdb.base.QiitaObject):
                 END $do$;"""
             qdb.sql_connection.TRN.add(sql, [portal_id] * 2)
             qdb.sql_connection.TRN.execute()
+            qdb.analysis.Analysis._forget_validated()
+            Portal._forget_validated(portal_id)
 
     @staticmethod
     def exists(portal):
@@ -323,6 +325,9 @@ class Portal(qdb.base.QiitaObject):
             if len(clean_studies) != 0:
                 qdb.sql_connection.TRN.add(sql, [tuple(studies), self._id])
             qdb.sql_connection.TRN.execute()
+            # The studies may not be accessible anymore in this portal
+            qdb.study.Study._forget_validated()
+            qdb.util.invalidate_filepath_access()
 
     def get_analyses(self):
         """Returns all analyses belonging to a portal
@@ -472,3 +477,6 @@ class Portal(qdb.base.QiitaObject):
                 qdb.sql_connection.TRN.add(
                     sql, [tuple(clean_analyses), self._id])
             qdb.sql_connection.TRN.execute()
+            # The analyses may not be accessible anymore in this portal
+            qdb.analysis.Analysis._forget_validated()
+            qdb.util.invalidate_filepath_access()
@@ -352,8 +352,29 @@ class ProcessingJob(qdb.base.QiitaObject):
         ------
         qiita_db.exceptions.QiitaDBOperationNotPermittedError
             If the job is not in running state
+
+        Notes
+        -----
+        The files of the generated artifacts are moved to the DB directory and
+        their checksums computed before starting the transaction
         """
+        staged = {}
+        if success and artifacts_data:
+            try:
+                for out_name, a_data in viewitems(artifacts_data):
+                    staged[out_name] = qdb.util.stage_filepaths(
+                        a_data['filepaths'], a_data['artifact_type'])
+            except Exception:
+                for staged_fps in staged.values():
+                    staged_fps.unstage()
+                raise
+
         with qdb.sql_connection.TRN:
+            # If the transaction fails, return the staged files to their
+            # original location
+            for staged_fps in staged.values():
+                qdb.sql_connection.TRN.add_post_rollback_func(
+                    staged_fps.unstage)
             if success:
                 if self.status != 'running':
                     # If the job is not running, we only allow to complete it
@@ -365,9 +386,9 @@ class ProcessingJob(qdb.base.QiitaObject):
                         # In this case, the behavior of artifact_data is
                         # slightly different: we know that there is only 1
                         # new artifact and it doesn't have a parent
-                        _, a_data = artifacts_data.popitem()
+                        out_name, a_data = artifacts_data.popitem()
                         atype = a_data['artifact_type']
-                        filepaths = a_data['filepaths']
+                        filepaths = staged[out_name]
                         pt_id = self.parameters.values['template']
                         pt = qdb.metadata_template.prep_template.PrepTemplate(
                             pt_id)
@@ -376,7 +397,7 @@ class ProcessingJob(qdb.base.QiitaObject):
                     else:
                         artifact_ids = {}
                         for out_name, a_data in viewitems(artifacts_data):
-                            filepaths = a_data['filepaths']
+                            filepaths = staged[out_name]
                             atype = a_data['artifact_type']
                             parents = self.input_artifacts
                             params = self.parameters
@@ -999,6 +1020,7 @@ class ProcessingWorkflow(qdb.base.QiitaObject):
             sql = """DELETE FROM qiita.processing_job
                      WHERE processing_job_id = %s"""
             qdb.sql_connection.TRN.add(sql, [job.id])
+            qdb.processing_job.ProcessingJob._forget_validated(job.id)
 
             qdb.sql_connection.TRN.execute()
 
@@ -65,10 +65,13 @@ headers returned.
 from pyparsing import (alphas, nums, Word, dblQuotedString, oneOf, Optional,
                        opAssoc, CaselessLiteral, removeQuotes, Group,
                        operatorPrecedence, stringEnd)
-from collections import defaultdict
+from collections import defaultdict, OrderedDict
+from threading import Lock
 
 import pandas as pd
 from future.utils import viewitems
+from six.moves import cPickle
+from moi import r_client
 
 from qiita_core.qiita_settings import qiita_config
 import qiita_db as qdb
@@ -87,8 +90,8 @@ class BinaryOperation(object):
 
 
 class SearchAnd(BinaryOperation):
-    def generate_sql(self):
-        return "(%s)" % " AND ".join(oper.generate_sql()
+    def generate_sql(self, index=False):
+        return "(%s)" % " AND ".join(oper.generate_sql(index)
                                      for oper in self.operands)
 
     def __repr__(self):
@@ -96,8 +99,8 @@ class SearchAnd(BinaryOperation):
 
 
 class SearchOr(BinaryOperation):
-    def generate_sql(self):
-        return "(%s)" % " OR ".join(oper.generate_sql()
+    def generate_sql(self, index=False):
+        return "(%s)" % " OR ".join(oper.generate_sql(index)
                                     for oper in self.operands)
 
     def __repr__(self):
@@ -105,13 +108,35 @@ class SearchOr(BinaryOperation):
 
 
 class SearchNot(UnaryOperation):
-    def generate_sql(self):
-        return "NOT %s" % self.a.generate_sql()
+    def generate_sql(self, index=False):
+        return "NOT %s" % self.a.generate_sql(index)
 
     def __repr__(self):
         return "NOT:(%s)" % str(self.a)
 
 
+def _index_column(column_name, numeric):
+    """Returns how a sample metadata column is referenced in the index query
+
+    Parameters
+    ----------
+    column_name : str
+        The metadata column
+    numeric : bool
+        Whether the numeric or the text value of the column is needed
+
+    Returns
+    -------
+    str
+        The column of the pivoted sample metadata index (alias p) holding the
+        values of `column_name`
+    """
+    column_name = column_name.lower()
+    if column_name == 'sample_id':
+        return "ss.sample_id"
+    return "p.%s__%s" % (column_name, 'num' if numeric else 'text')
+
+
 class SearchTerm(object):
 
     def __init__(self, tokens):
@@ -122,7 +147,21 @@ class SearchTerm(object):
         for pos, term in enumerate(self.term):
             self.term[pos] = qdb.util.scrub_data(term)
 
-    def generate_sql(self):
+    def generate_sql(self, index=False):
+        """Generates the SQL condition of the term
+
+        Parameters
+        ----------
+        index : bool, optional
+            If True, the sample metadata columns are referenced as the
+            columns of the pivoted sample metadata index (alias p), otherwise
+            as the columns of the study sample table (alias sa)
+
+        Returns
+        -------
+        str
+            The SQL condition
+        """
         # we can assume that the metadata is either in study_sample
         # or the study-specific table
         column_name, operator, argument = self.term
@@ -138,6 +177,8 @@ class SearchTerm(object):
 
         if column_name in self.study_cols:
             column_name = "st.%s" % column_name.lower()
+        elif index:
+            column_name = _index_column(column_name, argument_type != str)
         else:
             column_name = "sa.%s" % column_name.lower()
 
@@ -158,12 +199,82 @@ class SearchTerm(object):
             return ' '.join(self.term)
 
 
+def _build_grammar():
+    """Builds the pyparsing grammar of the search strings
+
+    Returns
+    -------
+    pyparsing.ParserElement
+        The grammar of a full search string
+    pyparsing.ParserElement
+        The grammar of a single criterion, optionally followed by a boolean
+        operator, used to scan the metadata headers of a search string
+
+    References
+    ----------
+    .. [1] McGuire P (2007) Getting started with pyparsing.
+    """
+    category = Word(alphas + nums + "_")
+    seperator = oneOf("> < = >= <= !=") | CaselessLiteral("includes") | \
+        CaselessLiteral("startswith")
+    value = Word(alphas + nums + "_" + ":" + ".") | \
+        dblQuotedString().setParseAction(removeQuotes)
+    criterion = Group(category + seperator + value)
+    criterion.setParseAction(SearchTerm)
+    and_ = CaselessLiteral("and")
+    or_ = CaselessLiteral("or")
+    not_ = CaselessLiteral("not")
+    optional_seps = Optional(and_ | or_ | not_)
+
+    # create the grammar for parsing operators AND, OR, NOT
+    search_expr = operatorPrecedence(
+        criterion, [
+            (not_, 1, opAssoc.RIGHT, SearchNot),
+            (and_, 2, opAssoc.LEFT, SearchAnd),
+            (or_, 2, opAssoc.LEFT, SearchOr)])
+
+    return search_expr + stringEnd, criterion + optional_seps
+
+
+# The grammar is built once, when the module is imported
+_SEARCH_GRAMMAR, _CRITERION_GRAMMAR = _build_grammar()
+
+# Maximum number of parsed search strings kept by QiitaStudySearch
+PLAN_CACHE_SIZE = 256
+
+# Process-wide cache of the SQL generated for each search string, keyed by
+# (search string, only with processed data, index, portal), in insertion order
+_PLAN_CACHE = OrderedDict()
+_PLAN_CACHE_LOCK = Lock()
+
+
+def _cache_search_results(key, value):
+    r_client.set(key, cPickle.dumps(value, cPickle.HIGHEST_PROTOCOL),
+                 ex=qdb.util.SEARCH_CACHE_TTL)
+
+
+def _cached_search_results(key):
+    """Returns the cached results of a search, or None if they are missing"""
+    cached = r_client.get(key)
+    qdb.util.record_search_cache_access(cached is not None)
+    return None if cached is None else cPickle.loads(cached)
+
+
 class QiitaStudySearch(object):
-    """QiitaStudySearch object to parse and run searches on studies."""
+    """QiitaStudySearch object to parse and run searches on studies.
+
+    The results of the searches are cached in redis, keyed by the generated
+    SQL, the portal and the studies the search runs on, so equivalent
+    searches of users that can access the same studies share the results.
+    See `qiita_db.util.invalidate_search_cache`
+    """
 
     def __init__(self):
         # column names from study table
         self.study_cols = set(qdb.util.get_table_cols("study"))
+        # the normalized search and the studies of the last search, which
+        # key its cached results
+        self._cache_args = None
 
     def __call__(self, searchstr, user):
         """Runs a Study query and returns matching studies and samples
@@ -192,33 +303,131 @@ class QiitaStudySearch(object):
         Metadata column names and string searches are case-sensitive
         """
         with qdb.sql_connection.TRN:
-            study_sql, sample_sql, meta_headers = \
-                self._parse_study_search_string(searchstr, True)
-
-            # get all studies containing the metadata headers requested
-            qdb.sql_connection.TRN.add(study_sql)
+            index = qiita_config.search_metadata_index
+            study_sql, sample_sql, meta_headers = self._search_plan(
+                searchstr, True, index)
+
+            # get all studies containing the metadata headers requested that
+            # the user has access to
+            access_sql, access_args = qdb.util.study_access_sql(user)
+            qdb.sql_connection.TRN.add(
+                "%s INTERSECT %s" % (study_sql, access_sql), access_args)
             study_ids = set(qdb.sql_connection.TRN.execute_fetchflatten())
-            # strip to only studies user has access to
-            if user.level not in {'admin', 'dev', 'superuser'}:
-                studies = qdb.study.Study.get_by_status('public') | \
-                    user.user_studies | user.shared_studies
-                study_ids = study_ids.intersection([s.id for s in studies])
+
+            self._cache_args = ([sample_sql, str(index)], study_ids)
+            key = qdb.util.search_cache_key('samples', *self._cache_args)
+            results = _cached_search_results(key)
+            if results is not None:
+                self.results = results
+                self.meta_headers = meta_headers
+                return results, meta_headers
 
             results = {}
-            # run search on each study to get out the matching samples
-            for sid in study_ids:
-                qdb.sql_connection.TRN.add(sample_sql.format(sid))
-                study_res = qdb.sql_connection.TRN.execute_fetchindex()
-                if study_res:
-                    # only add study to results if actually has samples
-                    # in results
-                    results[sid] = study_res
+            if study_ids and index:
+                qdb.sql_connection.TRN.add(
+                    sample_sql, {'study_ids': tuple(study_ids)})
+                for row in qdb.sql_connection.TRN.execute_fetchindex():
+                    results.setdefault(row[0], []).append(row[1:])
+            elif study_ids:
+                # run the search on all the studies in a single query, each
+                # row starts with the study id of the sample
+                sql = " UNION ALL ".join(
+                    "SELECT {0} AS search_study_id, s.* "
+                    "FROM ({1}) AS s".format(sid, sample_sql.format(sid))
+                    for sid in sorted(study_ids))
+                qdb.sql_connection.TRN.add(sql)
+                for row in qdb.sql_connection.TRN.execute_fetchindex():
+                    # only studies with samples in the results are added
+                    results.setdefault(row[0], []).append(row[1:])
+            self._restore_integer_values(results, meta_headers)
+            # the results are only cached if they are computed from committed
+            # data
+            qdb.sql_connection.TRN.add_post_commit_func(
+                _cache_search_results, key, results)
             self.results = results
             self.meta_headers = meta_headers
             return results, meta_headers
 
+    def _restore_integer_values(self, results, meta_headers):
+        """Converts the values of the integer sample columns back to int
+
+        The values of a metadata category get a single SQL type across all
+        the studies searched (float8 if any of the studies stores the
+        category as float8, or always when searching on the sample metadata
+        index), so the values of the studies in which the category is an
+        integer column are returned as floats.
+
+        Parameters
+        ----------
+        results : dict of {int: list of list}
+            The samples found in each study, as [sample_id, meta1, ...]. It
+            is modified in place
+        meta_headers : list of str
+            The metadata categories of the values, in order
+        """
+        headers = [(i, h.lower()) for i, h in enumerate(meta_headers, 1)
+                   if h not in self.study_cols]
+        if not results or not headers:
+            return
+        sql = """SELECT study_id, lower(column_name)
+                 FROM qiita.study_sample_columns
+                 WHERE study_id IN %s AND column_type = 'integer'"""
+        qdb.sql_connection.TRN.add(sql, [tuple(results)])
+        int_columns = defaultdict(set)
+        for study_id, column in qdb.sql_connection.TRN.execute_fetchindex():
+            int_columns[study_id].add(column)
+
+        for study_id, samples in viewitems(results):
+            positions = [i for i, h in headers if h in int_columns[study_id]]
+            for sample in samples:
+                for i in positions:
+                    if sample[i] is not None:
+                        sample[i] = int(sample[i])
+
+    def _search_plan(self, searchstr, only_with_processed_data=False,
+                     index=False):
+        """Returns the SQL queries of a search string, parsing it only once
+
+        Parameters
+        ----------
+        searchstr : str
+            The string to parse
+        only_with_processed_data : bool
+            Whether or not to return studies with processed data.
+        index : bool, optional
+            Whether the samples are searched on the sample metadata index.
+            Default: False
+
+        Returns
+        -------
+        study_sql : str
+            SQL query for selecting studies with the required metadata columns
+        sample_sql : str
+            SQL query for each study to get the sample ids that mach the query
+        meta_headers : list
+            metadata categories in the query string
+
+        See Also
+        --------
+        _parse_study_search_string
+        """
+        key = (searchstr, only_with_processed_data, index,
+               qiita_config.portal)
+        with _PLAN_CACHE_LOCK:
+            plan = _PLAN_CACHE.get(key)
+        if plan is None:
+            plan = self._parse_study_search_string(
+                searchstr, only_with_processed_data, index)
+            with _PLAN_CACHE_LOCK:
+                _PLAN_CACHE[key] = plan
+                while len(_PLAN_CACHE) > PLAN_CACHE_SIZE:
+                    _PLAN_CACHE.popitem(last=False)
+        study_sql, sample_sql, meta_headers = plan
+        return study_sql, sample_sql, list(meta_headers)
+
     def _parse_study_search_string(self, searchstr,
-                                   only_with_processed_data=False):
+                                   only_with_processed_data=False,
+                                   index=False):
         """parses string into SQL query for study search
 
         Parameters
@@ -227,47 +436,30 @@ class QiitaStudySearch(object):
             The string to parse
         only_with_processed_data : bool
             Whether or not to return studies with processed data.
+        index : bool, optional
+            Whether the sample query reads the sample metadata from the
+            qiita.sample_metadata_index table instead of the study sample
+            tables. Default: False
 
         Returns
         -------
         study_sql : str
             SQL query for selecting studies with the required metadata columns
         sample_sql : str
-            SQL query for each study to get the sample ids that mach the query
+            If `index` is False, SQL query for each study to get the sample
+            ids that mach the query, with the study id as format placeholder.
+            Otherwise, SQL query to get the study and sample ids that match
+            the query on all the studies passed as the `study_ids` parameter
         meta_headers : list
             metadata categories in the query string in alphabetical order
 
         Notes
         -----
         All searches are case-sensitive
-
-        References
-        ----------
-        .. [1] McGuire P (2007) Getting started with pyparsing.
         """
-        # build the parse grammar
-        category = Word(alphas + nums + "_")
-        seperator = oneOf("> < = >= <= !=") | CaselessLiteral("includes") | \
-            CaselessLiteral("startswith")
-        value = Word(alphas + nums + "_" + ":" + ".") | \
-            dblQuotedString().setParseAction(removeQuotes)
-        criterion = Group(category + seperator + value)
-        criterion.setParseAction(SearchTerm)
-        and_ = CaselessLiteral("and")
-        or_ = CaselessLiteral("or")
-        not_ = CaselessLiteral("not")
-        optional_seps = Optional(and_ | or_ | not_)
-
-        # create the grammar for parsing operators AND, OR, NOT
-        search_expr = operatorPrecedence(
-            criterion, [
-                (not_, 1, opAssoc.RIGHT, SearchNot),
-                (and_, 2, opAssoc.LEFT, SearchAnd),
-                (or_, 2, opAssoc.LEFT, SearchOr)])
-
         # parse the search string to get out the SQL WHERE formatted query
-        eval_stack = (search_expr + stringEnd).parseString(searchstr)[0]
-        sql_where = eval_stack.generate_sql()
+        eval_stack = _SEARCH_GRAMMAR.parseString(searchstr)[0]
+        sql_where = eval_stack.generate_sql(index)
 
         # this lookup will be used to select only studies with columns
         # of the correct type
@@ -275,11 +467,11 @@ class QiitaStudySearch(object):
 
         # parse out all metadata headers we need to have in a study, and
         # their corresponding types
-        all_headers = [c[0][0].term[0] for c in
-                       (criterion + optional_seps).scanString(searchstr)]
+        criteria = [c[0][0].term
+                    for c in _CRITERION_GRAMMAR.scanString(searchstr)]
+        all_headers = [c[0] for c in criteria]
         meta_headers = set(all_headers)
-        all_types = [c[0][0].term[2] for c in
-                     (criterion + optional_seps).scanString(searchstr)]
+        all_types = [c[2] for c in criteria]
         all_types = [type_lookup[type(qdb.util.convert_type(s))]
                      for s in all_types]
 
@@ -344,6 +536,11 @@ class QiitaStudySearch(object):
                    "WHERE portal = '%s'" % qiita_config.portal)
         study_sql = ' INTERSECT '.join(sql)
 
+        if index:
+            sample_sql = self._index_sample_sql(
+                meta_header_type_lookup, meta_headers, sql_where)
+            return study_sql, sample_sql, meta_header_type_lookup.keys()
+
         # create  the sample finding SQL, getting both sample id and values
         # build the sql formatted list of metadata headers
         header_info = []
@@ -362,6 +559,62 @@ class QiitaStudySearch(object):
                       (','.join(header_info), sql_where))
         return study_sql, sample_sql, meta_header_type_lookup.keys()
 
+    def _index_sample_sql(self, header_types, sample_headers, sql_where):
+        """Builds the sample finding SQL over the sample metadata index
+
+        Parameters
+        ----------
+        header_types : dict of {str: str}
+            The SQL type of each metadata category in the query string
+        sample_headers : tuple of str
+            The metadata categories that are stored in the sample templates
+        sql_where : str
+            The SQL WHERE formatted query
+
+        Returns
+        -------
+        str
+            SQL query to get the study id, the sample id and the metadata
+            values of the samples that match the query. It expects the tuple
+            of study ids to search on as the `study_ids` parameter
+        """
+        header_info = []
+        for meta in header_types:
+            if meta in self.study_cols:
+                header_info.append("st.%s" % meta)
+            else:
+                header_info.append(_index_column(
+                    meta, header_types[meta] in ('integer', 'float8')))
+
+        pivot = ""
+        if sample_headers:
+            # pivot the metadata values so each sample is a single row, with
+            # the text and the numeric value of each category as columns
+            names = sorted(set(m.lower() for m in sample_headers))
+            values = []
+            for name in names:
+                values.append(
+                    "MAX(CASE WHEN column_name = '{0}' THEN value_text END) "
+                    "AS {0}__text".format(name))
+                values.append(
+                    "MAX(CASE WHEN column_name = '{0}' THEN value_num END) "
+                    "AS {0}__num".format(name))
+            pivot = ("LEFT JOIN (SELECT sample_id, %s "
+                     "FROM qiita.sample_metadata_index "
+                     "WHERE study_id IN %%(study_ids)s "
+                     "AND column_name IN (%s) "
+                     "GROUP BY sample_id) p ON p.sample_id = ss.sample_id " %
+                     (', '.join(values),
+                      ', '.join("'%s'" % n for n in names)))
+
+        return ("SELECT ss.study_id, ss.sample_id,%s "
+                "FROM qiita.study_sample ss "
+                "JOIN qiita.study st ON st.study_id = ss.study_id "
+                "%sWHERE ss.study_id IN %%(study_ids)s AND %s" %
+                (','.join(header_info), pivot,
+                 # the query is executed with parameters
+                 sql_where.replace('%', '%%')))
+
     def filter_by_processed_data(self, datatypes=None):
         """Filters results to what is available in each processed data
 
@@ -387,6 +640,16 @@ class QiitaStudySearch(object):
             if datatypes is not None:
                 # convert to set for easy lookups
                 datatypes = set(datatypes)
+            key = None
+            if self._cache_args is not None:
+                plan, study_ids = self._cache_args
+                key = qdb.util.search_cache_key(
+                    'processed',
+                    plan + (['*'] if datatypes is None else sorted(datatypes)),
+                    study_ids)
+                cached = _cached_search_results(key)
+                if cached is not None:
+                    return cached
             study_proc_ids = {}
             proc_data_samples = {}
             samples_meta = {}
@@ -417,4 +680,8 @@ class QiitaStudySearch(object):
                         proc_data_samples[artifact.id] = sorted(filter_samps)
                         study_proc_ids[study_id][datatype].append(artifact.id)
 
+            if key is not None:
+                qdb.sql_connection.TRN.add_post_commit_func(
+                    _cache_search_results, key,
+                    (study_proc_ids, proc_data_samples, samples_meta))
             return study_proc_ids, proc_data_samples, samples_meta
@@ -117,6 +117,27 @@ class Command(qdb.base.QiitaObject):
             qdb.sql_connection.TRN.add(sql, [id_])
             return qdb.sql_connection.TRN.execute_fetchlast()
 
+    @classmethod
+    def _check_ids(cls, ids):
+        """Returns which of the provided IDs exist in the database
+
+        Parameters
+        ----------
+        ids : list of int
+            The IDs to test
+
+        Notes
+        -----
+        This function overwrites the base function, as the sql layout doesn't
+        follow the same conventions done in the other classes.
+        """
+        with qdb.sql_connection.TRN:
+            sql = """SELECT command_id
+                     FROM qiita.software_command
+                     WHERE command_id IN %s"""
+            qdb.sql_connection.TRN.add(sql, [tuple(ids)])
+            return set(qdb.sql_connection.TRN.execute_fetchflatten())
+
     @classmethod
     def exists(cls, software, name):
         """Checks if the command already exists in the system
@@ -8,8 +8,10 @@ This modules provides wrappers for the psycopg2 module to allow easy use of
 transaction blocks and SQL execution/data retrieval.
 
 This module provides the variable TRN, which is the transaction available
-to use in the system. The singleton pattern is applied and this works as long
-as the system remains single-threaded.
+to use in the system. The singleton pattern is applied, but the state of the
+transaction is kept per thread: each thread checks out its own connection
+from a connection pool when it enters the outermost context and returns it
+when it leaves, so independent requests run on independent connections.
 
 Classes
 -------
@@ -18,6 +20,7 @@ Classes
    :toctree: generated/
 
    SQLConnectionHandler
+   ConnectionPool
    Transaction
 
 Examples
@@ -128,9 +131,17 @@ transaction (represented by entering to the context) is exited:
 # -----------------------------------------------------------------------------
 from __future__ import division
 from contextlib import contextmanager
-from itertools import chain
+from itertools import chain, groupby
+from operator import itemgetter
 from functools import partial, wraps
 from datetime import date, time, datetime
+from threading import Condition, local
+from timeit import default_timer
+from math import isnan, isinf
+import re
+from uuid import uuid4
+
+from six import binary_type, text_type
 
 from psycopg2 import (connect, ProgrammingError, Error as PostgresError,
                       OperationalError)
@@ -499,6 +510,392 @@ class SQLConnectionHandler(object):
         return result
 
 
+def _connection_error(e):
+    """Builds a useful RuntimeError from an error raised by psycopg2.connect
+
+    Parameters
+    ----------
+    e : psycopg2.OperationalError
+        The error raised when connecting to the database
+
+    Returns
+    -------
+    RuntimeError
+        The error with information on how to fix the connection problem
+    """
+    # catch three known common exceptions and raise runtime errors
+    try:
+        etype = e.message.split(':')[1].split()[0]
+    except IndexError:
+        # we recieved a really unanticipated error without a colon
+        etype = ''
+    if etype == 'database':
+        etext = ('This is likely because the database `%s` has not '
+                 'been created or has been dropped.' %
+                 qiita_config.database)
+    elif etype == 'role':
+        etext = ('This is likely because the user string `%s` '
+                 'supplied in your configuration file `%s` is '
+                 'incorrect or not an authorized postgres user.' %
+                 (qiita_config.user, qiita_config.conf_fp))
+    elif etype == 'Connection':
+        etext = ('This is likely because postgres isn\'t '
+                 'running. Check that postgres is correctly '
+                 'installed and is running.')
+    else:
+        # we recieved a really unanticipated error with a colon
+        etext = ''
+    ebase = ('An OperationalError with the following message occured'
+             '\n\n\t%s\n%s For more information, review `INSTALL.md`'
+             ' in the Qiita installation base directory.')
+    return RuntimeError(ebase % (e.message, etext))
+
+
+class ConnectionPool(object):
+    """A thread-safe pool of postgres connections
+
+    Connections are opened lazily, up to `maxconn` connections at the same
+    time. Once the pool is full, `getconn` blocks until another thread
+    returns a connection. Up to `minconn` connections are kept open when
+    they are returned to the pool; the rest are closed.
+
+    Parameters
+    ----------
+    minconn : int
+        The number of connections to keep open
+    maxconn : int
+        The maximum number of connections open at the same time
+    conn_args : dict
+        The keyword arguments passed to psycopg2.connect
+
+    Raises
+    ------
+    ValueError
+        If `maxconn` is lower than 1 or `minconn` is not between 0 and
+        `maxconn`
+    """
+    def __init__(self, minconn, maxconn, conn_args):
+        if maxconn < 1:
+            raise ValueError("maxconn should be at least 1, found %d"
+                             % maxconn)
+        if not 0 <= minconn <= maxconn:
+            raise ValueError("minconn should be between 0 and %d, found %d"
+                             % (maxconn, minconn))
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self._conn_args = conn_args
+        self._cond = Condition()
+        # The connections that are open and available to be checked out
+        self._idle = []
+        # The number of connections open, either idle or checked out
+        self._size = 0
+        self._checkouts = 0
+        self._waits = 0
+        self._wait_time = 0.0
+        self._max_wait_time = 0.0
+
+    def getconn(self):
+        """Checks out a connection from the pool
+
+        Returns
+        -------
+        psycopg2.connection
+            An open connection that is not used by anybody else
+
+        Raises
+        ------
+        RuntimeError
+            If a new connection is needed and it can't be opened
+        """
+        start = default_timer()
+        with self._cond:
+            waited = False
+            while True:
+                # Discard the idle connections that were closed on our back
+                while self._idle and self._idle[-1].closed != 0:
+                    self._idle.pop()
+                    self._size -= 1
+                if self._idle:
+                    conn = self._idle.pop()
+                    break
+                if self._size < self.maxconn:
+                    # Reserve the slot, the connection is opened outside the
+                    # lock so the other threads are not blocked meanwhile
+                    conn = None
+                    self._size += 1
+                    break
+                waited = True
+                self._cond.wait()
+
+            wait_time = default_timer() - start
+            self._checkouts += 1
+            if waited:
+                self._waits += 1
+            self._wait_time += wait_time
+            self._max_wait_time = max(self._max_wait_time, wait_time)
+
+        if conn is None:
+            try:
+                conn = connect(**self._conn_args)
+            except OperationalError as e:
+                self._release_slot()
+                raise _connection_error(e)
+            except Exception:
+                self._release_slot()
+                raise
+        return conn
+
+    def _release_slot(self):
+        """Frees the slot of a connection that is no longer open"""
+        with self._cond:
+            self._size -= 1
+            self._cond.notify()
+
+    def putconn(self, conn):
+        """Returns a connection to the pool
+
+        Parameters
+        ----------
+        conn : psycopg2.connection
+            The connection checked out with `getconn`
+        """
+        if conn.closed == 0 and \
+                conn.get_transaction_status() != TRANSACTION_STATUS_IDLE:
+            # Never hand out a connection in the middle of a transaction
+            try:
+                conn.rollback()
+            except PostgresError:
+                conn.close()
+
+        with self._cond:
+            if conn.closed != 0:
+                self._size -= 1
+            elif len(self._idle) >= self.minconn:
+                conn.close()
+                self._size -= 1
+            else:
+                self._idle.append(conn)
+            self._cond.notify()
+
+    def closeall(self):
+        """Closes all the idle connections of the pool
+
+        Connections currently checked out are not affected, they are closed
+        when they are returned to the pool if the pool has already `minconn`
+        idle connections.
+        """
+        with self._cond:
+            for conn in self._idle:
+                conn.close()
+            self._size -= len(self._idle)
+            self._idle = []
+            self._cond.notify_all()
+
+    @property
+    def stats(self):
+        """Usage statistics of the pool
+
+        Returns
+        -------
+        dict of {str: int or float}
+            The number of open connections (`size`), idle connections
+            (`idle`) and connections in use (`in_use`), the total number of
+            checkouts (`checkouts`), the number of checkouts that had to wait
+            for a connection to be returned (`waits`) and the total and
+            maximum time, in seconds, spent waiting for a connection
+            (`wait_time` and `max_wait_time`)
+        """
+        with self._cond:
+            return {'size': self._size,
+                    'idle': len(self._idle),
+                    'in_use': self._size - len(self._idle),
+                    'checkouts': self._checkouts,
+                    'waits': self._waits,
+                    'wait_time': self._wait_time,
+                    'max_wait_time': self._max_wait_time}
+
+
+# The maximum number of queries sent to the server in a single round trip
+# when executing a run of identical queries
+BATCH_PAGE_SIZE = 500
+
+# The number of rows retrieved on each round trip when reading the results of
+# a query through a server-side cursor
+FETCH_CHUNK_SIZE = 2000
+
+# INSERT queries with a VALUES clause. Consecutive executions of these
+# queries can be collapsed into a single INSERT with all their rows in the
+# VALUES clause
+_VALUES_INSERT_RE = re.compile(
+    r"^(\s*INSERT\s+INTO\s+[^()]+?(?:\([^()]*\))?\s*VALUES\s*)(\(.*\))"
+    r"(\s*;?\s*)$", re.IGNORECASE | re.DOTALL)
+
+# Queries that modify the database and never return rows
+_NO_RESULTS_RE = re.compile(r"^\s*(INSERT|UPDATE|DELETE)\s",
+                            re.IGNORECASE)
+_RETURNING_RE = re.compile(r"\bRETURNING\b", re.IGNORECASE)
+
+
+def _to_bytes(sql):
+    """Encodes `sql` so it can be joined with the output of mogrify"""
+    return sql if isinstance(sql, bytes) else sql.encode('utf-8')
+
+
+def _batch_plan(sql):
+    """Decides how a run of identical queries can be batched
+
+    Parameters
+    ----------
+    sql : str
+        The SQL query executed multiple times in a row
+
+    Returns
+    -------
+    tuple of (str, tuple of str or None)
+        The batching strategy and, for the 'values' strategy, the prefix,
+        the rows template and the suffix of the INSERT query. The strategy is
+        'values' if the query can be collapsed into a multi-row INSERT,
+        'join' if the query can be sent joined in a single round trip or None
+        if the queries should be executed one by one.
+
+    Notes
+    -----
+    Only the queries that don't return rows are batched. Postgres does not
+    guarantee the order of the rows returned by a multi-row INSERT, so the
+    queries with a RETURNING clause are executed one by one to keep their
+    results apart.
+    """
+    if not _NO_RESULTS_RE.match(sql) or _RETURNING_RE.search(sql):
+        return None, None
+    match = _VALUES_INSERT_RE.match(sql)
+    # The prefix and suffix are sent as is to the server, so they should not
+    # contain any placeholder or escaped percent sign
+    if match and '%' not in match.group(1) + match.group(3):
+        return 'values', match.groups()
+    return 'join', None
+
+
+def _copy_encode(value):
+    """Encodes a value using the text format of the COPY command
+
+    Parameters
+    ----------
+    value : object
+        A python value: None, bool, int, float, str, datetime or any object
+        whose string representation is understood by postgres
+
+    Returns
+    -------
+    bytes
+        The encoded value, ready to be written in a COPY stream
+    """
+    if value is None:
+        return b'\\N'
+    if isinstance(value, bool):
+        return b't' if value else b'f'
+    if isinstance(value, float):
+        if isnan(value):
+            return b'NaN'
+        if isinf(value):
+            return b'Infinity' if value > 0 else b'-Infinity'
+        value = repr(value)
+    elif isinstance(value, (date, time, datetime)):
+        value = value.isoformat()
+    elif not isinstance(value, (text_type, binary_type)):
+        value = str(value)
+
+    if isinstance(value, text_type):
+        value = value.encode('utf-8')
+    # Backslash should be the first one, so we don't escape the escapes
+    return (value.replace(b'\\', b'\\\\').replace(b'\t', b'\\t')
+            .replace(b'\n', b'\\n').replace(b'\r', b'\\r'))
+
+
+class LineStream(object):
+    """Read-only file-like object over an iterator of lines
+
+    The lines are consumed while the stream is read, so they are never fully
+    materialized in memory.
+
+    Parameters
+    ----------
+    lines : iterator of str
+        The lines to read
+    empty : str, optional
+        The empty line, which defines the type (bytes or text) of the data
+        returned by the stream. Default: b''
+    """
+    def __init__(self, lines, empty=b''):
+        self._lines = lines
+        self._empty = empty
+        self._buffer = empty
+
+    def read(self, size=-1):
+        chunks = [self._buffer]
+        length = len(self._buffer)
+        while size < 0 or length < size:
+            try:
+                line = next(self._lines)
+            except StopIteration:
+                break
+            chunks.append(line)
+            length += len(line)
+        data = self._empty.join(chunks)
+        if size < 0:
+            size = len(data)
+        self._buffer = data[size:]
+        return data[:size]
+
+    def readline(self, size=-1):
+        if self._buffer:
+            line, self._buffer = self._buffer, self._empty
+            return line
+        return next(self._lines, self._empty)
+
+    def __iter__(self):
+        return iter(self.readline, self._empty)
+
+
+class _CopyStream(LineStream):
+    """Read-only file-like object that encodes rows for COPY FROM STDIN
+
+    The rows are encoded on demand while postgres reads from the stream, so
+    the data is never fully materialized in memory.
+
+    Parameters
+    ----------
+    rows : iterable of iterables
+        The rows to encode
+    """
+    def __init__(self, rows):
+        super(_CopyStream, self).__init__(
+            (b'\t'.join(_copy_encode(v) for v in row) + b'\n'
+             for row in rows))
+
+
+def _thread_local_attr(name):
+    """Creates a property that proxies the thread-local attribute `name`"""
+    def getter(self):
+        return getattr(self._local, name)
+
+    def setter(self, value):
+        setattr(self._local, name, value)
+
+    return property(getter, setter)
+
+
+class _TransactionState(local):
+    """The state of a transaction in the current thread"""
+    def __init__(self):
+        self.queries = []
+        self.results = []
+        self.contexts_entered = 0
+        self.connection = None
+        self.post_commit_funcs = []
+        self.post_rollback_funcs = []
+        self.cache = {}
+
+
 def _checker(func):
     """Decorator to check that methods are executed inside the context"""
     @wraps(func)
@@ -526,57 +923,75 @@ class Transaction(object):
     -----
     When the execution leaves the context manager, any remaining queries in
     the transaction will be executed and committed.
+
+    The state of the transaction (queries, results, contexts entered and
+    connection) is kept per thread. The connection is checked out from a
+    `ConnectionPool` when the thread enters the outermost context and it is
+    returned to the pool when the thread leaves it.
     """
+    _queries = _thread_local_attr('queries')
+    _results = _thread_local_attr('results')
+    _contexts_entered = _thread_local_attr('contexts_entered')
+    _connection = _thread_local_attr('connection')
+    _post_commit_funcs = _thread_local_attr('post_commit_funcs')
+    _post_rollback_funcs = _thread_local_attr('post_rollback_funcs')
+    _cache = _thread_local_attr('cache')
+
     def __init__(self):
-        self._queries = []
-        self._results = []
-        self._contexts_entered = 0
-        self._connection = None
-        self._post_commit_funcs = []
-        self._post_rollback_funcs = []
+        self._local = _TransactionState()
+        self._pool = None
+
+    @property
+    def pool(self):
+        """The connection pool used by the transaction
+
+        Returns
+        -------
+        ConnectionPool
+            The pool, created on first use with the sizes provided in the
+            configuration file
+        """
+        if self._pool is None:
+            self._pool = ConnectionPool(
+                qiita_config.pool_min_size, qiita_config.pool_max_size,
+                {'user': qiita_config.user,
+                 'password': qiita_config.password,
+                 'database': qiita_config.database,
+                 'host': qiita_config.host,
+                 'port': qiita_config.port})
+        return self._pool
+
+    @property
+    def pool_stats(self):
+        """Usage statistics of the connection pool
+
+        See Also
+        --------
+        ConnectionPool.stats
+        """
+        return self.pool.stats
 
     def _open_connection(self):
         # If the connection already exists and is not closed, don't do anything
         if self._connection is not None and self._connection.closed == 0:
             return
 
-        try:
-            self._connection = connect(user=qiita_config.user,
-                                       password=qiita_config.password,
-                                       database=qiita_config.database,
-                                       host=qiita_config.host,
-                                       port=qiita_config.port)
-        except OperationalError as e:
-            # catch three known common exceptions and raise runtime errors
-            try:
-                etype = e.message.split(':')[1].split()[0]
-            except IndexError:
-                # we recieved a really unanticipated error without a colon
-                etype = ''
-            if etype == 'database':
-                etext = ('This is likely because the database `%s` has not '
-                         'been created or has been dropped.' %
-                         qiita_config.database)
-            elif etype == 'role':
-                etext = ('This is likely because the user string `%s` '
-                         'supplied in your configuration file `%s` is '
-                         'incorrect or not an authorized postgres user.' %
-                         (qiita_config.user, qiita_config.conf_fp))
-            elif etype == 'Connection':
-                etext = ('This is likely because postgres isn\'t '
-                         'running. Check that postgres is correctly '
-                         'installed and is running.')
-            else:
-                # we recieved a really unanticipated error with a colon
-                etext = ''
-            ebase = ('An OperationalError with the following message occured'
-                     '\n\n\t%s\n%s For more information, review `INSTALL.md`'
-                     ' in the Qiita installation base directory.')
-            raise RuntimeError(ebase % (e.message, etext))
+        # The connection was closed (e.g. a commit failed), give its slot
+        # back before checking out a new one
+        self._release_connection()
+        self._connection = self.pool.getconn()
 
-    def close(self):
+    def _release_connection(self):
+        """Returns the connection of the current thread to the pool"""
         if self._connection is not None:
-            self._connection.close()
+            conn = self._connection
+            self._connection = None
+            self.pool.putconn(conn)
+
+    def close(self):
+        self._release_connection()
+        if self._pool is not None:
+            self._pool.closeall()
 
     @contextmanager
     def _get_cursor(self):
@@ -627,11 +1042,14 @@ class Transaction(object):
         # that we are entering
         if self._contexts_entered == 1:
             # We need to wrap the entire function in a try/finally because
-            # at the end we need to decrement _contexts_entered
+            # at the end we need to decrement _contexts_entered and give the
+            # connection back to the pool
             try:
                 self._clean_up(exc_type)
             finally:
                 self._contexts_entered -= 1
+                self._cache = {}
+                self._release_connection()
         else:
             self._contexts_entered -= 1
 
@@ -696,38 +1114,110 @@ class Transaction(object):
         transaction
         """
         with self._get_cursor() as cur:
-            for sql, sql_args in self._queries:
-                # Execute the current SQL command
-                try:
-                    cur.execute(sql, sql_args)
-                except Exception as e:
-                    # We catch any exception as we want to make sure that we
-                    # rollback every time that something went wrong
-                    self._raise_execution_error(sql, sql_args, e)
-
-                try:
-                    res = cur.fetchall()
-                except ProgrammingError as e:
-                    # At this execution point, we don't know if the sql query
-                    # that we executed should retrieve values from the database
-                    # If the query was not supposed to retrieve any value
-                    # (e.g. an INSERT without a RETURNING clause), it will
-                    # raise a ProgrammingError. Otherwise it will just return
-                    # an empty list
-                    res = None
-                except PostgresError as e:
-                    # Some other error happened during the execution of the
-                    # query, so we need to rollback
-                    self._raise_execution_error(sql, sql_args, e)
-
-                # Store the results of the current query
-                self._results.append(res)
+            # Consecutive queries with the same SQL (e.g. the ones added with
+            # many=True) are executed in batches to avoid a round trip to
+            # the server per query
+            for sql, group in groupby(self._queries, key=itemgetter(0)):
+                args_list = [args for _, args in group]
+                strategy, parts = (_batch_plan(sql) if len(args_list) > 1
+                                   else (None, None))
+                if strategy is None:
+                    for sql_args in args_list:
+                        self._results.append(
+                            self._execute_single(cur, sql, sql_args))
+                else:
+                    for i in range(0, len(args_list), BATCH_PAGE_SIZE):
+                        self._results.extend(self._execute_batch(
+                            cur, sql, args_list[i:i + BATCH_PAGE_SIZE],
+                            strategy, parts))
 
         # wipe out the already executed queries
         self._queries = []
 
         return self._results
 
+    def _execute_single(self, cur, sql, sql_args):
+        """Executes a single query
+
+        Parameters
+        ----------
+        cur : psycopg2.cursor
+            The cursor used to execute the query
+        sql : str
+            The SQL query
+        sql_args : list, tuple or dict of objects
+            The arguments to the SQL query
+
+        Returns
+        -------
+        list of DictRow or None
+            The results of the query or None if the query does not retrieve
+            any value
+        """
+        try:
+            cur.execute(sql, sql_args)
+        except Exception as e:
+            # We catch any exception as we want to make sure that we
+            # rollback every time that something went wrong
+            self._raise_execution_error(sql, sql_args, e)
+
+        try:
+            res = cur.fetchall()
+        except ProgrammingError as e:
+            # At this execution point, we don't know if the sql query
+            # that we executed should retrieve values from the database
+            # If the query was not supposed to retrieve any value
+            # (e.g. an INSERT without a RETURNING clause), it will
+            # raise a ProgrammingError. Otherwise it will just return
+            # an empty list
+            res = None
+        except PostgresError as e:
+            # Some other error happened during the execution of the
+            # query, so we need to rollback
+            self._raise_execution_error(sql, sql_args, e)
+
+        return res
+
+    def _execute_batch(self, cur, sql, args_list, strategy, parts):
+        """Executes the same query multiple times in a single round trip
+
+        Parameters
+        ----------
+        cur : psycopg2.cursor
+            The cursor used to execute the queries
+        sql : str
+            The SQL query
+        args_list : list of list, tuple or dict of objects
+            The arguments for each of the executions of the query
+        strategy : {'values', 'join'}
+            How to batch the queries, as returned by `_batch_plan`
+        parts : tuple of str or None
+            The prefix, rows template and suffix of the query if `strategy`
+            is 'values'
+
+        Returns
+        -------
+        list of None
+            The results of each execution of the query, as if they were
+            executed one by one. The batched queries never return rows
+        """
+        try:
+            if strategy == 'values':
+                prefix, row, suffix = parts
+                values = b",".join(cur.mogrify(row, args)
+                                   for args in args_list)
+                cur.execute(b"".join([_to_bytes(prefix), values,
+                                      _to_bytes(suffix)]))
+            else:
+                cur.execute(b";".join(cur.mogrify(sql, args)
+                                      for args in args_list))
+        except Exception as e:
+            # We catch any exception as we want to make sure that we
+            # rollback every time that something went wrong
+            self._raise_execution_error(sql, args_list, e)
+
+        return [None] * len(args_list)
+
     @_checker
     def execute(self):
         """Executes the transaction
@@ -761,6 +1251,113 @@ class Transaction(object):
             self.rollback()
             raise
 
+    @_checker
+    def copy_from(self, table, columns, rows):
+        """Bulk loads `rows` in `table` using COPY FROM STDIN
+
+        Any query pending in the transaction is executed first, so the rows
+        are loaded in the same order in which they were added.
+
+        Parameters
+        ----------
+        table : str
+            The schema-qualified name of the table, e.g. qiita.sample_1
+        columns : list of str
+            The columns of the table, in the same order as the row values
+        rows : iterable of iterables
+            The values of each row. Only python types are supported (None,
+            bool, int, float, str, datetime) and they are encoded while
+            postgres reads them, so `rows` can be a generator
+
+        Raises
+        ------
+        RuntimeError
+            If invoked outside a context
+        ValueError
+            If there is an error loading the rows. The transaction is
+            rolled back.
+
+        Notes
+        -----
+        As with the queries, the table and column names should be provided
+        by the system and never come directly from the user.
+        """
+        if self._queries:
+            self.execute()
+
+        sql = "COPY {0} ({1}) FROM STDIN".format(table, ", ".join(columns))
+        with self._get_cursor() as cur:
+            try:
+                cur.copy_expert(sql, _CopyStream(rows))
+            except Exception as e:
+                # We catch any exception as we want to make sure that we
+                # rollback every time that something went wrong
+                self._raise_execution_error(sql, None, e)
+
+    @_checker
+    def execute_fetch_chunks(self, sql, sql_args=None, chunk_size=None):
+        """Runs `sql` on a server-side cursor and yields its rows in chunks
+
+        Any query pending in the transaction is executed first. The rows are
+        kept on the server and only `chunk_size` of them are transferred and
+        held in memory at a time, which makes this method suitable for
+        queries that return a large number of rows.
+
+        Parameters
+        ----------
+        sql : str
+            The SQL query
+        sql_args : list, tuple or dict, optional
+            The arguments of the SQL query
+        chunk_size : int, optional
+            The number of rows to retrieve on each round trip. Defaults to
+            FETCH_CHUNK_SIZE
+
+        Yields
+        ------
+        list of tuple
+            The next chunk of rows of the query result
+
+        Raises
+        ------
+        RuntimeError
+            If invoked outside a context
+        ValueError
+            If there is an error executing the query. The transaction is
+            rolled back.
+
+        Notes
+        -----
+        The returned generator needs to be consumed before leaving the
+        context, as the server-side cursor does not outlive the transaction.
+        """
+        if self._queries:
+            self.execute()
+
+        chunk_size = FETCH_CHUNK_SIZE if chunk_size is None else chunk_size
+        self._open_connection()
+        cur = self._connection.cursor(name="qiita_%s" % uuid4().hex)
+        cur.itersize = chunk_size
+        try:
+            try:
+                cur.execute(sql, sql_args)
+                chunk = cur.fetchmany(chunk_size)
+                while chunk:
+                    yield chunk
+                    chunk = cur.fetchmany(chunk_size)
+            except Exception as e:
+                # We catch any exception as we want to make sure that we
+                # rollback every time that something went wrong
+                self._raise_execution_error(sql, sql_args, e)
+        finally:
+            if not cur.closed and not self._connection.closed:
+                try:
+                    cur.close()
+                except PostgresError:
+                    # the transaction has been rolled back and the cursor
+                    # does not exist anymore on the server
+                    pass
+
     @_checker
     def execute_fetchlast(self):
         """Executes the transaction and returns the last result
@@ -879,9 +1476,11 @@ class Transaction(object):
         RuntimeError
             If invoked outside a context
         """
-        # Reset the queries, the results and the index
+        # Reset the queries, the results, the index and the cache, as the
+        # cached values may reflect changes that are being rolled back
         self._queries = []
         self._results = []
+        self._cache = {}
         try:
             self._connection.rollback()
         except Exception:
@@ -894,6 +1493,29 @@ class Transaction(object):
     def index(self):
         return len(self._queries) + len(self._results)
 
+    @property
+    @_checker
+    def cache(self):
+        """A cache scoped to the current transaction context
+
+        The cache is a dictionary that the callers can use to store values
+        read from the database (e.g. the ids already known to exist), so they
+        don't need to be queried again in the same transaction. It is wiped
+        out when the transaction is rolled back and when leaving the
+        outermost context.
+
+        Returns
+        -------
+        dict
+            The cache of the transaction in the current thread
+
+        Raises
+        ------
+        RuntimeError
+            If invoked outside a context
+        """
+        return self._cache
+
     @_checker
     def add_post_commit_func(self, func, *args, **kwargs):
         """Adds a post commit function
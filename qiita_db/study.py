@@ -464,6 +464,7 @@ class Study(qdb.base.QiitaObject):
             qdb.sql_connection.TRN.add(sql, args)
 
             qdb.sql_connection.TRN.execute()
+            cls._forget_validated(id_)
 
 
 # --- Attributes ---
@@ -1086,6 +1087,7 @@ class Study(qdb.base.QiitaObject):
                      VALUES (%s, %s)"""
             qdb.sql_connection.TRN.add(sql, [self._id, user.id])
             qdb.sql_connection.TRN.execute()
+            qdb.util.invalidate_filepath_access(user)
 
     def unshare(self, user):
         """Unshare the study with another user
@@ -1100,6 +1102,7 @@ class Study(qdb.base.QiitaObject):
                      WHERE study_id = %s AND email = %s"""
             qdb.sql_connection.TRN.add(sql, [self._id, user.id])
             qdb.sql_connection.TRN.execute()
+            qdb.util.invalidate_filepath_access(user)
 
 
 class StudyPerson(qdb.base.QiitaObject):
@@ -0,0 +1,62 @@
+-- Oct 18, 2026
+-- Adds a cross-study index of the sample metadata, so the search does not
+-- need to scan each of the qiita.sample_<study_id> tables
+
+CREATE TABLE qiita.sample_metadata_index (
+	study_id             bigint  NOT NULL,
+	sample_id            varchar  NOT NULL,
+	column_name          varchar  NOT NULL,
+	value_text           varchar  ,
+	value_num            float8  ,
+	CONSTRAINT pk_sample_metadata_index PRIMARY KEY ( sample_id, column_name ),
+	CONSTRAINT fk_sample_metadata_index_study FOREIGN KEY ( study_id ) REFERENCES qiita.study( study_id ),
+	CONSTRAINT fk_sample_metadata_index_sample FOREIGN KEY ( sample_id ) REFERENCES qiita.study_sample( sample_id ) ON UPDATE CASCADE ON DELETE CASCADE
+ );
+
+CREATE INDEX idx_sample_metadata_index_column ON qiita.sample_metadata_index ( column_name, study_id );
+
+CREATE INDEX idx_sample_metadata_index_num ON qiita.sample_metadata_index ( column_name, value_num );
+
+COMMENT ON TABLE qiita.sample_metadata_index IS 'One row per non-null metadata value of the sample templates. value_num is only set for numeric columns';
+
+-- (Re)builds the index rows of the study a_study_id. If a_samples and/or
+-- a_columns are provided, only the rows of those samples and/or columns
+-- are rebuilt
+CREATE FUNCTION qiita.index_sample_metadata(a_study_id bigint, a_samples varchar[], a_columns varchar[]) RETURNS void AS $$
+DECLARE
+    tbl     varchar := 'sample_' || a_study_id;
+    col     record;
+BEGIN
+    DELETE FROM qiita.sample_metadata_index
+        WHERE study_id = a_study_id
+            AND (a_samples IS NULL OR sample_id = ANY(a_samples))
+            AND (a_columns IS NULL OR column_name = ANY(a_columns));
+
+    FOR col IN
+        SELECT column_name, data_type
+            FROM information_schema.columns
+            WHERE table_schema = 'qiita'
+                AND table_name = tbl
+                AND column_name <> 'sample_id'
+                AND (a_columns IS NULL OR column_name::varchar = ANY(a_columns))
+    LOOP
+        EXECUTE format(
+            'INSERT INTO qiita.sample_metadata_index
+                (study_id, sample_id, column_name, value_text, value_num)
+             SELECT $1, sample_id, $2, %1$I::varchar, %2$s
+             FROM qiita.%3$I
+             WHERE %1$I IS NOT NULL
+                AND ($3 IS NULL OR sample_id = ANY($3))',
+            col.column_name,
+            CASE WHEN col.data_type IN ('integer', 'bigint', 'smallint', 'real', 'double precision', 'numeric')
+                THEN quote_ident(col.column_name) || '::float8'
+                ELSE 'NULL::float8' END,
+            tbl)
+        USING a_study_id, col.column_name, a_samples;
+    END LOOP;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Index the existing sample templates
+SELECT qiita.index_sample_metadata(study_id, NULL, NULL)
+    FROM (SELECT DISTINCT study_id FROM qiita.study_sample_columns) AS s;
@@ -0,0 +1,5 @@
+-- Oct 18, 2026
+-- Adds the md5 and sha256 checksum algorithms, which can be selected when
+-- inserting filepaths
+
+INSERT INTO qiita.checksum_algorithm (name) VALUES ('md5'), ('sha256');
@@ -671,3 +671,6 @@ INSERT INTO qiita.processing_job_workflow_root (processing_job_workflow_id, proc
 
 INSERT INTO qiita.parent_processing_job (parent_id, child_id)
     VALUES ('b72369f9-a886-4193-8d3d-f7b504168e75', 'd19f76ee-274e-4c1b-b3a2-a12d73507c55');
+
+-- Index the metadata of the sample template of study 1
+SELECT qiita.index_sample_metadata(1, NULL, NULL);
@@ -1,14 +1,17 @@
 from unittest import TestCase, main
-from os import remove
+from os import remove, close
 from os.path import exists, join
 from datetime import datetime
 from shutil import move
+from tempfile import mkstemp
 
 from future.utils import viewitems
-from biom import load_table
+from biom import load_table, Table
+from biom.util import biom_open
 import pandas as pd
 from pandas.util.testing import assert_frame_equal
 from functools import partial
+import numpy as np
 import numpy.testing as npt
 
 from qiita_core.util import qiita_test_checker
@@ -628,6 +631,60 @@ class TestAnalysis(TestCase):
         exp = [[1L, 15L, 2L], [1L, 16L, None], [1L, new_id, 2L]]
         self.assertEqual(obs, exp)
 
+    def test_load_biom_subset(self):
+        table = Table(np.array([[1, 0, 0], [0, 2, 0], [0, 0, 3]]),
+                      ['O1', 'O2', 'O3'], ['S1', 'S2', 'S3'])
+        fd, hdf5_fp = mkstemp(suffix='.biom')
+        close(fd)
+        fd, json_fp = mkstemp(suffix='.biom')
+        close(fd)
+        try:
+            with biom_open(hdf5_fp, 'w') as f:
+                table.to_hdf5(f, "test")
+            with open(json_fp, 'w') as f:
+                f.write(table.to_json("test"))
+
+            for fp in [hdf5_fp, json_fp]:
+                obs = qdb.analysis._load_biom_subset(fp, ['S3', 'S1', 'S9'])
+                self.assertEqual(list(obs.ids()), ['S1', 'S3'])
+                # the observations without values in the subset are dropped
+                self.assertEqual(list(obs.ids(axis='observation')),
+                                 ['O1', 'O3'])
+                self.assertEqual(obs.get_value_by_ids('O3', 'S3'), 3)
+                self.assertIsNone(
+                    qdb.analysis._load_biom_subset(fp, ['S9']))
+        finally:
+            remove(hdf5_fp)
+            remove(json_fp)
+
+    def test_merge_biom_parts(self):
+        t1 = Table(np.array([[1, 0], [2, 3]]), ['O1', 'O2'], ['S1', 'S2'],
+                   observation_metadata=[{'taxonomy': 'a'},
+                                         {'taxonomy': 'b'}])
+        t2 = Table(np.array([[4, 5], [6, 0]]), ['O3', 'O1'], ['S3', 'S2'],
+                   observation_metadata=[{'taxonomy': 'c'},
+                                         {'taxonomy': 'd'}])
+        t3 = Table(np.array([[7]]), ['O2'], ['S4'])
+        parts = [(t.matrix_data.tocoo(), list(t.ids(axis='observation')),
+                  list(t.ids()), t.metadata(axis='observation'),
+                  t.metadata()) for t in [t1, t2, t3]]
+
+        obs = qdb.analysis._merge_biom_parts(parts)
+        exp = t1.merge(t2).merge(t3)
+        self.assertEqual(list(obs.ids(axis='observation')),
+                         ['O1', 'O2', 'O3'])
+        self.assertEqual(list(obs.ids()), ['S1', 'S2', 'S3', 'S4'])
+        for sid in exp.ids():
+            for oid in exp.ids(axis='observation'):
+                self.assertEqual(obs.get_value_by_ids(oid, sid),
+                                 exp.get_value_by_ids(oid, sid))
+        # the metadata of the first table in which an id appears is kept
+        self.assertEqual(obs.metadata('O1', axis='observation'),
+                         {'taxonomy': 'a'})
+        self.assertEqual(obs.metadata('O3', axis='observation'),
+                         {'taxonomy': 'c'})
+        self.assertIsNone(obs.metadata(axis='sample'))
+
     def test_build_biom_tables_duplicated_samples_not_merge(self):
         grouped_samples = {'18S.1.3': [
             (4, ['1.SKB8.640193', '1.SKD8.640184', '1.SKB7.640196']),
@@ -553,6 +553,8 @@ class ArtifactTests(TestCase):
                 self.filepaths_processed, "Demultiplexed",
                 parents=[qdb.artifact.Artifact(1), new],
                 processing_parameters=parameters)
+        # The files staged before the transaction are back in place
+        self.assertTrue(exists(self.fp3))
 
     def test_create_root(self):
         fp_count = qdb.util.get_count('qiita.filepath')
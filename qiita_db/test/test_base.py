@@ -83,6 +83,68 @@ class QiitaBaseTest(TestCase):
         new = qdb.study.Study(1)
         self.assertNotEqual(self.tester, new)
 
+    def test_check_ids(self):
+        """Correctly returns the ids that exist on the database"""
+        obs = qdb.artifact.Artifact._check_ids([1, 2, 100])
+        self.assertEqual(obs, {1, 2})
+
+    def test_check_portals(self):
+        """Correctly returns the ids accessible in the portal given"""
+        qiita_config.portal = 'QIITA'
+        self.assertEqual(qdb.analysis.Analysis._check_portals([1, 2]),
+                         {1, 2})
+        qiita_config.portal = 'EMP'
+        self.assertEqual(qdb.analysis.Analysis._check_portals([1, 2]),
+                         set())
+
+    def test_instantiate_many(self):
+        """Instantiates all the objects validating them at once"""
+        obs = qdb.artifact.Artifact.instantiate_many([2, '1', 2])
+        exp = [qdb.artifact.Artifact(2), qdb.artifact.Artifact(1),
+               qdb.artifact.Artifact(2)]
+        self.assertEqual(obs, exp)
+
+        obs = qdb.user.User.instantiate_many(['test@foo.bar'])
+        self.assertEqual(obs, [qdb.user.User('test@foo.bar')])
+
+        self.assertEqual(qdb.artifact.Artifact.instantiate_many([]), [])
+
+    def test_instantiate_many_error(self):
+        """Raises an error if any of the objects can't be instantiated"""
+        with self.assertRaises(qdb.exceptions.QiitaDBUnknownIDError):
+            qdb.artifact.Artifact.instantiate_many([1, 100])
+
+        qiita_config.portal = 'EMP'
+        with self.assertRaises(qdb.exceptions.QiitaDBError):
+            qdb.analysis.Analysis.instantiate_many([1])
+
+        with self.assertRaises(IncompetentQiitaDeveloperError):
+            qdb.base.QiitaObject.instantiate_many([1])
+
+    def test_init_validated_cache(self):
+        """The ids are only validated once per transaction"""
+        with qdb.sql_connection.TRN:
+            qdb.artifact.Artifact(1)
+            self.assertEqual(qdb.artifact.Artifact._validated(),
+                             {(1, qiita_config.portal)})
+            qdb.artifact.Artifact._forget_validated(1)
+            self.assertEqual(qdb.artifact.Artifact._validated(), set())
+
+            qdb.analysis.Analysis(1)
+            # The ids are validated per portal
+            qiita_config.portal = 'EMP'
+            with self.assertRaises(qdb.exceptions.QiitaDBError):
+                qdb.analysis.Analysis(1)
+
+            qdb.sql_connection.TRN.rollback()
+            # The rollback invalidates the cache
+            self.assertEqual(qdb.analysis.Analysis._validated(), set())
+
+        # Leaving the transaction invalidates the cache
+        qdb.artifact.Artifact(1)
+        with qdb.sql_connection.TRN:
+            self.assertEqual(qdb.artifact.Artifact._validated(), set())
+
 
 @qiita_test_checker()
 class QiitaStatusObjectTest(TestCase):
@@ -10,6 +10,7 @@ from unittest import TestCase, main
 from datetime import datetime
 
 import pandas as pd
+from moi import r_client
 
 from qiita_core.qiita_settings import qiita_config
 from qiita_core.util import qiita_test_checker
@@ -107,6 +108,74 @@ class MetaUtilTests(TestCase):
             qdb.user.User('admin@foo.bar'))
         self.assertEqual(obs, exp)
 
+    def test_get_artifact_summary_info(self):
+        obs = qdb.meta_util.get_artifact_summary_info(2)
+        artifact = qdb.artifact.Artifact(2)
+        html_generator = qdb.software.Command.get_html_generator(
+            'Demultiplexed')
+        exp_jobs = [
+            {'id': '3c9991ab-6c14-4368-a48c-841e8837a79c', 'command_id': 3,
+             'command': 'Pick closed-reference OTUs',
+             'software_type': 'artifact transformation', 'status': 'success',
+             'step': None, 'log': None},
+            {'id': 'd19f76ee-274e-4c1b-b3a2-a12d73507c55', 'command_id': 3,
+             'command': 'Pick closed-reference OTUs',
+             'software_type': 'artifact transformation', 'status': 'error',
+             'step': 'generating demux file', 'log': 'Error message'}]
+        self.assertEqual(obs.pop('jobs'), exp_jobs)
+        self.assertItemsEqual(obs.pop('filepaths'), artifact.filepaths)
+        exp = {'name': artifact.name,
+               'artifact_type': 'Demultiplexed',
+               'visibility': 'private',
+               'can_be_submitted_to_ebi': True,
+               'is_submitted_to_ebi': True,
+               'can_be_submitted_to_vamps': True,
+               'is_submitted_to_vamps': False,
+               'study_id': 1,
+               'prep_template_ids': [1],
+               'html_generator_id': html_generator.id}
+        self.assertEqual(obs, exp)
+
+        with self.assertRaises(qdb.exceptions.QiitaDBUnknownIDError):
+            qdb.meta_util.get_artifact_summary_info(1000)
+
+    def test_check_filepath_access(self):
+        user = qdb.user.User('shared@foo.bar')
+        key = qdb.util.filepath_access_key(user.id)
+        r_client.delete(key)
+
+        self.assertTrue(qdb.meta_util.check_filepath_access(user, 1))
+        self.assertItemsEqual(
+            [int(fid) for fid in r_client.smembers(key)],
+            qdb.meta_util.get_accessible_filepath_ids(user))
+        self.assertFalse(qdb.meta_util.check_filepath_access(user, 100000))
+
+        # Unsharing the study drops the cached filepaths of the user, but
+        # not the ones of the other users
+        other_key = qdb.util.filepath_access_key('test@foo.bar')
+        qdb.study.Study(1).unshare(user)
+        user_key = qdb.util.filepath_access_key(user.id)
+        self.assertNotEqual(user_key, key)
+        self.assertEqual(qdb.util.filepath_access_key('test@foo.bar'),
+                         other_key)
+        self.assertFalse(qdb.meta_util.check_filepath_access(user, 1))
+        self.assertTrue(qdb.meta_util.check_filepath_access(user, 13))
+
+        # A set rebuilt from data read before an invalidation is stored under
+        # a key that is not read anymore
+        qdb.util.invalidate_filepath_access(user)
+        r_client.sadd(user_key, 1)
+        self.assertFalse(qdb.meta_util.check_filepath_access(user, 1))
+
+        # Changing the visibility of an artifact drops the cached filepaths
+        # of all the users
+        user_key = qdb.util.filepath_access_key(user.id)
+        qdb.artifact.Artifact(1).visibility = 'public'
+        self.assertNotEqual(qdb.util.filepath_access_key(user.id), user_key)
+        self.assertNotEqual(qdb.util.filepath_access_key('test@foo.bar'),
+                            other_key)
+        self.assertTrue(qdb.meta_util.check_filepath_access(user, 1))
+
     def test_get_lat_longs(self):
         exp = [
             [74.0894932572, 65.3283470202],
@@ -138,6 +207,14 @@ class MetaUtilTests(TestCase):
         obs = qdb.meta_util.get_lat_longs()
         self.assertItemsEqual(obs, exp)
 
+        # The sample metadata index returns the same coordinates
+        qiita_config.search_metadata_index = True
+        try:
+            obs = qdb.meta_util.get_lat_longs()
+        finally:
+            qiita_config.search_metadata_index = False
+        self.assertItemsEqual(obs, exp)
+
     def test_get_lat_longs_EMP_portal(self):
         info = {
             'timeseries_type_id': 1,
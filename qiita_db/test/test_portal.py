@@ -149,9 +149,13 @@ class TestPortal(TestCase):
 
         # Test study removal
         self.emp_portal.remove_analyses([self.analysis.id])
+        key = qdb.util.filepath_access_key('test@foo.bar', 'EMP')
         self.emp_portal.remove_studies([self.study.id])
         obs = self.study._portals
         self.assertEqual(obs, ['QIITA'])
+        # The cached accessible filepaths are invalidated
+        self.assertNotEqual(
+            qdb.util.filepath_access_key('test@foo.bar', 'EMP'), key)
 
         obs = npt.assert_warns(
             qdb.exceptions.QiitaDBWarning, self.emp_portal.remove_studies,
@@ -198,9 +202,13 @@ class TestPortal(TestCase):
         obs = self.analysis._portals
         self.assertItemsEqual(obs, ['QIITA', 'EMP'])
         # Test removal
+        key = qdb.util.filepath_access_key('test@foo.bar', 'EMP')
         self.emp_portal.remove_analyses([self.analysis.id])
         obs = self.analysis._portals
         self.assertEqual(obs, ['QIITA'])
+        # The cached accessible filepaths are invalidated
+        self.assertNotEqual(
+            qdb.util.filepath_access_key('test@foo.bar', 'EMP'), key)
 
         obs = npt.assert_warns(
             qdb.exceptions.QiitaDBWarning, self.emp_portal.remove_analyses,
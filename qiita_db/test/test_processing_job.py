@@ -638,7 +638,12 @@ class ProcessingWorkflowTests(TestCase):
         tester.add(dflt_params, connections=connections)
 
         self.assertEqual(len(tester.graph.nodes()), 2)
-        tester.remove(tester.graph.edges()[0][1])
+        with qdb.sql_connection.TRN:
+            job = tester.graph.edges()[0][1]
+            tester.remove(job)
+            # The removed job is not valid anymore in the same transaction
+            with self.assertRaises(qdb.exceptions.QiitaDBUnknownIDError):
+                qdb.processing_job.ProcessingJob(job.id)
 
         g = tester.graph
         obs_nodes = g.nodes()
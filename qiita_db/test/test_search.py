@@ -6,11 +6,14 @@
 # The full license is in the file LICENSE, distributed with this software.
 # -----------------------------------------------------------------------------
 
+from __future__ import division
 from unittest import TestCase, main
 
 import pandas as pd
 from pandas.util.testing import assert_frame_equal
 
+from qiita_core.qiita_settings import qiita_config
+from qiita_core.util import qiita_test_checker
 import qiita_db as qdb
 
 
@@ -170,6 +173,33 @@ class SearchTest(TestCase):
         assert "ph" in meta
         assert "pH" in meta
 
+    def test_search_plan(self):
+        qdb.search._PLAN_CACHE.clear()
+        obs = self.search._search_plan("altitude > 0")
+        exp = self.search._parse_study_search_string("altitude > 0")
+        self.assertEqual(obs, exp)
+        self.assertEqual(list(qdb.search._PLAN_CACHE),
+                         [("altitude > 0", False, 'QIITA')])
+
+        # The cached plan is returned without parsing the string again
+        qdb.search._PLAN_CACHE[("altitude > 0", False, 'QIITA')] = (
+            'study_sql', 'sample_sql', ['altitude'])
+        obs = self.search._search_plan("altitude > 0")
+        self.assertEqual(obs, ('study_sql', 'sample_sql', ['altitude']))
+        # the callers can't modify the cached headers
+        obs[2].append('ph')
+        self.assertEqual(self.search._search_plan("altitude > 0")[2],
+                         ['altitude'])
+
+        # The oldest plans are evicted
+        for i in range(1, qdb.search.PLAN_CACHE_SIZE + 1):
+            self.search._search_plan("altitude > %d" % i)
+        self.assertEqual(len(qdb.search._PLAN_CACHE),
+                         qdb.search.PLAN_CACHE_SIZE)
+        self.assertNotIn(("altitude > 0", False, 'QIITA'),
+                         qdb.search._PLAN_CACHE)
+        qdb.search._PLAN_CACHE.clear()
+
     def test_call(self):
         obs_res, obs_meta = self.search(
             '(sample_type = ENVO:soil AND COMMON_NAME = "rhizosphere '
@@ -192,6 +222,98 @@ class SearchTest(TestCase):
         self.assertEqual(obs_res, exp_res)
         self.assertEqual(obs_meta, exp_meta)
 
+    def test_call_cache(self):
+        user = qdb.user.User('test@foo.bar')
+        # Start from a new metadata generation, so nothing is cached
+        qdb.util.invalidate_search_cache()
+        stats = qdb.util.search_cache_stats()
+        exp = self.search('sample_type = ENVO:soil', user)
+        obs = qdb.util.search_cache_stats()
+        self.assertEqual(obs['hits'], stats['hits'])
+        self.assertEqual(obs['misses'], stats['misses'] + 1)
+
+        # Equivalent search strings share the cached results
+        search = qdb.search.QiitaStudySearch()
+        self.assertEqual(search('sample_type  =  ENVO:soil', user), exp)
+        obs = qdb.util.search_cache_stats()
+        self.assertEqual(obs['hits'], stats['hits'] + 1)
+        self.assertEqual(obs['misses'], stats['misses'] + 1)
+        self.assertEqual(obs['hit_rate'],
+                         obs['hits'] / (obs['hits'] + obs['misses']))
+
+        exp_filter = search.filter_by_processed_data(['18S'])
+        obs_filter = search.filter_by_processed_data(['18S'])
+        self.assertEqual(obs_filter[:2], exp_filter[:2])
+        self.assertEqual(obs_filter[2].keys(), exp_filter[2].keys())
+        self.assertEqual(qdb.util.search_cache_stats()['hits'],
+                         stats['hits'] + 2)
+        # Filtering by other data types is not cached yet
+        search.filter_by_processed_data()
+        self.assertEqual(qdb.util.search_cache_stats()['misses'],
+                         stats['misses'] + 3)
+
+        # A new metadata generation of the portal drops the cached results
+        qdb.util.invalidate_search_cache(1)
+        self.assertEqual(self.search('sample_type = ENVO:soil', user), exp)
+        self.assertEqual(qdb.util.search_cache_stats()['misses'],
+                         stats['misses'] + 4)
+
+    def test_call_index(self):
+        qiita_config.search_metadata_index = True
+        try:
+            obs_res, obs_meta = self.search(
+                '(sample_type = ENVO:soil AND COMMON_NAME = "rhizosphere '
+                'metagenome" ) AND NOT Description_duplicate includes Burmese',
+                qdb.user.User("test@foo.bar"))
+        finally:
+            qiita_config.search_metadata_index = False
+        exp_res = [['1.SKD4.640185', 'rhizosphere metagenome', 'Diesel Rhizo',
+                    'ENVO:soil'],
+                   ['1.SKD5.640186', 'rhizosphere metagenome', 'Diesel Rhizo',
+                    'ENVO:soil'],
+                   ['1.SKD6.640190', 'rhizosphere metagenome', 'Diesel Rhizo',
+                    'ENVO:soil'],
+                   ['1.SKM4.640180', 'rhizosphere metagenome', 'Bucu Rhizo',
+                    'ENVO:soil'],
+                   ['1.SKM5.640177', 'rhizosphere metagenome', 'Bucu Rhizo',
+                    'ENVO:soil'],
+                   ['1.SKM6.640187', 'rhizosphere metagenome', 'Bucu Rhizo',
+                    'ENVO:soil']]
+        self.assertEqual(obs_res.keys(), [1])
+        self.assertEqual(sorted(obs_res[1]), exp_res)
+        self.assertEqual(obs_meta,
+                         ["COMMON_NAME", "Description_duplicate",
+                          "sample_type"])
+
+    def test_parse_study_search_string_index(self):
+        _, samp_sql, meta = self.search._parse_study_search_string(
+            "altitude > 0", index=True)
+        exp_samp_sql = (
+            "SELECT ss.study_id, ss.sample_id,p.altitude__num "
+            "FROM qiita.study_sample ss "
+            "JOIN qiita.study st ON st.study_id = ss.study_id "
+            "LEFT JOIN (SELECT sample_id, "
+            "MAX(CASE WHEN column_name = 'altitude' THEN value_text END) "
+            "AS altitude__text, "
+            "MAX(CASE WHEN column_name = 'altitude' THEN value_num END) "
+            "AS altitude__num FROM qiita.sample_metadata_index "
+            "WHERE study_id IN %(study_ids)s AND column_name IN ('altitude') "
+            "GROUP BY sample_id) p ON p.sample_id = ss.sample_id "
+            "WHERE ss.study_id IN %(study_ids)s AND p.altitude__num > 0")
+        self.assertEqual(samp_sql, exp_samp_sql)
+        self.assertEqual(meta, ["altitude"])
+
+        # sample_id and the study columns are not read from the index
+        _, samp_sql, _ = self.search._parse_study_search_string(
+            "sample_id = 1.SKB1.640202", index=True)
+        exp_samp_sql = (
+            "SELECT ss.study_id, ss.sample_id,ss.sample_id "
+            "FROM qiita.study_sample ss "
+            "JOIN qiita.study st ON st.study_id = ss.study_id "
+            "WHERE ss.study_id IN %(study_ids)s AND "
+            "ss.sample_id = '1.SKB1.640202'")
+        self.assertEqual(samp_sql, exp_samp_sql)
+
     def test_call_bad_meta_category(self):
         obs_res, obs_meta = self.search(
             'BAD_NAME_THING = ENVO:soil', qdb.user.User("test@foo.bar"))
@@ -258,5 +380,40 @@ class SearchTest(TestCase):
         assert_frame_equal(meta[1], exp_meta)
 
 
+@qiita_test_checker()
+class SearchIntegerTest(TestCase):
+    """Tests the search of the integer sample columns"""
+
+    def setUp(self):
+        self.search = qdb.search.QiitaStudySearch()
+        st = qdb.metadata_template.sample_template.SampleTemplate(1)
+        md = pd.DataFrame({'int_column': range(1, len(st) + 1)},
+                          index=sorted(s.split('.', 1)[1] for s in st.keys()))
+        st.extend(md)
+
+    def test_call_index_integer(self):
+        qiita_config.search_metadata_index = True
+        try:
+            obs_res, obs_meta = self.search(
+                'int_column = 2', qdb.user.User("test@foo.bar"))
+        finally:
+            qiita_config.search_metadata_index = False
+        self.assertEqual(obs_meta, ['int_column'])
+        self.assertEqual(obs_res, {1: [['1.SKB2.640194', 2]]})
+        self.assertEqual(type(obs_res[1][0][1]), int)
+
+    def test_restore_integer_values(self):
+        # The float8 columns of other studies turn the values into floats
+        results = {1: [['1.SKB1.640202', 1.0, 0.0, 'ENVO:soil'],
+                       ['1.SKB2.640194', None, 0.0, 'ENVO:soil']]}
+        self.search._restore_integer_values(
+            results, ['int_column', 'altitude', 'sample_type'])
+        exp = {1: [['1.SKB1.640202', 1, 0.0, 'ENVO:soil'],
+                   ['1.SKB2.640194', None, 0.0, 'ENVO:soil']]}
+        self.assertEqual(results, exp)
+        self.assertEqual(type(results[1][0][1]), int)
+        self.assertEqual(type(results[1][0][2]), float)
+
+
 if __name__ == "__main__":
     main()
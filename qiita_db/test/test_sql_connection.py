@@ -2,6 +2,9 @@ from unittest import TestCase, main
 from os import remove, close
 from os.path import exists
 from tempfile import mkstemp
+from threading import Thread, Event
+from time import sleep
+from datetime import datetime
 
 from psycopg2._psycopg import connection
 from psycopg2.extras import DictCursor
@@ -63,6 +66,15 @@ class TestBase(TestCase):
 
         self.assertEqual(obs, exp)
 
+    def _assert_connections_returned(self):
+        """Aux function that checks that TRN gave back its connection"""
+        trn = qdb.sql_connection.TRN
+        self.assertIsNone(trn._connection)
+        self.assertEqual(trn.pool_stats['in_use'], 0)
+        for conn in trn.pool._idle:
+            self.assertEqual(conn.get_transaction_status(),
+                             TRANSACTION_STATUS_IDLE)
+
 
 class TestConnHandler(TestBase):
     def test_init(self):
@@ -216,8 +228,12 @@ class TestTransaction(TestBase):
         self.assertEqual(obs._connection, None)
         self.assertEqual(obs._contexts_entered, 0)
         with obs:
-            pass
-        self.assertTrue(isinstance(obs._connection, connection))
+            self.assertTrue(isinstance(obs._connection, connection))
+        # The connection is returned to the pool when leaving the context
+        self.assertEqual(obs._connection, None)
+        self.assertEqual(obs.pool_stats['checkouts'], 1)
+        self.assertEqual(obs.pool_stats['in_use'], 0)
+        obs.close()
 
     def test_add(self):
         with qdb.sql_connection.TRN:
@@ -329,6 +345,176 @@ class TestTransaction(TestBase):
                     ['insert2', False, 2]]]  # Third result select
             self.assertEqual(obs, exp)
 
+    def test_execute_many_return(self):
+        with qdb.sql_connection.TRN:
+            sql = """INSERT INTO qiita.test_table (str_column, int_column)
+                     VALUES (%s, %s) RETURNING int_column"""
+            # More queries than a batch page, although the queries returning
+            # rows are executed one by one
+            n = qdb.sql_connection.BATCH_PAGE_SIZE * 2 + 1
+            args = [['insert%d' % i, i] for i in range(n)]
+            qdb.sql_connection.TRN.add(sql, args, many=True)
+            qdb.sql_connection.TRN.add("SELECT 42")
+            obs = qdb.sql_connection.TRN.execute()
+            # The results are the same as executing the queries one by one
+            exp = [[[i]] for i in range(n)] + [[[42]]]
+            self.assertEqual(obs, exp)
+            self.assertEqual(qdb.sql_connection.TRN.index, n + 1)
+            self.assertEqual(
+                qdb.sql_connection.TRN.execute_fetchindex(n - 1), [[n - 1]])
+
+    def test_execute_many_batched_update(self):
+        self._populate_test_table()
+        with qdb.sql_connection.TRN:
+            sql = """UPDATE qiita.test_table SET str_column = %s
+                     WHERE int_column = %s"""
+            args = [['upd%%', 1], ['upd2', 2], ['upd3', 3]]
+            qdb.sql_connection.TRN.add(sql, args, many=True)
+            obs = qdb.sql_connection.TRN.execute()
+            self.assertEqual(obs, [None, None, None])
+
+        self._assert_sql_equal([('test4', False, 4), ('upd%%', True, 1),
+                                ('upd2', True, 2), ('upd3', False, 3)])
+
+    def test_execute_many_batched_error(self):
+        with qdb.sql_connection.TRN:
+            sql = """INSERT INTO qiita.test_table (str_column, int_column)
+                     VALUES (%s, %s)"""
+            args = [['insert1', 1], ['insert2', None], ['insert3', 3]]
+            qdb.sql_connection.TRN.add(sql, args, many=True)
+            with self.assertRaises(ValueError):
+                qdb.sql_connection.TRN.execute()
+
+        self._assert_sql_equal([])
+
+    def test_copy_from(self):
+        with qdb.sql_connection.TRN:
+            sql = """INSERT INTO qiita.test_table (str_column, int_column)
+                     VALUES (%s, %s)"""
+            qdb.sql_connection.TRN.add(sql, ['insert1', 1])
+            rows = (r for r in [('tab\tnew\nline\\', True, 2),
+                                ('copy3', False, 3)])
+            columns = ['str_column', 'bool_column', 'int_column']
+            qdb.sql_connection.TRN.copy_from('qiita.test_table', columns,
+                                             rows)
+            # The pending queries have been executed before the COPY
+            self.assertEqual(qdb.sql_connection.TRN._queries, [])
+            self.assertEqual(qdb.sql_connection.TRN.index, 1)
+
+        self._assert_sql_equal([('insert1', True, 1),
+                                ('tab\tnew\nline\\', True, 2),
+                                ('copy3', False, 3)])
+
+    def test_copy_from_error(self):
+        with qdb.sql_connection.TRN:
+            sql = """INSERT INTO qiita.test_table (str_column, int_column)
+                     VALUES (%s, %s)"""
+            qdb.sql_connection.TRN.add(sql, ['insert1', 1])
+            with self.assertRaises(ValueError):
+                qdb.sql_connection.TRN.copy_from(
+                    'qiita.test_table', ['str_column', 'int_column'],
+                    [['copy2', None]])
+
+        self._assert_sql_equal([])
+
+    def test_execute_fetch_chunks(self):
+        with qdb.sql_connection.TRN:
+            qdb.sql_connection.TRN.copy_from(
+                'qiita.test_table', ['str_column', 'int_column'],
+                (['row%d' % i, i] for i in range(5)))
+            sql = """INSERT INTO qiita.test_table (str_column, int_column)
+                     VALUES (%s, %s)"""
+            qdb.sql_connection.TRN.add(sql, ['row5', 5])
+            sql = """SELECT str_column, int_column
+                     FROM qiita.test_table
+                     WHERE int_column > %s
+                     ORDER BY int_column"""
+            obs = list(qdb.sql_connection.TRN.execute_fetch_chunks(
+                sql, [0], chunk_size=2))
+            # The pending queries have been executed before the query
+            self.assertEqual(qdb.sql_connection.TRN._queries, [])
+            exp = [[('row1', 1), ('row2', 2)], [('row3', 3), ('row4', 4)],
+                   [('row5', 5)]]
+            self.assertEqual(obs, exp)
+
+            # Not consuming the generator completely is fine
+            chunks = qdb.sql_connection.TRN.execute_fetch_chunks(sql, [3])
+            self.assertEqual(next(chunks), [('row4', 4), ('row5', 5)])
+            chunks.close()
+
+    def test_execute_fetch_chunks_error(self):
+        with qdb.sql_connection.TRN:
+            with self.assertRaises(ValueError):
+                list(qdb.sql_connection.TRN.execute_fetch_chunks(
+                    "SELECT * FROM qiita.does_not_exist"))
+
+        with self.assertRaises(RuntimeError):
+            list(qdb.sql_connection.TRN.execute_fetch_chunks(
+                "SELECT 1"))
+
+    def test_copy_encode(self):
+        obs = [qdb.sql_connection._copy_encode(v)
+               for v in [None, True, False, 1, 1.5, float('nan'),
+                         float('-inf'), 'a\tb\\c\nd\re', u'\xe9',
+                         datetime(2015, 1, 2, 3, 4)]]
+        exp = [b'\\N', b't', b'f', b'1', b'1.5', b'NaN', b'-Infinity',
+               b'a\\tb\\\\c\\nd\\re', b'\xc3\xa9', b'2015-01-02T03:04:00']
+        self.assertEqual(obs, exp)
+
+    def test_line_stream(self):
+        lines = ['a\tb\n', 'c\td\n', 'e\tf\n']
+        stream = qdb.sql_connection.LineStream(iter(lines), '')
+        self.assertEqual(stream.read(3), 'a\tb')
+        self.assertEqual(stream.readline(), '\n')
+        self.assertEqual(stream.read(), 'c\td\ne\tf\n')
+        self.assertEqual(stream.read(), '')
+        stream = qdb.sql_connection.LineStream(iter(lines), '')
+        self.assertEqual(list(stream), lines)
+
+    def test_copy_stream(self):
+        rows = [[1, 'a'], [None, 'b'], [3, 'c']]
+        exp = b'1\ta\n\\N\tb\n3\tc\n'
+        stream = qdb.sql_connection._CopyStream(rows)
+        chunks = []
+        chunk = stream.read(4)
+        while chunk:
+            chunks.append(chunk)
+            chunk = stream.read(4)
+        self.assertEqual(b''.join(chunks), exp)
+        self.assertEqual(
+            qdb.sql_connection._CopyStream(rows).read(), exp)
+
+    def test_batch_plan(self):
+        sql = """INSERT INTO qiita.test_table (str_column, int_column)
+                 VALUES (%s, %s)"""
+        obs = qdb.sql_connection._batch_plan(sql)
+        exp = ('values',
+               ("""INSERT INTO qiita.test_table (str_column, int_column)
+                 VALUES """, "(%s, %s)", ""))
+        self.assertEqual(obs, exp)
+        sql = "INSERT INTO qiita.test_table (int_column) VALUES (%s), (%s)"
+        obs = qdb.sql_connection._batch_plan(sql)
+        exp = ('values', ("INSERT INTO qiita.test_table (int_column) VALUES ",
+                          "(%s), (%s)", ""))
+        self.assertEqual(obs, exp)
+
+        sql = """INSERT INTO qiita.test_table (int_column)
+                 SELECT int_column FROM qiita.test_table
+                 WHERE int_column = %s"""
+        self.assertEqual(qdb.sql_connection._batch_plan(sql), ('join', None))
+        sql = "UPDATE qiita.test_table SET int_column = %s"
+        self.assertEqual(qdb.sql_connection._batch_plan(sql), ('join', None))
+
+        # The order of the returned rows is not guaranteed, so the queries
+        # returning rows are not batched
+        sql = """INSERT INTO qiita.test_table (str_column, int_column)
+                 VALUES (%s, %s) RETURNING int_column"""
+        self.assertEqual(qdb.sql_connection._batch_plan(sql), (None, None))
+        sql = "UPDATE qiita.test_table SET int_column = %s RETURNING 1"
+        self.assertEqual(qdb.sql_connection._batch_plan(sql), (None, None))
+        sql = "SELECT * FROM qiita.test_table WHERE int_column = %s"
+        self.assertEqual(qdb.sql_connection._batch_plan(sql), (None, None))
+
     def test_execute_huge_transaction(self):
         with qdb.sql_connection.TRN:
             # Add a lot of inserts to the transaction
@@ -472,9 +658,7 @@ class TestTransaction(TestBase):
         except ValueError:
             pass
         self._assert_sql_equal([])
-        self.assertEqual(
-            qdb.sql_connection.TRN._connection.get_transaction_status(),
-            TRANSACTION_STATUS_IDLE)
+        self._assert_connections_returned()
 
     def test_context_manager_execute(self):
         with qdb.sql_connection.TRN:
@@ -486,9 +670,7 @@ class TestTransaction(TestBase):
 
         self._assert_sql_equal([('insert1', True, 1), ('insert2', True, 2),
                                 ('insert3', True, 3)])
-        self.assertEqual(
-            qdb.sql_connection.TRN._connection.get_transaction_status(),
-            TRANSACTION_STATUS_IDLE)
+        self._assert_connections_returned()
 
     def test_context_manager_no_commit(self):
         with qdb.sql_connection.TRN:
@@ -502,9 +684,7 @@ class TestTransaction(TestBase):
 
         self._assert_sql_equal([('insert1', True, 1), ('insert2', True, 2),
                                 ('insert3', True, 3)])
-        self.assertEqual(
-            qdb.sql_connection.TRN._connection.get_transaction_status(),
-            TRANSACTION_STATUS_IDLE)
+        self._assert_connections_returned()
 
     def test_context_manager_multiple(self):
         self.assertEqual(qdb.sql_connection.TRN._contexts_entered, 0)
@@ -532,9 +712,7 @@ class TestTransaction(TestBase):
         self.assertEqual(qdb.sql_connection.TRN._contexts_entered, 0)
         self._assert_sql_equal([('insert1', True, 1), ('insert2', True, 2),
                                 ('insert3', True, 3)])
-        self.assertEqual(
-            qdb.sql_connection.TRN._connection.get_transaction_status(),
-            TRANSACTION_STATUS_IDLE)
+        self._assert_connections_returned()
 
     def test_context_manager_multiple_2(self):
         self.assertEqual(qdb.sql_connection.TRN._contexts_entered, 0)
@@ -562,9 +740,7 @@ class TestTransaction(TestBase):
         self.assertEqual(qdb.sql_connection.TRN._contexts_entered, 0)
         self._assert_sql_equal([('insert1', True, 1), ('insert2', True, 2),
                                 ('insert3', True, 3)])
-        self.assertEqual(
-            qdb.sql_connection.TRN._connection.get_transaction_status(),
-            TRANSACTION_STATUS_IDLE)
+        self._assert_connections_returned()
 
     def test_post_commit_funcs(self):
         fd, fp = mkstemp()
@@ -655,5 +831,128 @@ class TestTransaction(TestBase):
 
         self.assertEqual(qdb.sql_connection.TRN.index, 0)
 
+    def test_cache(self):
+        with self.assertRaises(RuntimeError):
+            qdb.sql_connection.TRN.cache
+
+        with qdb.sql_connection.TRN:
+            self.assertEqual(qdb.sql_connection.TRN.cache, {})
+            qdb.sql_connection.TRN.cache['foo'] = 'bar'
+            with qdb.sql_connection.TRN:
+                # Nested contexts share the cache
+                self.assertEqual(qdb.sql_connection.TRN.cache,
+                                 {'foo': 'bar'})
+            self.assertEqual(qdb.sql_connection.TRN.cache, {'foo': 'bar'})
+
+            qdb.sql_connection.TRN.rollback()
+            self.assertEqual(qdb.sql_connection.TRN.cache, {})
+            qdb.sql_connection.TRN.cache['foo'] = 'bar'
+
+        with qdb.sql_connection.TRN:
+            self.assertEqual(qdb.sql_connection.TRN.cache, {})
+
+    def test_threads_use_different_connections(self):
+        conns = []
+
+        def worker():
+            with qdb.sql_connection.TRN:
+                conns.append(qdb.sql_connection.TRN._connection)
+                self.assertEqual(qdb.sql_connection.TRN._contexts_entered, 1)
+                qdb.sql_connection.TRN.add("SELECT 42")
+                self.assertEqual(
+                    qdb.sql_connection.TRN.execute_fetchlast(), 42)
+                # Wait for the main thread, so both connections are checked
+                # out at the same time
+                started.set()
+                finish.wait()
+
+        started = Event()
+        finish = Event()
+        with qdb.sql_connection.TRN:
+            qdb.sql_connection.TRN.add("SELECT 42")
+            t = Thread(target=worker)
+            t.start()
+            started.wait()
+            # The other thread does not see our queries or contexts
+            self.assertEqual(len(qdb.sql_connection.TRN._queries), 1)
+            self.assertEqual(qdb.sql_connection.TRN._contexts_entered, 1)
+            self.assertEqual(qdb.sql_connection.TRN.pool_stats['in_use'], 2)
+            self.assertIsNot(conns[0], qdb.sql_connection.TRN._connection)
+            finish.set()
+            t.join()
+
+        self._assert_connections_returned()
+
+
+class TestConnectionPool(TestBase):
+    def setUp(self):
+        super(TestConnectionPool, self).setUp()
+        self.conn_args = {'user': qiita_config.user,
+                          'password': qiita_config.password,
+                          'database': qiita_config.database,
+                          'host': qiita_config.host,
+                          'port': qiita_config.port}
+
+    def test_init_error(self):
+        with self.assertRaises(ValueError):
+            qdb.sql_connection.ConnectionPool(0, 0, self.conn_args)
+
+        with self.assertRaises(ValueError):
+            qdb.sql_connection.ConnectionPool(3, 2, self.conn_args)
+
+    def test_getconn_putconn(self):
+        pool = qdb.sql_connection.ConnectionPool(1, 2, self.conn_args)
+        conn1 = pool.getconn()
+        conn2 = pool.getconn()
+        self.assertIsNot(conn1, conn2)
+        self.assertEqual(pool.stats['in_use'], 2)
+
+        pool.putconn(conn1)
+        pool.putconn(conn2)
+        # Only minconn connections are kept open
+        self.assertEqual(pool.stats['size'], 1)
+        self.assertEqual(pool.stats['idle'], 1)
+        self.assertEqual(conn1.closed, 0)
+        self.assertNotEqual(conn2.closed, 0)
+
+        # The idle connection is reused
+        self.assertIs(pool.getconn(), conn1)
+        self.assertEqual(pool.stats['checkouts'], 3)
+        pool.putconn(conn1)
+        pool.closeall()
+        self.assertEqual(pool.stats['size'], 0)
+
+    def test_putconn_rollback(self):
+        pool = qdb.sql_connection.ConnectionPool(1, 1, self.conn_args)
+        conn = pool.getconn()
+        with conn.cursor() as cur:
+            cur.execute("INSERT INTO qiita.test_table (int_column) VALUES (1)")
+        pool.putconn(conn)
+        self.assertEqual(conn.get_transaction_status(),
+                         TRANSACTION_STATUS_IDLE)
+        self._assert_sql_equal([])
+        pool.closeall()
+
+    def test_getconn_wait(self):
+        pool = qdb.sql_connection.ConnectionPool(1, 1, self.conn_args)
+        conn = pool.getconn()
+        obs = []
+        t = Thread(target=lambda: obs.append(pool.getconn()))
+        t.start()
+        # Give some time to the thread so it blocks on the pool
+        sleep(0.1)
+        self.assertEqual(obs, [])
+        pool.putconn(conn)
+        t.join()
+
+        self.assertEqual(obs, [conn])
+        stats = pool.stats
+        self.assertEqual(stats['waits'], 1)
+        self.assertTrue(stats['max_wait_time'] > 0)
+        self.assertTrue(stats['wait_time'] >= stats['max_wait_time'])
+        pool.putconn(conn)
+        pool.closeall()
+
+
 if __name__ == "__main__":
     main()
@@ -15,6 +15,7 @@ from datetime import datetime
 from functools import partial
 
 import pandas as pd
+from moi import r_client
 
 from qiita_core.util import qiita_test_checker
 import qiita_db as qdb
@@ -81,6 +82,82 @@ class DBUtilTests(TestCase):
         self.assertFalse(qdb.util.exists_table("foo_table"))
         self.assertFalse(qdb.util.exists_table("bar_table"))
 
+    def test_schema_cache(self):
+        qdb.util.invalidate_schema_cache()
+        stats = qdb.util.schema_cache_stats()
+        self.assertEqual(stats['columns'], 0)
+        self.assertEqual(stats['exists'], 0)
+
+        self.assertFalse(qdb.util.exists_table("foo_table"))
+        obs = qdb.util.get_table_cols("qiita_user")
+        # The caller can't modify the cached columns
+        obs.append('foo')
+        self.assertFalse(qdb.util.exists_table("foo_table"))
+        self.assertNotIn('foo', qdb.util.get_table_cols("qiita_user"))
+
+        obs = qdb.util.schema_cache_stats()
+        # The tables that don't exist are not cached
+        self.assertEqual(obs['hits'] - stats['hits'], 1)
+        self.assertEqual(obs['misses'] - stats['misses'], 3)
+        self.assertEqual(obs['columns'], 1)
+        self.assertEqual(obs['exists'], 0)
+
+        self.assertTrue(qdb.util.exists_table("qiita_user"))
+        self.assertEqual(qdb.util.schema_cache_stats()['exists'], 1)
+
+        # Another process changed the schema, so the cache is dropped
+        r_client.incr(qdb.util._SCHEMA_VERSION_KEY)
+        qdb.util.get_table_cols("qiita_user")
+        obs = qdb.util.schema_cache_stats()
+        self.assertEqual(obs['columns'], 1)
+        self.assertEqual(obs['exists'], 0)
+        self.assertEqual(obs['misses'] - stats['misses'], 4)
+
+        with qdb.sql_connection.TRN:
+            qdb.sql_connection.TRN.add(
+                "CREATE TABLE qiita.foo_table (foo_col integer)")
+            qdb.util.invalidate_schema_cache("foo_table")
+            self.assertTrue(qdb.util.exists_table("foo_table"))
+            self.assertEqual(qdb.util.get_table_cols("foo_table"),
+                             ['foo_col'])
+            qdb.sql_connection.TRN.rollback()
+
+        # The rollback invalidated the information of the table
+        self.assertFalse(qdb.util.exists_table("foo_table"))
+        self.assertEqual(qdb.util.get_table_cols("foo_table"), [])
+
+        # Committing a schema change bumps the shared schema version
+        version = int(r_client.get(qdb.util._SCHEMA_VERSION_KEY) or 0)
+        qdb.util.invalidate_schema_cache("foo_table")
+        self.assertEqual(int(r_client.get(qdb.util._SCHEMA_VERSION_KEY)),
+                         version + 1)
+
+    def test_invalidate_search_cache(self):
+        key = qdb.util._search_generation_key('QIITA')
+        generation = int(r_client.get(key) or 0)
+        with qdb.sql_connection.TRN:
+            qdb.util.invalidate_search_cache(1)
+            qdb.util.invalidate_search_cache(1)
+            qdb.util.invalidate_search_cache()
+            # The generation is only bumped once the transaction commits
+            self.assertEqual(int(r_client.get(key) or 0), generation)
+        # All the calls of the transaction are bumped only once
+        self.assertEqual(int(r_client.get(key)), generation + 1)
+
+        # A rolled back transaction doesn't bump the generation
+        with qdb.sql_connection.TRN:
+            qdb.util.invalidate_search_cache(1)
+            qdb.sql_connection.TRN.rollback()
+        self.assertEqual(int(r_client.get(key)), generation + 1)
+
+        # The changes after a commit are bumped on the next commit
+        with qdb.sql_connection.TRN:
+            qdb.util.invalidate_search_cache(1)
+            qdb.sql_connection.TRN.commit()
+            self.assertEqual(int(r_client.get(key)), generation + 2)
+            qdb.util.invalidate_search_cache(1)
+        self.assertEqual(int(r_client.get(key)), generation + 3)
+
     def test_convert_to_id(self):
         """Tests that ids are returned correctly"""
         self.assertEqual(
@@ -174,6 +251,26 @@ class DBUtilTests(TestCase):
         exp = [[exp_new_id, exp_fp, 1, '852952723', 1, 5]]
         self.assertEqual(obs, exp)
 
+    def test_insert_filepaths_checksum_algorithm(self):
+        fd, fp = mkstemp()
+        close(fd)
+        with open(fp, "w") as f:
+            f.write("\n")
+        self.files_to_remove.append(fp)
+
+        obs = qdb.util.insert_filepaths([(fp, 1)], 1, "raw_data", "filepath",
+                                        checksum_algorithm='md5')
+        self.files_to_remove.append(
+            join(qdb.util.get_db_files_base_dir(), "raw_data",
+                 "1_%s" % basename(fp)))
+
+        obs = self.conn_handler.execute_fetchall(
+            """SELECT checksum, name
+               FROM qiita.filepath
+                JOIN qiita.checksum_algorithm USING (checksum_algorithm_id)
+               WHERE filepath_id = %s""", obs)
+        self.assertEqual(obs, [['68b329da9893e34099c7d8ad5cb9c940', 'md5']])
+
     def test_insert_filepaths_copy(self):
         fd, fp = mkstemp()
         close(fd)
@@ -203,6 +300,92 @@ class DBUtilTests(TestCase):
         exp = [[exp_new_id, exp_fp, 1, '852952723', 1, 5]]
         self.assertEqual(obs, exp)
 
+    def test_stage_filepaths(self):
+        fd, fp = mkstemp()
+        close(fd)
+        with open(fp, "w") as f:
+            f.write("\n")
+        self.files_to_remove.append(fp)
+
+        obs = qdb.util.stage_filepaths([(fp, 1)], "raw_data")
+        self.assertIsInstance(obs, qdb.util.StagedFilepaths)
+        self.assertEqual(len(obs), 1)
+        original, staged, fp_type, checksum = obs[0]
+        self.assertEqual(original, fp)
+        self.assertEqual(fp_type, 1)
+        self.assertEqual(checksum, 852952723)
+        self.assertFalse(exists(fp))
+        self.assertTrue(exists(staged))
+        self.assertTrue(staged.startswith(
+            join(qdb.util.get_db_files_base_dir(), "raw_data")))
+
+        # Unstaging returns the file and removes the staging directory
+        obs.unstage()
+        self.assertTrue(exists(fp))
+        self.assertFalse(exists(obs.staging_dir))
+
+    def test_stage_filepaths_copy(self):
+        fd, fp = mkstemp()
+        close(fd)
+        with open(fp, "w") as f:
+            f.write("\n")
+        self.files_to_remove.append(fp)
+
+        obs = qdb.util.stage_filepaths([(fp, 1)], "raw_data", copy=True,
+                                       checksum_algorithm='md5')
+        self.assertTrue(exists(fp))
+        self.assertTrue(exists(obs[0][1]))
+        self.assertEqual(obs[0][3], '68b329da9893e34099c7d8ad5cb9c940')
+        obs.unstage()
+        self.assertTrue(exists(fp))
+        self.assertFalse(exists(obs[0][1]))
+
+        with self.assertRaises(ValueError):
+            qdb.util.stage_filepaths([(fp, 1)], "raw_data",
+                                     checksum_algorithm='crc64')
+
+    def test_insert_filepaths_staged(self):
+        fd, fp = mkstemp()
+        close(fd)
+        with open(fp, "w") as f:
+            f.write("\n")
+        self.files_to_remove.append(fp)
+
+        staged = qdb.util.stage_filepaths([(fp, 1)], "raw_data",
+                                          checksum_algorithm='md5')
+        obs = qdb.util.insert_filepaths(staged, 1, "raw_data", "filepath")
+        exp_fp = join(qdb.util.get_db_files_base_dir(), "raw_data",
+                      "1_%s" % basename(fp))
+        self.files_to_remove.append(exp_fp)
+        self.assertTrue(exists(exp_fp))
+        self.assertFalse(exists(staged.staging_dir))
+
+        obs = self.conn_handler.execute_fetchall(
+            """SELECT filepath, checksum, name
+               FROM qiita.filepath
+                JOIN qiita.checksum_algorithm USING (checksum_algorithm_id)
+               WHERE filepath_id = %s""", obs)
+        self.assertEqual(obs, [["1_%s" % basename(fp),
+                                '68b329da9893e34099c7d8ad5cb9c940', 'md5']])
+
+    def test_insert_filepaths_staged_rollback(self):
+        fd, fp = mkstemp()
+        close(fd)
+        with open(fp, "w") as f:
+            f.write("\n")
+        self.files_to_remove.append(fp)
+
+        staged = qdb.util.stage_filepaths([(fp, 1)], "raw_data")
+        with self.assertRaises(ValueError):
+            with qdb.sql_connection.TRN:
+                qdb.sql_connection.TRN.add_post_rollback_func(staged.unstage)
+                qdb.util.insert_filepaths(staged, 1, "raw_data", "filepath")
+                raise ValueError("Forcing a rollback")
+        # The file is back in its original location
+        self.assertTrue(exists(fp))
+        self.assertFalse(exists(join(qdb.util.get_db_files_base_dir(),
+                                     "raw_data", "1_%s" % basename(fp))))
+
     def test_insert_filepaths_string(self):
         fd, fp = mkstemp()
         close(fd)
@@ -643,6 +826,21 @@ class DBUtilTests(TestCase):
 
         self.assertEqual(obs, exp)
 
+    def test_get_filepath_checksums(self):
+        obs = qdb.util.get_filepath_checksums([1, 3])
+        self.assertEqual(obs, {1: '852952723', 3: '852952723'})
+        self.assertEqual(qdb.util.get_filepath_checksums([]), {})
+
+    def test_get_qiime_mapping_files(self):
+        fp = join(qdb.util.get_db_files_base_dir(), 'templates',
+                  '1_prep_1_qiime_19700101-000000.txt')
+        obs = qdb.util.get_qiime_mapping_files([1, 4, 7])
+        exp = {1: [(1, 21, fp, '3703494589')],
+               4: [(1, 21, fp, '3703494589')],
+               7: [(2, None, None, None)]}
+        self.assertEqual(obs, exp)
+        self.assertEqual(qdb.util.get_qiime_mapping_files([]), {})
+
     def test_check_access_to_analysis_result(self):
         obs = qdb.util.check_access_to_analysis_result('test@foo.bar',
                                                        '1_job_result.txt')
@@ -715,6 +913,116 @@ class DBUtilTests(TestCase):
         exp = [["biom", True], ["directory", False], ["log", False]]
         self.assertItemsEqual(obs, exp)
 
+    def _accessible_studies(self, user, access=None):
+        sql, args = qdb.util.study_access_sql(qdb.user.User(user), access)
+        with qdb.sql_connection.TRN:
+            qdb.sql_connection.TRN.add(sql, args)
+            return sorted(qdb.sql_connection.TRN.execute_fetchflatten())
+
+    def test_study_access_sql(self):
+        self.assertEqual(self._accessible_studies('test@foo.bar'), [1])
+        self.assertEqual(
+            self._accessible_studies('test@foo.bar', ['shared']), [])
+        self.assertEqual(
+            self._accessible_studies('shared@foo.bar', ['shared']), [1])
+        self.assertEqual(
+            self._accessible_studies('shared@foo.bar', ['owned']), [])
+        self.assertEqual(
+            self._accessible_studies('demo@microbio.me'), [])
+        self.assertEqual(self._accessible_studies('admin@foo.bar'), [1])
+        self.assertEqual(
+            self._accessible_studies('admin@foo.bar', ['public']), [])
+        self.assertEqual(self._accessible_studies('shared@foo.bar', []), [])
+
+        self.conn_handler.execute(
+            "UPDATE qiita.artifact SET visibility_id = 2")
+        self.assertEqual(self._accessible_studies('demo@microbio.me'), [1])
+        self.assertEqual(
+            self._accessible_studies('admin@foo.bar', ['public']), [1])
+
+        with self.assertRaises(ValueError):
+            qdb.util.study_access_sql(qdb.user.User('test@foo.bar'),
+                                      ['public', 'unknown'])
+
+    def test_get_artifacts_samples(self):
+        obs = qdb.util.get_artifacts_samples([1, 4, 7])
+        exp = sorted(
+            qdb.metadata_template.prep_template.PrepTemplate(1).keys())
+        self.assertEqual(obs, {1: exp, 4: exp, 7: exp})
+        self.assertEqual(qdb.util.get_artifacts_samples([]), {})
+
+    def test_get_study_list_page(self):
+        user = qdb.user.User('test@foo.bar')
+        self.assertEqual(qdb.util.get_study_list_page(None, user=user),
+                         (1, 1, [1]))
+        self.assertEqual(qdb.util.get_study_list_page([], user=user),
+                         (0, 0, []))
+        self.assertEqual(
+            qdb.util.get_study_list_page(None, user=user, text='CANNABIS'),
+            (1, 1, [1]))
+        self.assertEqual(
+            qdb.util.get_study_list_page(None, user=user, text='100%'),
+            (1, 0, []))
+
+        info = {
+            "timeseries_type_id": 1,
+            "metadata_complete": True,
+            "mixs_compliant": True,
+            "number_samples_collected": 25,
+            "number_samples_promised": 28,
+            "study_alias": "TST",
+            "study_description": "Some description of the study goes here",
+            "study_abstract": "Some abstract goes here",
+            "emp_person_id": 2,
+            "principal_investigator_id": 3,
+            "lab_person_id": 1}
+        new_id = qdb.study.Study.create(
+            user, "A study list page", [1], info).id
+        self.assertEqual(
+            qdb.util.get_study_list_page(None, user=user,
+                                         sort_column='study_title'),
+            (2, 2, [new_id, 1]))
+        self.assertEqual(
+            qdb.util.get_study_list_page(
+                None, user=user, sort_column='number_samples_collected',
+                descending=True, limit=1),
+            (2, 2, [1]))
+        self.assertEqual(
+            qdb.util.get_study_list_page(None, user=user, offset=1, limit=1),
+            (2, 2, [new_id]))
+        self.assertEqual(
+            qdb.util.get_study_list_page([new_id], user=user),
+            (1, 1, [new_id]))
+
+        with self.assertRaises(ValueError):
+            qdb.util.get_study_list_page(None, sort_column='status')
+
+    def test_iter_study_list(self):
+        exp = qdb.util.generate_study_list([1, 2, 3, 4], True)
+        obs = list(qdb.util.iter_study_list([1, 2, 3, 4], True, page_size=1))
+        self.assertEqual(obs, [exp])
+
+        # Add a second study so the list is split in two pages
+        info = {
+            "timeseries_type_id": 1,
+            "metadata_complete": True,
+            "mixs_compliant": True,
+            "number_samples_collected": 25,
+            "number_samples_promised": 28,
+            "study_alias": "TST",
+            "study_description": "Some description of the study goes here",
+            "study_abstract": "Some abstract goes here",
+            "emp_person_id": 2,
+            "principal_investigator_id": 3,
+            "lab_person_id": 1}
+        new_study = qdb.study.Study.create(
+            qdb.user.User('test@foo.bar'), "Study list pages", [1], info)
+        obs = list(qdb.util.iter_study_list(
+            None, False, user=qdb.user.User('test@foo.bar'), page_size=1))
+        self.assertEqual([[s['study_id'] for s in page] for page in obs],
+                         [[1], [new_study.id]])
+        self.assertEqual(list(qdb.util.iter_study_list([], False)), [])
+
 
 class UtilTests(TestCase):
     """Tests for the util functions that do not need to access the DB"""
@@ -724,6 +1032,12 @@ class UtilTests(TestCase):
         close(fh)
         with open(self.filepath, "w") as f:
             f.write("Some text so we can actually compute a checksum")
+        self.files_to_remove = [self.filepath]
+
+    def tearDown(self):
+        for fp in self.files_to_remove:
+            if exists(fp):
+                remove(fp)
 
     def test_compute_checksum(self):
         """Correctly returns the file checksum"""
@@ -731,6 +1045,54 @@ class UtilTests(TestCase):
         exp = 1719580229
         self.assertEqual(obs, exp)
 
+        # The block size doesn't change the checksum
+        obs = qdb.util.compute_checksum(self.filepath, block_size=5)
+        self.assertEqual(obs, exp)
+
+    def test_search_cache_key(self):
+        plan = [u'SELECT sample_id WHERE "country" = \'Espa\xf1a\'', '1']
+        obs = qdb.util.search_cache_key('samples', plan, {2, 1}, 'QIITA')
+        # The key does not depend on the encoding of the plan or the order
+        # of the studies
+        exp = qdb.util.search_cache_key(
+            'samples', [p.encode('utf-8') for p in plan], [1, 2], 'QIITA')
+        self.assertEqual(obs, exp)
+        self.assertTrue(obs.startswith('qiita-search:QIITA:'))
+        self.assertNotEqual(
+            qdb.util.search_cache_key('samples', plan, [1], 'QIITA'), obs)
+
+    def test_compute_checksum_algorithms(self):
+        obs = qdb.util.compute_checksum(self.filepath, 'md5', block_size=7)
+        self.assertEqual(obs, 'd217f00299ab315615dec4b0476c8a72')
+        obs = qdb.util.compute_checksum(self.filepath, 'sha256')
+        self.assertEqual(
+            obs,
+            '7537ff5df91c90e0dc76fc37132b29be01a2c5b729205d346671b173970b16bf')
+        with self.assertRaises(ValueError):
+            qdb.util.compute_checksum(self.filepath, 'crc64')
+
+    def test_compute_checksum_newlines(self):
+        # The crc32 checksum does not depend on the line endings, even if
+        # they are split between two blocks
+        with open(self.filepath, 'wb') as f:
+            f.write(b'a\r\nb\rc\r')
+        for block_size in (1, 2, 3, 1024):
+            obs = qdb.util.compute_checksum(self.filepath,
+                                            block_size=block_size)
+            self.assertEqual(obs, 174526169)
+
+    def test_compute_checksums(self):
+        fd, fp = mkstemp()
+        close(fd)
+        with open(fp, 'w') as f:
+            f.write("\n")
+        self.files_to_remove.append(fp)
+        obs = qdb.util.compute_checksums([self.filepath, fp, self.filepath])
+        self.assertEqual(obs, [1719580229, 852952723, 1719580229])
+        obs = qdb.util.compute_checksums([fp], 'md5')
+        self.assertEqual(obs, ['68b329da9893e34099c7d8ad5cb9c940'])
+        self.assertEqual(qdb.util.compute_checksums([]), [])
+
     def test_scrub_data_nothing(self):
         """Returns the same string without changes"""
         self.assertEqual(qdb.util.scrub_data("nothing_changes"),
@@ -800,6 +1162,15 @@ class UtilTests(TestCase):
         obs_info = qdb.util.generate_study_list([1, 2, 3, 4], False)
         self.assertEqual(obs_info, exp_info)
 
+        # Restricted to the studies the user can access
+        shared = qdb.user.User('shared@foo.bar')
+        obs_info = qdb.util.generate_study_list(None, False, user=shared)
+        self.assertEqual(obs_info, exp_info)
+        obs_info = qdb.util.generate_study_list(
+            [1, 2, 3, 4], False, user=shared, access=['owned', 'public'])
+        self.assertEqual(obs_info, [])
+        self.assertEqual(qdb.util.generate_study_list([], False), [])
+
         exp_info[0]['proc_data_info'] = [
             {'sortmerna_e_value': 1,
              'tree_filepath': 'GreenGenes_13_8_97_otus.tree',
@@ -90,6 +90,25 @@ class User(qdb.base.QiitaObject):
             qdb.sql_connection.TRN.add(sql, [id_])
             return qdb.sql_connection.TRN.execute_fetchlast()
 
+    @classmethod
+    def _check_ids(cls, ids):
+        r"""Returns which of the provided IDs exist in the database
+
+        Parameters
+        ----------
+        ids : list of str
+            The IDs to test
+
+        Notes
+        -----
+        This function overwrites the base function, as sql layout doesn't
+        follow the same conventions done in the other classes.
+        """
+        with qdb.sql_connection.TRN:
+            sql = "SELECT email FROM qiita.qiita_user WHERE email IN %s"
+            qdb.sql_connection.TRN.add(sql, [tuple(ids)])
+            return set(qdb.sql_connection.TRN.execute_fetchflatten())
+
     @classmethod
     def iter(cls):
         """Iterates over all users, sorted by their email addresses
@@ -310,6 +329,7 @@ class User(qdb.base.QiitaObject):
                     sql = """UPDATE qiita.{} SET user_level_id = %s
                              WHERE email = %s""".format(cls._table)
                     qdb.sql_connection.TRN.add(sql, [level, email])
+                    qdb.util.invalidate_filepath_access(cls(email))
 
                     # create user default sample holders once verified
                     # create one per portal
@@ -15,10 +15,18 @@ Methods
     quote_data_value
     scrub_data
     exists_table
+    get_table_cols
+    invalidate_schema_cache
+    schema_cache_stats
+    invalidate_search_cache
+    search_cache_stats
     get_db_files_base_dir
     compute_checksum
+    compute_checksums
     get_files_from_uploads_folders
     get_mountpoint
+    StagedFilepaths
+    stage_filepaths
     insert_filepaths
     check_table_cols
     check_required_columns
@@ -31,6 +39,10 @@ Methods
     move_upload_files_to_trash
     add_message
     get_pubmed_ids_from_dois
+    get_artifacts_samples
+    get_study_list_page
+    generate_study_list
+    iter_study_list
 """
 # -----------------------------------------------------------------------------
 # Copyright (c) 2014--, The Qiita Development Team.
@@ -46,19 +58,459 @@ from future.utils import viewitems
 from random import choice
 from string import ascii_letters, digits, punctuation
 from binascii import crc32
+from multiprocessing.pool import ThreadPool
+import hashlib
 from bcrypt import hashpw, gensalt
 from functools import partial
 from os.path import join, basename, isdir, relpath, exists
 from os import walk, remove, listdir, makedirs, rename
 from shutil import move, rmtree, copy as shutil_copy
+from tempfile import mkdtemp
 from json import dumps
 from datetime import datetime
 from itertools import chain
+from threading import Lock
+
+from moi import r_client
+from redis.exceptions import WatchError
 
 from qiita_core.exceptions import IncompetentQiitaDeveloperError
+from qiita_core.qiita_settings import qiita_config
 import qiita_db as qdb
 
 
+# Process-wide cache of the schema information returned by get_table_cols
+# and exists_table, keyed by table name. The functions that create, alter or
+# drop tables are responsible of calling invalidate_schema_cache
+_SCHEMA_CACHE = {'columns': {}, 'exists': {}}
+_SCHEMA_CACHE_STATS = {'hits': 0, 'misses': 0}
+_SCHEMA_CACHE_LOCK = Lock()
+# The schema version the cached information of this process was read under
+_SCHEMA_CACHE_VERSION = [None]
+
+# Redis key holding the version of the schema. It is bumped each time a
+# table is created, altered or dropped, so the other processes (e.g. the web
+# server when a worker creates a template) drop their cached information
+_SCHEMA_VERSION_KEY = 'qiita-schema-version'
+
+
+def _schema_version():
+    """Returns the current schema version, dropping the outdated cache"""
+    version = r_client.get(_SCHEMA_VERSION_KEY) or 0
+    with _SCHEMA_CACHE_LOCK:
+        if _SCHEMA_CACHE_VERSION[0] != version:
+            for cache in _SCHEMA_CACHE.values():
+                cache.clear()
+            _SCHEMA_CACHE_VERSION[0] = version
+    return version
+
+
+def _schema_cache_get(kind, table):
+    """Returns the cached schema information of `table` or None if missing
+
+    Returns
+    -------
+    object or None
+        The cached information, or None if it is missing
+    object
+        The schema version the information has to be cached under
+    """
+    version = _schema_version()
+    with _SCHEMA_CACHE_LOCK:
+        value = _SCHEMA_CACHE[kind].get(table)
+        _SCHEMA_CACHE_STATS['misses' if value is None else 'hits'] += 1
+        return value, version
+
+
+def _schema_cache_set(kind, table, value, version):
+    with _SCHEMA_CACHE_LOCK:
+        # The schema changed while the information was read from the
+        # database, so it may be outdated
+        if _SCHEMA_CACHE_VERSION[0] == version:
+            _SCHEMA_CACHE[kind][table] = value
+
+
+def _schema_cache_pop(table=None):
+    with _SCHEMA_CACHE_LOCK:
+        for cache in _SCHEMA_CACHE.values():
+            if table is None:
+                cache.clear()
+            else:
+                cache.pop(table, None)
+
+
+def _schema_changed(table):
+    _schema_cache_pop(table)
+    r_client.incr(_SCHEMA_VERSION_KEY)
+
+
+def invalidate_schema_cache(table=None):
+    """Invalidates the cached schema information of `table`
+
+    It should be called by any code that creates, alters or drops a table.
+    The information is invalidated right away and again once the current
+    transaction is committed or rolled back, so the cache does not keep the
+    schema seen while the transaction was not finished. Once the transaction
+    is committed, the schema version is bumped, so the information cached by
+    the other processes is invalidated as well.
+
+    Parameters
+    ----------
+    table : str, optional
+        The table name, without the schema. If not provided, all the cached
+        information is invalidated
+    """
+    with qdb.sql_connection.TRN:
+        _schema_cache_pop(table)
+        qdb.sql_connection.TRN.add_post_commit_func(_schema_changed, table)
+        qdb.sql_connection.TRN.add_post_rollback_func(
+            _schema_cache_pop, table)
+
+
+def schema_cache_stats():
+    """Returns the usage statistics of the schema cache
+
+    Returns
+    -------
+    dict of {str: int}
+        The number of cache hits (`hits`) and misses (`misses`), and the
+        number of tables with cached columns (`columns`) and with cached
+        existence (`exists`)
+    """
+    with _SCHEMA_CACHE_LOCK:
+        stats = dict(_SCHEMA_CACHE_STATS)
+        stats.update((k, len(v)) for k, v in viewitems(_SCHEMA_CACHE))
+        return stats
+
+
+# Seconds that the filepaths accessible by a user are kept in redis
+FILEPATH_ACCESS_TTL = 3600
+
+# Redis key holding the version of the cached filepath access sets. Bumping it
+# drops the sets of all the users at once
+_FILEPATH_ACCESS_VERSION_KEY = 'qiita-filepath-access-version'
+
+
+def _filepath_access_user_version_key(user_id):
+    """Returns the redis key holding the version of the sets of a user"""
+    return '%s:%s' % (_FILEPATH_ACCESS_VERSION_KEY, user_id)
+
+
+def filepath_access_key(user_id, portal=None):
+    """Returns the redis key of the set of filepaths accessible by a user
+
+    The key includes both the global and the user versions, so any set built
+    from the database before an invalidation is written under a key that is
+    not read anymore.
+
+    Parameters
+    ----------
+    user_id : str
+        The user email
+    portal : str, optional
+        The portal. Default: the current portal
+
+    Returns
+    -------
+    str
+        The redis key
+    """
+    version, user_version = r_client.mget(
+        _FILEPATH_ACCESS_VERSION_KEY,
+        _filepath_access_user_version_key(user_id))
+    return 'qiita-filepath-access:%s:%s:%s:%s' % (
+        version or 0, user_version or 0, portal or qiita_config.portal,
+        user_id)
+
+
+def _drop_filepath_access(user_id):
+    if user_id is None:
+        r_client.incr(_FILEPATH_ACCESS_VERSION_KEY)
+    else:
+        r_client.incr(_filepath_access_user_version_key(user_id))
+
+
+def invalidate_filepath_access(user=None):
+    """Invalidates the cached filepaths accessible by `user`
+
+    It should be called by any code that changes who can access a file, e.g.
+    sharing a study or changing the visibility of an artifact. The cache is
+    invalidated once the current transaction is committed.
+
+    Parameters
+    ----------
+    user : qiita_db.user.User, optional
+        The user whose access changed. If not provided, the cached filepaths
+        of all the users are invalidated
+
+    See Also
+    --------
+    qiita_db.meta_util.check_filepath_access
+    """
+    with qdb.sql_connection.TRN:
+        qdb.sql_connection.TRN.add_post_commit_func(
+            _drop_filepath_access, None if user is None else user.id)
+
+
+# Seconds that the summary of a template is kept in redis
+TEMPLATE_SUMMARY_TTL = 86400
+
+# Redis key holding the version of the cached template summaries. Bumping it
+# drops the summaries of all the templates at once
+_TEMPLATE_SUMMARY_VERSION_KEY = 'qiita-template-summary-version'
+
+
+def _template_summary_version_key(table_name):
+    """Returns the redis key holding the version of a template summary"""
+    return '%s:%s' % (_TEMPLATE_SUMMARY_VERSION_KEY, table_name)
+
+
+def template_summary_key(table_name):
+    """Returns the redis key of the hash with the summary of a template
+
+    Parameters
+    ----------
+    table_name : str
+        The name of the table that holds the template metadata
+
+    Returns
+    -------
+    str
+        The redis key
+    """
+    version = r_client.get(_TEMPLATE_SUMMARY_VERSION_KEY) or 0
+    return 'qiita-template-summary:%s:%s' % (version, table_name)
+
+
+def template_summary_version(table_name):
+    """Returns the current version of the cached summary of a template
+
+    The version changes every time the summary of the template is
+    invalidated, so it should be read before computing the summary and passed
+    to `cache_template_summary`.
+
+    Parameters
+    ----------
+    table_name : str
+        The name of the table that holds the template metadata
+
+    Returns
+    -------
+    str or None
+        The version
+    """
+    return r_client.get(_template_summary_version_key(table_name))
+
+
+def cache_template_summary(table_name, version, summary):
+    """Stores the summary of the columns of a template in redis
+
+    The summary is only stored if the template has not been invalidated since
+    `version` was read, otherwise it might have been computed from outdated
+    values.
+
+    Parameters
+    ----------
+    table_name : str
+        The name of the table that holds the template metadata
+    version : str or None
+        The version of the summary, as returned by `template_summary_version`
+        before computing the summary
+    summary : dict of {str: str}
+        The serialized summary of each column
+    """
+    version_key = _template_summary_version_key(table_name)
+    key = template_summary_key(table_name)
+    with r_client.pipeline() as pipe:
+        try:
+            pipe.watch(version_key)
+            if pipe.get(version_key) != version:
+                return
+            pipe.multi()
+            pipe.hmset(key, summary)
+            pipe.expire(key, TEMPLATE_SUMMARY_TTL)
+            pipe.execute()
+        except WatchError:
+            # The summary has been invalidated while it was being stored
+            pass
+
+
+def _drop_template_summary(table_name, columns):
+    if table_name is None:
+        r_client.incr(_TEMPLATE_SUMMARY_VERSION_KEY)
+        return
+    pipe = r_client.pipeline()
+    pipe.incr(_template_summary_version_key(table_name))
+    if columns is None:
+        pipe.delete(template_summary_key(table_name))
+    elif columns:
+        pipe.hdel(template_summary_key(table_name), *columns)
+    pipe.execute()
+
+
+def invalidate_template_summary(table_name=None, columns=None):
+    """Invalidates the cached summary of the columns of a template
+
+    It should be called by any code that changes the values of a template.
+    The cache is invalidated once the current transaction is committed.
+
+    Parameters
+    ----------
+    table_name : str, optional
+        The name of the table that holds the template metadata. If not
+        provided, the summaries of all the templates are invalidated
+    columns : iterable of str, optional
+        The columns whose values changed. Default: all the columns
+
+    See Also
+    --------
+    qiita_db.metadata_template.base_metadata_template.MetadataTemplate.summary
+    """
+    columns = None if columns is None else list(columns)
+    with qdb.sql_connection.TRN:
+        qdb.sql_connection.TRN.add_post_commit_func(
+            _drop_template_summary, table_name, columns)
+
+
+# Seconds that the results of a study search are kept in redis
+SEARCH_CACHE_TTL = 3600
+
+# Redis key holding the number of hits and misses of the search cache
+_SEARCH_CACHE_STATS_KEY = 'qiita-search-cache-stats'
+
+
+def _search_generation_key(portal):
+    return 'qiita-search-generation:%s' % portal
+
+
+def search_cache_key(kind, plan, study_ids, portal=None):
+    """Returns the redis key of the cached results of a study search
+
+    Parameters
+    ----------
+    kind : str
+        What is cached, e.g. the samples found or those samples filtered by
+        processed data
+    plan : iterable of str
+        The normalized search, e.g. the SQL generated for the search string,
+        so equivalent search strings share the same results
+    study_ids : iterable of int
+        The studies the search runs on, i.e. the studies with the searched
+        metadata that the user can access
+    portal : str, optional
+        The portal. Default: the current portal
+
+    Returns
+    -------
+    str
+        The redis key
+
+    Notes
+    -----
+    The key includes the metadata generation of the portal, so all the
+    cached searches of the portal are dropped by `invalidate_search_cache`
+    """
+    portal = portal or qiita_config.portal
+    generation = r_client.get(_search_generation_key(portal)) or 0
+    # The search strings can hold non ascii characters, so the plan is hashed
+    # as utf-8 bytes
+    plan = [p if isinstance(p, bytes) else p.encode('utf-8') for p in plan]
+    plan_hash = hashlib.sha1(b'\n'.join(plan)).hexdigest()
+    studies_hash = hashlib.sha1(
+        ','.join(str(s) for s in sorted(study_ids)).encode('utf-8')
+    ).hexdigest()
+    return 'qiita-search:%s:%s:%s:%s:%s' % (
+        portal, generation, kind, plan_hash, studies_hash)
+
+
+def _bump_search_generation(portals):
+    for portal in portals:
+        r_client.incr(_search_generation_key(portal))
+    # The changes made after this commit need a new bump
+    qdb.sql_connection.TRN.cache.pop('search_cache_invalidation', None)
+
+
+def invalidate_search_cache(study_id=None):
+    """Invalidates the cached study searches of the portals of a study
+
+    It should be called by any code that changes what a search finds, e.g.
+    creating, updating or deleting a template or changing the visibility of
+    an artifact. The cache is invalidated once the current transaction is
+    committed.
+
+    Parameters
+    ----------
+    study_id : int, optional
+        The study whose metadata changed. If not provided, the cached
+        searches of all the portals are invalidated
+
+    Notes
+    -----
+    The portals of each study are looked up once per transaction, and all
+    the portals changed in the transaction are bumped by a single post commit
+    function, so calling this function several times in the same transaction
+    is cheap.
+
+    See Also
+    --------
+    qiita_db.search.QiitaStudySearch
+    """
+    with qdb.sql_connection.TRN:
+        pending = qdb.sql_connection.TRN.cache.get(
+            'search_cache_invalidation')
+        if pending is None:
+            pending = {'studies': set(), 'portals': set()}
+            qdb.sql_connection.TRN.cache['search_cache_invalidation'] = \
+                pending
+            qdb.sql_connection.TRN.add_post_commit_func(
+                _bump_search_generation, pending['portals'])
+
+        if study_id in pending['studies'] or None in pending['studies']:
+            # The portals of this study are already bumped on commit
+            return
+
+        sql = "SELECT portal FROM qiita.portal_type"
+        sql_args = []
+        if study_id is not None:
+            sql = """SELECT portal
+                     FROM qiita.study_portal
+                        JOIN qiita.portal_type USING (portal_type_id)
+                     WHERE study_id = %s"""
+            sql_args.append(study_id)
+        qdb.sql_connection.TRN.add(sql, sql_args)
+        pending['portals'].update(
+            qdb.sql_connection.TRN.execute_fetchflatten())
+        pending['studies'].add(study_id)
+
+
+def record_search_cache_access(hit):
+    """Counts a hit or a miss of the search cache
+
+    Parameters
+    ----------
+    hit : bool
+        Whether the searched results were found in the cache
+    """
+    r_client.hincrby(_SEARCH_CACHE_STATS_KEY, 'hits' if hit else 'misses', 1)
+
+
+def search_cache_stats():
+    """Returns the usage statistics of the search cache
+
+    Returns
+    -------
+    dict
+        The number of cache hits (`hits`) and misses (`misses`) and the
+        fraction of accesses that were hits (`hit_rate`)
+    """
+    hits, misses = r_client.hmget(_SEARCH_CACHE_STATS_KEY, 'hits', 'misses')
+    hits = int(hits or 0)
+    misses = int(misses or 0)
+    total = hits + misses
+    return {'hits': hits, 'misses': misses,
+            'hit_rate': hits / total if total else 0.0}
+
+
 def params_dict_to_json(options):
     """Convert a dict of parameter key-value pairs to JSON string
 
@@ -342,12 +794,24 @@ def get_table_cols(table):
     -------
     list of str
         The column headers of `table`
+
+    Notes
+    -----
+    The result is cached until `invalidate_schema_cache` is called for
+    `table` in any process
     """
-    with qdb.sql_connection.TRN:
-        sql = """SELECT column_name FROM information_schema.columns
-                 WHERE table_name=%s AND table_schema='qiita'"""
-        qdb.sql_connection.TRN.add(sql, [table])
-        return qdb.sql_connection.TRN.execute_fetchflatten()
+    cols, version = _schema_cache_get('columns', table)
+    if cols is None:
+        with qdb.sql_connection.TRN:
+            sql = """SELECT column_name FROM information_schema.columns
+                     WHERE table_name=%s AND table_schema='qiita'"""
+            qdb.sql_connection.TRN.add(sql, [table])
+            cols = qdb.sql_connection.TRN.execute_fetchflatten()
+        # Do not cache the columns of a table that doesn't exist
+        if cols:
+            _schema_cache_set('columns', table, cols, version)
+    # Return a copy, so the callers can't modify the cached list
+    return list(cols)
 
 
 def exists_table(table):
@@ -362,13 +826,25 @@ def exists_table(table):
     -------
     bool
         Whether `table` exists on the database or not
+
+    Notes
+    -----
+    Only the tables that exist are cached, until `invalidate_schema_cache`
+    is called for `table` in any process
     """
-    with qdb.sql_connection.TRN:
-        sql = """SELECT exists(
-                    SELECT * FROM information_schema.tables
-                    WHERE table_name=%s)"""
-        qdb.sql_connection.TRN.add(sql, [table])
-        return qdb.sql_connection.TRN.execute_fetchlast()
+    exists, version = _schema_cache_get('exists', table)
+    if exists is None:
+        with qdb.sql_connection.TRN:
+            sql = """SELECT exists(
+                        SELECT * FROM information_schema.tables
+                        WHERE table_name=%s)"""
+            qdb.sql_connection.TRN.add(sql, [table])
+            exists = qdb.sql_connection.TRN.execute_fetchlast()
+        # Only the existing tables are cached, so a table created by another
+        # process is found as soon as it is committed
+        if exists:
+            _schema_cache_set('exists', table, exists, version)
+    return exists
 
 
 def get_db_files_base_dir():
@@ -397,20 +873,74 @@ def get_work_base_dir():
         return qdb.sql_connection.TRN.execute_fetchlast()
 
 
-def compute_checksum(path):
+# Number of bytes read at a time when computing the checksum of a file
+CHECKSUM_BLOCK_SIZE = 8 * 1024 * 1024
+
+# Maximum number of threads used to compute the checksums of several files
+CHECKSUM_THREADS = 4
+
+# The checksum algorithms supported, as named in qiita.checksum_algorithm
+CHECKSUM_ALGORITHMS = ('crc32', 'md5', 'sha256')
+
+
+def _read_blocks(fp, block_size):
+    """Yields the contents of the file `fp` in blocks of `block_size` bytes"""
+    with open(fp, 'rb') as f:
+        for block in iter(partial(f.read, block_size), b''):
+            yield block
+
+
+def _universal_newlines(blocks):
+    """Translates the \\r\\n and \\r line endings of the blocks to \\n
+
+    This matches what reading a file in universal newlines mode ("U") does,
+    even if a \\r\\n is split between two blocks
+    """
+    pending_cr = False
+    for block in blocks:
+        if pending_cr:
+            block = b'\r' + block
+        pending_cr = block.endswith(b'\r')
+        if pending_cr:
+            block = block[:-1]
+        yield block.replace(b'\r\n', b'\n').replace(b'\r', b'\n')
+    if pending_cr:
+        yield b'\n'
+
+
+def compute_checksum(path, algorithm='crc32', block_size=CHECKSUM_BLOCK_SIZE):
     r"""Returns the checksum of the file pointed by path
 
     Parameters
     ----------
     path : str
-        The path to compute the checksum
+        The path to compute the checksum. If it is a directory, the checksum
+        is computed over all the files in it
+    algorithm : {'crc32', 'md5', 'sha256'}, optional
+        The checksum algorithm. Default: 'crc32'
+    block_size : int, optional
+        The number of bytes read from the files at a time
 
     Returns
     -------
-    int
-        The file checksum
+    int or str
+        The file checksum: an int for crc32 or the hexadecimal digest for the
+        other algorithms
+
+    Raises
+    ------
+    ValueError
+        If the algorithm is not supported
+
+    Notes
+    -----
+    The crc32 checksum is computed with the line endings translated to \n,
+    as the files were originally read in universal newlines mode, so the
+    checksums stored in the database remain valid
     """
-    crc = 0
+    if algorithm not in CHECKSUM_ALGORITHMS:
+        raise ValueError("Checksum algorithm not supported: %s" % algorithm)
+
     filepaths = []
     if isdir(path):
         for name, dirs, files in walk(path):
@@ -419,17 +949,54 @@ def compute_checksum(path):
     else:
         filepaths.append(path)
 
+    if algorithm == 'crc32':
+        crc = 0
+        for fp in filepaths:
+            for block in _universal_newlines(_read_blocks(fp, block_size)):
+                crc = crc32(block, crc)
+        # We need the & 0xffffffff in order to get the same numeric value
+        # across all python versions and platforms
+        return crc & 0xffffffff
+
+    checksum = hashlib.new(algorithm)
     for fp in filepaths:
-        with open(fp, "Ub") as f:
-            # Go line by line so we don't need to load the entire file
-            for line in f:
-                if crc is None:
-                    crc = crc32(line)
-                else:
-                    crc = crc32(line, crc)
-    # We need the & 0xffffffff in order to get the same numeric value across
-    # all python versions and platforms
-    return crc & 0xffffffff
+        for block in _read_blocks(fp, block_size):
+            checksum.update(block)
+    return checksum.hexdigest()
+
+
+def compute_checksums(paths, algorithm='crc32', threads=CHECKSUM_THREADS):
+    r"""Returns the checksums of several files, computed in parallel
+
+    Parameters
+    ----------
+    paths : list of str
+        The paths to compute the checksum
+    algorithm : {'crc32', 'md5', 'sha256'}, optional
+        The checksum algorithm. Default: 'crc32'
+    threads : int, optional
+        The maximum number of files processed at the same time
+
+    Returns
+    -------
+    list of int or str
+        The checksum of each path, in the same order as `paths`
+
+    See Also
+    --------
+    compute_checksum
+    """
+    paths = list(paths)
+    threads = min(threads, len(paths))
+    if threads <= 1:
+        return [compute_checksum(path, algorithm) for path in paths]
+
+    pool = ThreadPool(threads)
+    try:
+        return pool.map(partial(compute_checksum, algorithm=algorithm), paths)
+    finally:
+        pool.close()
+        pool.join()
 
 
 def get_files_from_uploads_folders(study_id):
@@ -562,8 +1129,123 @@ def get_mountpoint_path_by_id(mount_id):
         return join(get_db_files_base_dir(), mountpoint)
 
 
+class StagedFilepaths(list):
+    r"""Filepaths moved (or copied) to the DB directory and checksummed
+
+    Each element is a 4-tuple (original path, staged path, filepath type,
+    checksum). The staged files live in a temporary directory inside the
+    mountpoint, so moving them to their final location is a rename.
+
+    Attributes
+    ----------
+    table : str
+        Table that holds the file data
+    copy : bool
+        Whether the files were copied instead of moved
+    checksum_algorithm : str
+        The algorithm used to compute the checksums
+    staging_dir : str
+        The temporary directory that holds the staged files
+
+    See Also
+    --------
+    stage_filepaths
+    insert_filepaths
+    """
+
+    def __init__(self, values, table, copy, checksum_algorithm, staging_dir):
+        super(StagedFilepaths, self).__init__(values)
+        self.table = table
+        self.copy = copy
+        self.checksum_algorithm = checksum_algorithm
+        self.staging_dir = staging_dir
+
+    def unstage(self):
+        """Returns the files that are still staged to their original location
+
+        The copies are removed instead. Files that have already been moved
+        out of the staging directory by `insert_filepaths` are left untouched
+        """
+        for original, staged, _, _ in self:
+            if exists(staged):
+                if self.copy:
+                    if isdir(staged):
+                        rmtree(staged)
+                    else:
+                        remove(staged)
+                else:
+                    move(staged, original)
+        if exists(self.staging_dir):
+            rmtree(self.staging_dir)
+
+
+def stage_filepaths(filepaths, table, copy=False, checksum_algorithm='crc32'):
+    r"""Moves `filepaths` to the DB directory and computes their checksums
+
+    This is the first phase of `insert_filepaths`. It does not access the
+    database other than to retrieve the mountpoint, so it can run before
+    entering the transaction that inserts the filepaths, keeping the file
+    transfers and the checksum computations out of the transaction.
+
+    Parameters
+    ----------
+    filepaths : iterable of tuples (str, int)
+        The list of paths to the raw files and its filepath type identifier
+    table : str
+        Table that holds the file data
+    copy : bool, optional
+        Whether to actually move the files or just copy them
+    checksum_algorithm : {'crc32', 'md5', 'sha256'}, optional
+        The algorithm used to compute the checksum of the files.
+        Default: 'crc32'
+
+    Returns
+    -------
+    StagedFilepaths
+        The staged filepaths, to be passed to `insert_filepaths`
+
+    Raises
+    ------
+    ValueError
+        If the checksum algorithm is not supported
+
+    Notes
+    -----
+    If an error occurs, the files that were already staged are returned to
+    their original location. If the staged files are not going to be inserted
+    `StagedFilepaths.unstage` should be called.
+    """
+    if checksum_algorithm not in CHECKSUM_ALGORITHMS:
+        raise ValueError(
+            "Checksum algorithm not supported: %s" % checksum_algorithm)
+    _, mp = get_mountpoint(table)[0]
+    base_fp = join(get_db_files_base_dir(), mp)
+    if not exists(base_fp):
+        makedirs(base_fp)
+
+    staged = StagedFilepaths([], table, copy, checksum_algorithm,
+                             mkdtemp(prefix='.staging_', dir=base_fp))
+    transfer_function = shutil_copy if copy else move
+    try:
+        for i, (path, fp_type) in enumerate(filepaths):
+            # The index avoids collisions between files with the same name
+            staged_fp = join(staged.staging_dir,
+                             '%d_%s' % (i, basename(path)))
+            transfer_function(path, staged_fp)
+            staged.append((path, staged_fp, fp_type, None))
+        checksums = compute_checksums([s for _, s, _, _ in staged],
+                                      checksum_algorithm)
+    except Exception:
+        staged.unstage()
+        raise
+    staged[:] = [(path, staged_fp, fp_type, checksum)
+                 for (path, staged_fp, fp_type, _), checksum
+                 in zip(staged, checksums)]
+    return staged
+
+
 def insert_filepaths(filepaths, obj_id, table, filepath_table,
-                     move_files=True, copy=False):
+                     move_files=True, copy=False, checksum_algorithm='crc32'):
     r"""Inserts `filepaths` in the database.
 
     Since the files live outside the database, the directory in which the files
@@ -572,8 +1254,9 @@ def insert_filepaths(filepaths, obj_id, table, filepath_table,
 
     Parameters
     ----------
-    filepaths : iterable of tuples (str, int)
-        The list of paths to the raw files and its filepath type identifier
+    filepaths : iterable of tuples (str, int) or StagedFilepaths
+        The list of paths to the raw files and its filepath type identifier,
+        or the filepaths already staged by `stage_filepaths`
     obj_id : int
         Id of the object calling the functions. Disregarded if move_files
         is False
@@ -583,23 +1266,40 @@ def insert_filepaths(filepaths, obj_id, table, filepath_table,
         Table that holds the filepath information
     move_files : bool, optional
         Whether or not to move the given filepaths to the db filepaths
-        default: True
+        default: True. Disregarded if `filepaths` is a StagedFilepaths
     copy : bool, optional
         If `move_files` is true, whether to actually move the files or just
-        copy them
+        copy them. Disregarded if `filepaths` is a StagedFilepaths
+    checksum_algorithm : {'crc32', 'md5', 'sha256'}, optional
+        The algorithm used to compute the checksum of the files.
+        Default: 'crc32'. Disregarded if `filepaths` is a StagedFilepaths
 
     Returns
     -------
     list of int
         List of the filepath_id in the database for each added filepath
+
+    Notes
+    -----
+    If `filepaths` is not a StagedFilepaths and `move_files` is true, the
+    files are staged inside the current transaction. Callers that want to
+    keep the transaction short should call `stage_filepaths` beforehand.
+    In any case, if the transaction executes a rollback the files are
+    returned to their original location.
     """
     with qdb.sql_connection.TRN:
-        new_filepaths = filepaths
+        if move_files and not isinstance(filepaths, StagedFilepaths):
+            filepaths = stage_filepaths(filepaths, table, copy=copy,
+                                        checksum_algorithm=checksum_algorithm)
+            # If the transaction fails before the staged files are moved to
+            # their final location, return them to the original one
+            qdb.sql_connection.TRN.add_post_rollback_func(filepaths.unstage)
 
         dd_id, mp, subdir = get_mountpoint(table, retrieve_subdir=True)[0]
         base_fp = join(get_db_files_base_dir(), mp)
 
-        if move_files:
+        if isinstance(filepaths, StagedFilepaths):
+            checksum_algorithm = filepaths.checksum_algorithm
             db_path = partial(join, base_fp)
             if subdir:
                 # Generate the new filepaths, format:
@@ -607,33 +1307,40 @@ def insert_filepaths(filepaths, obj_id, table, filepath_table,
                 dirname = db_path(str(obj_id))
                 if not exists(dirname):
                     makedirs(dirname)
-                new_filepaths = [
-                    (join(dirname, basename(path)), id_)
-                    for path, id_ in filepaths]
+                new_fp = partial(join, dirname)
             else:
                 # Generate the new fileapths. format:
                 # mountpoint/DataId_OriginalName
-                new_filepaths = [
-                    (db_path("%s_%s" % (obj_id, basename(path))), id_)
-                    for path, id_ in filepaths]
-            # Move the original files to the controlled DB directory
-            transfer_function = shutil_copy if copy else move
-            for old_fp, new_fp in zip(filepaths, new_filepaths):
-                    transfer_function(old_fp[0], new_fp[0])
-                    # In case the transaction executes a rollback, we need to
-                    # make sure the files have not been moved
-                    qdb.sql_connection.TRN.add_post_rollback_func(
-                        move, new_fp[0], old_fp[0])
+                def new_fp(name):
+                    return db_path("%s_%s" % (obj_id, name))
+            new_filepaths = []
+            checksums = []
+            # The staged files are already in the mountpoint, so this is just
+            # a rename of each of them
+            for old_fp, staged_fp, id_, checksum in filepaths:
+                path = new_fp(basename(old_fp))
+                rename(staged_fp, path)
+                # In case the transaction executes a rollback, we need to
+                # make sure the files have not been moved
+                qdb.sql_connection.TRN.add_post_rollback_func(
+                    move, path, old_fp)
+                new_filepaths.append((path, id_))
+                checksums.append(checksum)
+            rmtree(filepaths.staging_dir)
+        else:
+            new_filepaths = filepaths
+            checksums = compute_checksums([path for path, _ in filepaths],
+                                          checksum_algorithm)
 
         def str_to_id(x):
             return (x if isinstance(x, (int, long))
                     else convert_to_id(x, "filepath_type"))
-        paths_w_checksum = [(basename(path), str_to_id(id_),
-                            compute_checksum(path))
-                            for path, id_ in new_filepaths]
+        algorithm_id = convert_to_id(
+            checksum_algorithm, "checksum_algorithm", "name")
         # Create the list of SQL values to add
-        values = [[path, pid, checksum, 1, dd_id]
-                  for path, pid, checksum in paths_w_checksum]
+        values = [[basename(path), str_to_id(id_), checksum, algorithm_id,
+                   dd_id]
+                  for (path, id_), checksum in zip(new_filepaths, checksums)]
         # Insert all the filepaths at once and get the filepath_id back
         sql = """INSERT INTO qiita.{0}
                     (filepath, filepath_type_id, checksum,
@@ -761,6 +1468,9 @@ def purge_filepaths():
                     func = remove
                 qdb.sql_connection.TRN.add_post_commit_func(func, fp)
 
+        qdb.sql_connection.TRN.add_post_commit_func(
+            qdb.metadata_template.util.remove_qiime_mapping_file_cache,
+            [fp_id for fp_id, _, _, _ in db_results])
         qdb.sql_connection.TRN.execute()
 
 
@@ -859,6 +1569,81 @@ def filepath_id_to_rel_path(filepath_id):
         return result
 
 
+def get_filepath_checksums(filepath_ids):
+    """Gets the checksums stored for the filepaths
+
+    Parameters
+    ----------
+    filepath_ids : list of int
+
+    Returns
+    -------
+    dict where keys are ints and values are str
+        {filepath_id: checksum}
+    """
+    if not filepath_ids:
+        return {}
+
+    with qdb.sql_connection.TRN:
+        sql = """SELECT filepath_id, checksum
+                 FROM qiita.filepath
+                 WHERE filepath_id IN %s"""
+        qdb.sql_connection.TRN.add(sql, [tuple(filepath_ids)])
+        return dict(qdb.sql_connection.TRN.execute_fetchindex())
+
+
+def get_qiime_mapping_files(artifact_ids):
+    """Gets the QIIME mapping files of the prep templates of the artifacts
+
+    Parameters
+    ----------
+    artifact_ids : list of int
+        The artifact ids
+
+    Returns
+    -------
+    dict of {int: list of (int, int, str, str)}
+        The (prep template id, filepath id, filepath, checksum) of the most
+        recent QIIME mapping file of each of the prep templates of the root
+        artifacts of each artifact, sorted by prep template id. The filepath
+        id, filepath and checksum are None if the prep template doesn't have
+        a QIIME mapping file
+    """
+    if not artifact_ids:
+        return {}
+
+    with qdb.sql_connection.TRN:
+        sql = """SELECT a.artifact_id, pt.prep_template_id, f.filepath_id,
+                        f.filepath, f.checksum, f.mountpoint, f.subdirectory
+                 FROM unnest(%s::bigint[]) AS a(artifact_id)
+                    JOIN LATERAL qiita.find_artifact_roots(a.artifact_id)
+                        AS r(root_id) ON true
+                    JOIN qiita.prep_template pt ON pt.artifact_id = r.root_id
+                    LEFT JOIN LATERAL (
+                        SELECT filepath_id, filepath, checksum, mountpoint,
+                               subdirectory
+                        FROM qiita.prep_template_filepath
+                            JOIN qiita.filepath USING (filepath_id)
+                            JOIN qiita.filepath_type USING (filepath_type_id)
+                            JOIN qiita.data_directory
+                                USING (data_directory_id)
+                        WHERE prep_template_id = pt.prep_template_id
+                            AND filepath_type = 'qiime_map'
+                        ORDER BY filepath_id DESC
+                        LIMIT 1) AS f ON true
+                 ORDER BY a.artifact_id, pt.prep_template_id"""
+        qdb.sql_connection.TRN.add(sql, [list(artifact_ids)])
+        db_dir = get_db_files_base_dir()
+        result = {a_id: [] for a_id in artifact_ids}
+        for (a_id, pt_id, fp_id, fp, checksum, mountpoint,
+                subdir) in qdb.sql_connection.TRN.execute_fetchindex():
+            if fp_id is not None:
+                fp = (join(db_dir, mountpoint, str(pt_id), fp) if subdir
+                      else join(db_dir, mountpoint, fp))
+            result[a_id].append((pt_id, fp_id, fp, checksum))
+        return result
+
+
 def filepath_ids_to_rel_paths(filepath_ids):
     """Gets the full paths, relative to the base directory
 
@@ -1222,16 +2007,355 @@ def supported_filepath_types(artifact_type):
         return qdb.sql_connection.TRN.execute_fetchindex()
 
 
-def generate_study_list(study_ids, build_samples):
+# The conditions that grant access to a study, see study_access_sql
+_STUDY_ACCESS_CONDITIONS = {
+    'public': """study_id IN (
+                    SELECT study_id
+                    FROM qiita.study_artifact
+                        JOIN qiita.artifact USING (artifact_id)
+                        JOIN qiita.visibility USING (visibility_id)
+                    WHERE visibility = 'public')""",
+    'owned': """study_id IN (
+                    SELECT study_id FROM qiita.study WHERE email = %s)""",
+    'shared': """study_id IN (
+                    SELECT study_id FROM qiita.study_users WHERE email = %s)"""
+}
+
+
+def study_access_sql(user, access=None):
+    """Returns the SQL that selects the studies of the portal a user can access
+
+    Parameters
+    ----------
+    user : qiita_db.user.User
+        The user accessing the studies
+    access : iterable of {'public', 'owned', 'shared'}, optional
+        The kinds of access to select: the studies with public artifacts, the
+        studies owned by `user` and/or the studies shared with `user`.
+        Default: all of them, or all the studies of the portal if `user` is
+        an admin, dev or superuser
+
+    Returns
+    -------
+    str
+        The SQL query, which returns a single study_id column
+    list
+        The parameters of the SQL query
+
+    Raises
+    ------
+    ValueError
+        If `access` contains an unknown kind of access
+
+    Notes
+    -----
+    The SQL is meant to be used as a subquery or combined with other queries
+    (e.g. with INTERSECT), so the permissions of all the studies are checked
+    in a single query
+    """
+    sql = """SELECT study_id
+             FROM qiita.study_portal
+                JOIN qiita.portal_type USING (portal_type_id)
+             WHERE portal = %s"""
+    args = [qiita_config.portal]
+    if access is None:
+        if user.level in {'admin', 'dev', 'superuser'}:
+            return sql, args
+        access = ['public', 'owned', 'shared']
+
+    access = sorted(set(access))
+    unknown = set(access).difference(_STUDY_ACCESS_CONDITIONS)
+    if unknown:
+        raise ValueError("Unknown study access: %s" % ', '.join(unknown))
+
+    conditions = []
+    for kind in access:
+        conditions.append(_STUDY_ACCESS_CONDITIONS[kind])
+        if kind != 'public':
+            args.append(user.id)
+    if not conditions:
+        conditions.append('FALSE')
+    sql = "%s AND (%s)" % (sql, ' OR '.join(conditions))
+    return sql, args
+
+
+# Number of studies of each page generated by iter_study_list
+STUDY_LIST_PAGE_SIZE = 50
+
+
+def _study_list_where(study_ids, user, access):
+    """Builds the WHERE clause selecting the studies of a study list
+
+    Parameters
+    ----------
+    study_ids : list of ints or None
+        The study ids to look for
+    user : qiita_db.user.User or None
+        If provided, only the studies that `user` can access are selected
+    access : iterable of {'public', 'owned', 'shared'} or None
+        The kinds of access `user` should have on the studies
+
+    Returns
+    -------
+    str or None
+        The conditions over study_id, an empty string if all the studies are
+        selected or None if no study can be selected
+    list
+        The parameters of the conditions
+    """
+    where = []
+    sql_args = []
+    if study_ids is not None:
+        if not study_ids:
+            return None, []
+        where.append("study_id IN %s")
+        sql_args.append(tuple(study_ids))
+    if user is not None:
+        access_sql, access_args = study_access_sql(user, access)
+        where.append("study_id IN (%s)" % access_sql)
+        sql_args.extend(access_args)
+    return ' AND '.join(where), sql_args
+
+
+def _prefetch_study_list_info(studies, build_samples):
+    """Retrieves in bulk the information referenced by a list of studies
+
+    Parameters
+    ----------
+    studies : list of dict
+        The rows of the main query of `generate_study_list`
+    build_samples : bool
+        If true, the commands, references and samples of the BIOM artifacts
+        of the studies are also retrieved
+
+    Returns
+    -------
+    dict
+        With the keys 'pmids' ({doi: pubmed_id}), 'commands' ({command_id:
+        list of the names of its artifact parameters}), 'references'
+        ({reference_id: dict}) and 'samples' ({artifact_id: sorted list of
+        sample ids})
+
+    Notes
+    -----
+    All the information is retrieved in at most four queries, independently
+    of the number of studies and artifacts
+    """
+    dois = set()
+    artifact_ids = set()
+    command_ids = set()
+    reference_ids = set()
+    for info in studies:
+        dois.update(info['publication_doi'] or [])
+        if build_samples and info['artifact_biom_ids']:
+            artifact_ids.update(info['artifact_biom_ids'])
+            for params, cmd in zip(info['artifact_biom_params'],
+                                   info['artifact_biom_cmd']):
+                if cmd is not None:
+                    command_ids.add(cmd)
+                    reference_ids.add(int(params['reference']))
+
+    queries = []
+    if dois:
+        queries.append((
+            'pmids',
+            "SELECT doi, pubmed_id FROM qiita.publication WHERE doi IN %s",
+            [tuple(dois)]))
+    if command_ids:
+        queries.append((
+            'commands',
+            """SELECT command_id, array_agg(parameter_name)
+               FROM qiita.command_parameter
+               WHERE command_id IN %s AND parameter_type = 'artifact'
+               GROUP BY command_id""",
+            [tuple(command_ids)]))
+    if reference_ids:
+        queries.append((
+            'references',
+            """SELECT reference_id, reference_name, reference_version,
+                      s.filepath, t.filepath, tr.filepath
+               FROM qiita.reference r
+                    LEFT JOIN qiita.filepath s
+                        ON r.sequence_filepath = s.filepath_id
+                    LEFT JOIN qiita.filepath t
+                        ON r.taxonomy_filepath = t.filepath_id
+                    LEFT JOIN qiita.filepath tr
+                        ON r.tree_filepath = tr.filepath_id
+               WHERE reference_id IN %s""",
+            [tuple(reference_ids)]))
+
+    result = {'pmids': {}, 'commands': {}, 'references': {},
+              'samples': get_artifacts_samples(artifact_ids)}
+    if not queries:
+        return result
+
+    with qdb.sql_connection.TRN:
+        idx = qdb.sql_connection.TRN.index
+        for _, sql, sql_args in queries:
+            qdb.sql_connection.TRN.add(sql, sql_args)
+        results = qdb.sql_connection.TRN.execute()[idx:]
+
+    for (key, _, _), rows in zip(queries, results):
+        if key == 'references':
+            for rid, name, version, seq_fp, tax_fp, tree_fp in rows:
+                result[key][rid] = {
+                    'name': name,
+                    'taxonomy_fp': basename(tax_fp) if tax_fp else '',
+                    'sequence_fp': basename(seq_fp) if seq_fp else '',
+                    'tree_fp': basename(tree_fp) if tree_fp else '',
+                    'version': version}
+        else:
+            result[key].update((k, v) for k, v in rows)
+    return result
+
+
+def get_artifacts_samples(artifact_ids):
+    """Gets the samples of the prep templates of the artifacts
+
+    Parameters
+    ----------
+    artifact_ids : iterable of int
+        The artifact ids
+
+    Returns
+    -------
+    dict of {int: list of str}
+        The sorted sample ids of the prep templates of the root artifacts of
+        each artifact
+    """
+    artifact_ids = list(artifact_ids)
+    result = {a_id: [] for a_id in artifact_ids}
+    if not artifact_ids:
+        return result
+
+    with qdb.sql_connection.TRN:
+        sql = """SELECT a.artifact_id, array_agg(sample_id)
+                 FROM unnest(%s::bigint[]) AS a(artifact_id)
+                    JOIN LATERAL qiita.find_artifact_roots(a.artifact_id)
+                        AS r(root_id) ON true
+                    JOIN qiita.prep_template pt ON pt.artifact_id = r.root_id
+                    JOIN qiita.prep_template_sample pts
+                        ON pts.prep_template_id = pt.prep_template_id
+                 GROUP BY a.artifact_id"""
+        qdb.sql_connection.TRN.add(sql, [artifact_ids])
+        for a_id, samples in qdb.sql_connection.TRN.execute_fetchindex():
+            result[a_id] = sorted(samples)
+    return result
+
+
+# The columns of generate_study_list that get_study_list_page can sort by
+STUDY_LIST_SORT_COLUMNS = {
+    'study_id': 'study_id',
+    'study_title': 'study_title',
+    'number_samples_collected': """(SELECT COUNT(sample_id)
+                                    FROM qiita.study_sample
+                                    WHERE study_id = qiita.study.study_id)""",
+    'pi': 'qiita.study_person.name'}
+
+
+def get_study_list_page(study_ids, user=None, access=None, text=None,
+                        sort_column='study_id', descending=False, offset=0,
+                        limit=None):
+    """Selects, filters, sorts and pages the studies of a study list
+
+    Parameters
+    ----------
+    study_ids : list of ints or None
+        The study ids to look for. Non-existing ids will be ignored. If None,
+        all the studies that `user` can access are selected
+    user : qiita_db.user.User, optional
+        If provided, only the studies of the portal that `user` can access
+        are selected
+    access : iterable of {'public', 'owned', 'shared'}, optional
+        The kinds of access `user` should have on the studies. Default: any
+        of them. See `study_access_sql`
+    text : str, optional
+        If provided, only the studies with `text` (case insensitive) in their
+        id, title, abstract, EBI accession or PI name or email are kept
+    sort_column : str, optional
+        The column of `generate_study_list` to sort the studies by. One of
+        study_id, study_title, number_samples_collected or pi
+    descending : bool, optional
+        Whether to sort the studies in descending order
+    offset : int, optional
+        The number of (filtered and sorted) studies to skip
+    limit : int, optional
+        The maximum number of studies of the page. Default: all of them
+
+    Returns
+    -------
+    int
+        The number of selected studies, before filtering by `text`
+    int
+        The number of studies left after filtering by `text`
+    list of int
+        The ids of the studies of the page, in order
+
+    Raises
+    ------
+    ValueError
+        If `sort_column` is not a column the studies can be sorted by
+    """
+    if sort_column not in STUDY_LIST_SORT_COLUMNS:
+        raise ValueError("Can't sort the studies by %s" % sort_column)
+
+    where, sql_args = _study_list_where(study_ids, user, access)
+    if where is None:
+        return 0, 0, []
+
+    text_where = 'TRUE'
+    text_args = []
+    if text:
+        pattern = '%%%s%%' % text.replace('\\', '\\\\').replace(
+            '%', '\\%').replace('_', '\\_')
+        text_where = """(study_id::varchar ILIKE %s
+                         OR study_title ILIKE %s
+                         OR study_abstract ILIKE %s
+                         OR ebi_study_accession ILIKE %s
+                         OR qiita.study_person.name ILIKE %s
+                         OR qiita.study_person.email ILIKE %s)"""
+        text_args = [pattern] * 6
+
+    from_sql = """FROM qiita.study
+                    LEFT JOIN qiita.study_person ON (
+                        study_person_id = principal_investigator_id)
+                  WHERE %s""" % (where or 'TRUE')
+    with qdb.sql_connection.TRN:
+        idx = qdb.sql_connection.TRN.index
+        sql = """SELECT COUNT(*), COALESCE(SUM(CASE WHEN %s THEN 1 ELSE 0 END),
+                                           0)
+                 %s""" % (text_where, from_sql)
+        qdb.sql_connection.TRN.add(sql, text_args + sql_args)
+        sql = """SELECT study_id
+                 %s AND %s
+                 ORDER BY %s %s NULLS LAST, study_id
+                 LIMIT %%s OFFSET %%s""" % (
+            from_sql, text_where, STUDY_LIST_SORT_COLUMNS[sort_column],
+            'DESC' if descending else 'ASC')
+        qdb.sql_connection.TRN.add(
+            sql, sql_args + text_args + [limit, offset])
+        counts, page = qdb.sql_connection.TRN.execute()[idx:]
+    total, filtered = counts[0]
+    return total, filtered, [row[0] for row in page]
+
+
+def generate_study_list(study_ids, build_samples, user=None, access=None):
     """Get general study information
 
     Parameters
     ----------
-    study_ids : list of ints
-        The study ids to look for. Non-existing ids will be ignored
+    study_ids : list of ints or None
+        The study ids to look for. Non-existing ids will be ignored. If None,
+        all the studies that `user` can access are returned
     build_samples : bool
         If true the sample information for each process artifact within each
         study will be included
+    user : qiita_db.user.User, optional
+        If provided, only the studies of the portal that `user` can access
+        are returned
+    access : iterable of {'public', 'owned', 'shared'}, optional
+        The kinds of access `user` should have on the studies. Default: any
+        of them. See `study_access_sql`
 
     Returns
     -------
@@ -1363,19 +2487,29 @@ def generate_study_list(study_ids, build_samples):
                     WHERE study_id=qiita.study.study_id) AS shared_with_email
                 FROM qiita.study
                 LEFT JOIN qiita.study_person ON (
-                    study_person_id=principal_investigator_id)
-                WHERE study_id IN %s"""
-        qdb.sql_connection.TRN.add(sql, [tuple(study_ids)])
-        infolist = []
-        refs = {}
-        commands = {}
-        for info in qdb.sql_connection.TRN.execute_fetchindex():
-            info = dict(info)
+                    study_person_id=principal_investigator_id)"""
+        where, sql_args = _study_list_where(study_ids, user, access)
+        if where is None:
+            return []
+        if where:
+            sql = "%s WHERE %s" % (sql, where)
+        sql = "%s ORDER BY study_id" % sql
+        qdb.sql_connection.TRN.add(sql, sql_args)
+        studies = [dict(info)
+                   for info in qdb.sql_connection.TRN.execute_fetchindex()]
+        prefetched = _prefetch_study_list_info(studies, build_samples)
 
+        infolist = []
+        pmids = prefetched['pmids']
+        commands = prefetched['commands']
+        refs = prefetched['references']
+        samples = prefetched['samples']
+        for info in studies:
             # publication info
             if info['publication_doi'] is not None:
-                info['pmid'] = get_pubmed_ids_from_dois(
-                    info['publication_doi']).values()
+                info['pmid'] = {doi: pmids[doi]
+                                for doi in info['publication_doi']
+                                if doi in pmids}.values()
             else:
                 info['publication_doi'] = []
                 info['pmid'] = []
@@ -1413,26 +2547,10 @@ def generate_study_list(study_ids, build_samples):
 
                     # if cmd exists then we can get its parameters
                     if cmd is not None:
-                        # making sure that the command is only queried once
-                        if cmd not in commands:
-                            commands[cmd] = [
-                                k for k, v in viewitems(
-                                    qdb.software.Command(
-                                        cmd).parameters) if v[0] == 'artifact']
-                        for k in commands[cmd]:
+                        for k in commands.get(cmd, []):
                             del params[k]
 
-                        # making sure that the reference is only created once
-                        rid = params.pop('reference')
-                        if rid not in refs:
-                            reference = qdb.reference.Reference(rid)
-                            refs[rid] = {
-                                'name': reference.name,
-                                'taxonomy_fp': basename(reference.taxonomy_fp),
-                                'sequence_fp': basename(reference.sequence_fp),
-                                'tree_fp': basename(reference.tree_fp),
-                                'version': reference.version
-                            }
+                        rid = int(params.pop('reference'))
                         proc_info['reference_name'] = refs[rid]['name']
                         proc_info['taxonomy_filepath'] = refs[rid][
                             'taxonomy_fp']
@@ -1443,17 +2561,7 @@ def generate_study_list(study_ids, build_samples):
                         proc_info['algorithm'] = 'sortmerna'
                         proc_info.update(params)
 
-                    # getting all samples
-                    sql = """SELECT sample_id from qiita.prep_template_sample
-                             WHERE prep_template_id = (
-                                 SELECT prep_template_id
-                                 FROM qiita.prep_template
-                                 WHERE artifact_id IN (
-                                     SELECT *
-                                     FROM qiita.find_artifact_roots(%s)))"""
-                    qdb.sql_connection.TRN.add(sql, [proc_info['pid']])
-                    proc_info['samples'] = sorted(
-                        qdb.sql_connection.TRN.execute_fetchflatten())
+                    proc_info['samples'] = samples[artifact_id]
 
                     info["proc_data_info"].append(proc_info)
 
@@ -1466,3 +2574,41 @@ def generate_study_list(study_ids, build_samples):
             infolist.append(info)
 
     return infolist
+
+
+def iter_study_list(study_ids, build_samples, user=None, access=None,
+                    page_size=STUDY_LIST_PAGE_SIZE):
+    """Generates the general study information one page at a time
+
+    Parameters
+    ----------
+    study_ids : list of ints or None
+        The study ids to look for. Non-existing ids will be ignored. If None,
+        all the studies that `user` can access are returned
+    build_samples : bool
+        If true the sample information for each process artifact within each
+        study will be included
+    user : qiita_db.user.User, optional
+        If provided, only the studies of the portal that `user` can access
+        are returned
+    access : iterable of {'public', 'owned', 'shared'}, optional
+        The kinds of access `user` should have on the studies. Default: any
+        of them. See `study_access_sql`
+    page_size : int, optional
+        The maximum number of studies of each page
+
+    Yields
+    ------
+    list of dict
+        The information of the studies of each page, sorted by study id, as
+        returned by `generate_study_list`
+
+    Notes
+    -----
+    The ids of the studies are selected up front, so the pages are consistent
+    with each other, but the information of each page is only retrieved when
+    that page is requested
+    """
+    _, _, ids = get_study_list_page(study_ids, user=user, access=access)
+    for start in range(0, len(ids), page_size):
+        yield generate_study_list(ids[start:start + page_size], build_samples)
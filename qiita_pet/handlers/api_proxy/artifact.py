@@ -24,6 +24,9 @@ from qiita_db.metadata_template.prep_template import PrepTemplate
 from qiita_db.util import get_mountpoint, get_visibilities
 from qiita_db.software import Command, Parameters
 from qiita_db.processing_job import ProcessingJob
+from qiita_db.meta_util import get_artifact_summary_info
+from qiita_db.study import Study
+from qiita_db.exceptions import QiitaDBError
 
 
 PREP_TEMPLATE_KEY_FORMAT = 'prep_template_%s'
@@ -50,44 +53,48 @@ def artifact_summary_get_request(user_id, artifact_id):
          'job': list of [str, str, str]}
     """
     artifact_id = int(artifact_id)
-    artifact = Artifact(artifact_id)
+    info = get_artifact_summary_info(artifact_id)
 
-    access_error = check_access(artifact.study.id, user_id)
+    access_error = check_access(info['study_id'], user_id)
     if access_error:
         return access_error
 
     user = User(user_id)
-    visibility = artifact.visibility
-    summary = artifact.html_summary_fp
+    visibility = info['visibility']
+    summary = [(f_id, fp) for f_id, fp, f_type in info['filepaths']
+               if f_type == 'html_summary']
     job_info = None
     errored_jobs = []
     processing_jobs = []
-    for j in artifact.jobs():
-        if j.command.software.type == "artifact transformation":
-            status = j.status
-            if status == 'success':
+    for j in info['jobs']:
+        if j['software_type'] == "artifact transformation":
+            if j['status'] == 'success':
                 continue
-            j_msg = j.log.msg if status == 'error' else None
             processing_jobs.append(
-                [j.id, j.command.name, j.status, j.step, j_msg])
+                [j['id'], j['command'], j['status'], j['step'], j['log']])
 
     # Check if the HTML summary exists
     if summary:
-        with open(summary[1]) as f:
+        with open(summary[0][1]) as f:
             summary = f.read()
     else:
+        summary = None
         # Check if the summary is being generated
-        command = Command.get_html_generator(artifact.artifact_type)
-        all_jobs = set(artifact.jobs(cmd=command))
-        jobs = [j for j in all_jobs if j.status in ['queued', 'running']]
-        errored_jobs = [(j.id, j.log.msg)
-                        for j in all_jobs if j.status in ['error']]
+        command_id = info['html_generator_id']
+        if command_id is None:
+            raise QiitaDBError(
+                "There is no command to generate the HTML summary for "
+                "artifact type '%s'" % info['artifact_type'])
+        all_jobs = [j for j in info['jobs'] if j['command_id'] == command_id]
+        jobs = [j for j in all_jobs if j['status'] in ['queued', 'running']]
+        errored_jobs = [(j['id'], j['log'])
+                        for j in all_jobs if j['status'] in ['error']]
         if jobs:
             # There is already a job generating the HTML. Also, there should be
             # at most one job, because we are not allowing here to start more
             # than one
             job = jobs[0]
-            job_info = [job.id, job.status, job.step]
+            job_info = [job['id'], job['status'], job['step']]
 
     buttons = []
     btn_base = (
@@ -120,36 +127,37 @@ def artifact_summary_get_request(user_id, artifact_id):
         buttons.append(btn_base % ('revert to sandbox', 'sandbox',
                                    'Revert to sandbox'))
 
-    if artifact.can_be_submitted_to_ebi:
-        if not artifact.is_submitted_to_ebi:
+    if info['can_be_submitted_to_ebi']:
+        if not info['is_submitted_to_ebi']:
             buttons.append(
                 '<a class="btn btn-primary btn-sm" '
                 'href="/ebi_submission/%d">'
                 '<span class="glyphicon glyphicon-export"></span>'
                 ' Submit to EBI</a>' % artifact_id)
-    if artifact.can_be_submitted_to_vamps:
-        if not artifact.is_submitted_to_vamps:
+    if info['can_be_submitted_to_vamps']:
+        if not info['is_submitted_to_vamps']:
             buttons.append(
                 '<a class="btn btn-primary btn-sm" href="/vamps/%d">'
                 '<span class="glyphicon glyphicon-export"></span>'
                 ' Submit to VAMPS</a>' % artifact_id)
     files = [(f_id, "%s (%s)" % (basename(fp), f_type.replace('_', ' ')))
-             for f_id, fp, f_type in artifact.filepaths
+             for f_id, fp, f_type in info['filepaths']
              if f_type != 'directory']
 
+    study = Study(info['study_id'])
     # TODO: https://github.com/biocore/qiita/issues/1724 Remove this hardcoded
     # values to actually get the information from the database once it stores
     # the information
-    if artifact.artifact_type in ['SFF', 'FASTQ', 'FASTA', 'FASTA_Sanger',
-                                  'per_sample_FASTQ']:
+    if info['artifact_type'] in ['SFF', 'FASTQ', 'FASTA', 'FASTA_Sanger',
+                                 'per_sample_FASTQ']:
         # If the artifact is one of the "raw" types, only the owner of the
         # study and users that has been shared with can see the files
-        if not artifact.study.has_access(user, no_public=True):
+        if not study.has_access(user, no_public=True):
             files = []
 
     return {'status': 'success',
             'message': '',
-            'name': artifact.name,
+            'name': info['name'],
             'summary': summary,
             'job': job_info,
             'errored_jobs': errored_jobs,
@@ -157,9 +165,9 @@ def artifact_summary_get_request(user_id, artifact_id):
             'visibility': visibility,
             'buttons': ' '.join(buttons),
             'files': files,
-            'editable': artifact.study.can_edit(user),
-            'study_id': artifact.study.id,
-            'prep_id': artifact.prep_templates[0].id}
+            'editable': study.can_edit(user),
+            'study_id': info['study_id'],
+            'prep_id': info['prep_template_ids'][0]}
 
 
 def artifact_summary_post_request(user_id, artifact_id):
@@ -15,7 +15,8 @@ from natsort import natsorted
 from moi import r_client
 
 from qiita_core.util import execute_as_transaction
-from qiita_pet.handlers.api_proxy.util import check_access, check_fp
+from qiita_pet.handlers.api_proxy.util import (
+    check_access, check_fp, template_to_dict)
 from qiita_ware.context import safe_submit
 from qiita_ware.dispatchable import update_prep_template
 from qiita_db.metadata_template.util import load_template_to_dataframe
@@ -264,7 +265,7 @@ def prep_template_get_req(prep_id, user_id):
     df = prep.to_dataframe()
     return {'status': 'success',
             'message': '',
-            'template': df.to_dict(orient='index')}
+            'template': template_to_dict(df)}
 
 
 def prep_template_summary_get_req(prep_id, user_id):
@@ -8,7 +8,7 @@
 from __future__ import division
 from json import loads, dumps
 
-from natsort import natsorted
+from future.utils import viewitems
 from moi import r_client
 
 from qiita_db.metadata_template.sample_template import SampleTemplate
@@ -21,7 +21,8 @@ from qiita_db.user import User
 from qiita_ware.dispatchable import (
     create_sample_template, update_sample_template, delete_sample_template)
 from qiita_ware.context import safe_submit
-from qiita_pet.handlers.api_proxy.util import check_access, check_fp
+from qiita_pet.handlers.api_proxy.util import (
+    check_access, check_fp, template_to_dict)
 
 SAMPLE_TEMPLATE_KEY_FORMAT = 'sample_template_%s'
 
@@ -83,7 +84,7 @@ def sample_template_get_req(samp_id, user_id):
     df = template.to_dataframe()
     return {'status': 'success',
             'message': '',
-            'template': df.to_dict(orient='index')}
+            'template': template_to_dict(df)}
 
 
 def sample_template_samples_get_req(samp_id, user_id):
@@ -262,28 +263,25 @@ def sample_template_summary_get_req(samp_id, user_id):
                 'stats': {}}
 
     template = SampleTemplate(int(samp_id))
-
-    df = template.to_dataframe()
+    columns = template.categories()
 
     editable = (Study(template.study_id).can_edit(User(user_id)) and not
                 processing)
 
     out = {'status': 'success',
            'message': '',
-           'num_samples': df.shape[0],
-           'num_columns': df.shape[1],
+           'num_samples': len(template),
+           'num_columns': len(columns),
            'editable': editable,
            'alert_type': alert_type,
            'alert_message': alert_msg,
            'stats': {}}
 
-    # drop the samp_id column if it exists
-    if 'study_id' in df.columns:
-        df.drop('study_id', axis=1, inplace=True)
-    for column in df.columns:
-        counts = df[column].value_counts()
-        out['stats'][str(column)] = [(str(key), counts[key])
-                                     for key in natsorted(counts.index)]
+    # the value counts are precomputed, skipping the study_id column if it
+    # exists
+    stats = template.summary([c for c in columns if c != 'study_id'])
+    out['stats'] = {str(column): counts
+                    for column, counts in viewitems(stats)}
 
     return out
 
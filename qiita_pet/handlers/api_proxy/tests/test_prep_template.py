@@ -11,7 +11,7 @@ from os.path import join, exists
 from string import ascii_letters
 from random import choice
 from time import sleep
-from json import loads
+from json import loads, dumps
 
 import pandas as pd
 import numpy.testing as npt
@@ -114,6 +114,8 @@ class TestPrepAPIReadOnly(TestCase):
         self.assertItemsEqual(obs.keys(), ['status', 'message', 'template'])
         self.assertEqual(obs['status'], 'success')
         self.assertEqual(obs['message'], '')
+        # The template can be sent as JSON
+        self.assertEqual(loads(dumps(obs)), obs)
         self.assertEqual(obs['template'].keys(), [
             '1.SKB2.640194', '1.SKM4.640180', '1.SKB3.640195', '1.SKB6.640176',
             '1.SKD6.640190', '1.SKM6.640187', '1.SKD9.640182', '1.SKM8.640201',
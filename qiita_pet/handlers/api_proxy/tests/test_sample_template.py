@@ -9,7 +9,7 @@ from unittest import TestCase, main
 from os import remove, mkdir
 from os.path import join, exists
 from time import sleep
-from json import loads
+from json import loads, dumps
 
 from moi import r_client
 
@@ -81,8 +81,10 @@ class TestSampleAPI(TestCase):
         self.assertEqual(obs['status'], 'success')
         self.assertEqual(obs['message'], '')
         self.assertEqual(len(obs['template']), 27)
-        self.assertEqual(str(
-            obs['template']['1.SKB2.640194']['collection_timestamp']),
+        # The template can be sent as JSON
+        self.assertEqual(loads(dumps(obs)), obs)
+        self.assertEqual(
+            obs['template']['1.SKB2.640194']['collection_timestamp'],
             '2011-11-11 13:00:00')
         del obs['template']['1.SKB2.640194']['collection_timestamp']
         self.assertEqual(obs['template']['1.SKB2.640194'], {
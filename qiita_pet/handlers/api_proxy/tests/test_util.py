@@ -7,9 +7,14 @@
 # -----------------------------------------------------------------------------
 from unittest import TestCase, main
 from os.path import join
+from datetime import datetime
+from json import dumps
+
+import pandas as pd
 
 from qiita_db.util import get_mountpoint
-from qiita_pet.handlers.api_proxy.util import check_access, check_fp
+from qiita_pet.handlers.api_proxy.util import (
+    check_access, check_fp, template_to_dict)
 
 
 class TestUtil(TestCase):
@@ -44,6 +49,24 @@ class TestUtil(TestCase):
                'file': 'badfile'}
         self.assertEqual(obs, exp)
 
+    def test_template_to_dict(self):
+        df = pd.DataFrame.from_dict(
+            {'S1': {'int_col': 1, 'bool_col': True, 'str_col': 'a',
+                    'time_col': datetime(2014, 5, 29, 12, 24, 51)},
+             'S2': {'int_col': 2, 'bool_col': False, 'str_col': None,
+                    'time_col': datetime(2015, 1, 1)}},
+            orient='index')
+        obs = template_to_dict(df)
+        exp = {'S1': {'int_col': 1, 'bool_col': True, 'str_col': 'a',
+                      'time_col': '2014-05-29 12:24:51'},
+               'S2': {'int_col': 2, 'bool_col': False, 'str_col': None,
+                      'time_col': '2015-01-01 00:00:00'}}
+        self.assertEqual(obs, exp)
+        self.assertEqual(type(obs['S1']['int_col']), int)
+        self.assertEqual(type(obs['S1']['bool_col']), bool)
+        # Fails if any value is not JSON serializable
+        dumps(obs)
+
 
 if __name__ == '__main__':
     main()
@@ -6,6 +6,10 @@
 # The full license is in the file LICENSE, distributed with this software.
 # -----------------------------------------------------------------------------
 from os.path import exists, join
+from datetime import datetime
+
+from future.utils import viewitems
+import numpy as np
 
 from qiita_db.exceptions import QiitaDBUnknownIDError
 from qiita_db.study import Study
@@ -74,3 +78,29 @@ def check_fp(study_id, filename):
     return {'status': 'success',
             'message': '',
             'file': fp_rsp}
+
+
+def template_to_dict(df):
+    """Converts a metadata template dataframe to a JSON serializable dict
+
+    Parameters
+    ----------
+    df : pandas DataFrame
+        The metadata template, as returned by `to_dataframe`
+
+    Returns
+    -------
+    dict of {str: {str: object}}
+        The metadata values of each sample, keyed by sample id and column.
+        The numpy values are converted to the equivalent python values and
+        the timestamps are converted to strings
+    """
+    template = df.to_dict(orient='index')
+    for values in template.values():
+        for column, value in viewitems(values):
+            if isinstance(value, np.generic):
+                value = value.item()
+            if isinstance(value, datetime):
+                value = str(value)
+            values[column] = value
+    return template
@@ -1,41 +1,283 @@
-from tornado.web import authenticated
+from tornado.web import authenticated, HTTPError
+from tornado.gen import coroutine, Task
 
-from os.path import basename
+from os import walk
+from os.path import basename, join, isdir, relpath
+from binascii import crc32
+from functools import partial
+import tarfile
 
 from .base_handlers import BaseHandler
 from qiita_pet.exceptions import QiitaPetAuthorizationError
-from qiita_db.util import filepath_id_to_rel_path
-from qiita_db.meta_util import get_accessible_filepath_ids
+from qiita_db.artifact import Artifact
+from qiita_db.util import (filepath_id_to_rel_path, get_db_files_base_dir,
+                           get_filepath_checksums)
+from qiita_db.meta_util import check_filepath_access
+from qiita_db.exceptions import QiitaDBUnknownIDError
 from qiita_core.util import execute_as_transaction
+from qiita_core.qiita_settings import qiita_config
 
 
-class DownloadHandler(BaseHandler):
-    @authenticated
-    @execute_as_transaction
-    def get(self, filepath_id):
-        filepath_id = int(filepath_id)
-        # Check access to file
-        accessible_filepaths = get_accessible_filepath_ids(self.current_user)
+# Number of bytes read from disk and sent to the client at a time when the
+# files are served by Qiita instead of nginx
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+
+
+def _parse_range(range_header, size):
+    """Parses the HTTP Range header of a request
+
+    Parameters
+    ----------
+    range_header : str or None
+        The value of the Range header
+    size : int
+        The size of the requested file, in bytes
+
+    Returns
+    -------
+    tuple of (int, int) or None
+        The first and last bytes requested (both inclusive), or None if the
+        whole file should be sent
+
+    Raises
+    ------
+    ValueError
+        If the range can't be satisfied
+
+    Notes
+    -----
+    Only single byte ranges are supported. Any other range (e.g. multiple
+    ranges or other units) is ignored and the whole file is sent, as allowed
+    by RFC 7233
+    """
+    if not range_header or not range_header.startswith('bytes='):
+        return None
+    spec = range_header[len('bytes='):].strip()
+    if ',' in spec or '-' not in spec:
+        return None
+    start, end = [v.strip() for v in spec.split('-', 1)]
+    try:
+        if not start:
+            # suffix range: the last `end` bytes
+            length = int(end)
+            if length == 0:
+                raise ValueError("Empty suffix range")
+            return max(0, size - length), size - 1
+        start = int(start)
+        end = int(end) if end else size - 1
+    except ValueError:
+        if start or end:
+            raise
+        return None
+    if start > end or start >= size:
+        raise ValueError("Range %s not satisfiable" % range_header)
+    return start, min(end, size - 1)
+
+
+def _etag_matches(if_none_match, etag):
+    """Checks if an If-None-Match header matches an entity tag"""
+    if not if_none_match:
+        return False
+    tags = [t.strip() for t in if_none_match.split(',')]
+    return '*' in tags or etag in tags or ('W/%s' % etag) in tags
+
+
+class _ChunkBuffer(object):
+    """File-like object that keeps the written data until it is consumed"""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(data)
+
+    def close(self):
+        pass
+
+    def consume(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def _tar_members(paths):
+    """Yields the (name in the tar, path) of the files to add to a tar
+
+    Parameters
+    ----------
+    paths : iterable of str
+        The paths to add. Directories are added recursively
+
+    Yields
+    ------
+    (str, str)
+        The name in the tar and the path of each file
+    """
+    for path in paths:
+        if isdir(path):
+            parent = join(path, '..')
+            for dp, _, fps in walk(path):
+                for fp in sorted(fps):
+                    yield relpath(join(dp, fp), parent), join(dp, fp)
+        else:
+            yield basename(path), path
 
-        if filepath_id not in accessible_filepaths:
-            raise QiitaPetAuthorizationError(
-                self.current_user, 'filepath id %s' % str(filepath_id))
 
-        relpath = filepath_id_to_rel_path(filepath_id)
-        fname = basename(relpath)
+def _tar_stream(paths, chunk_size=DOWNLOAD_CHUNK_SIZE):
+    """Generates an uncompressed tar of the given paths, chunk by chunk
 
-        # If we don't have nginx, write a file that indicates this
-        self.write("This installation of Qiita was not equipped with nginx, "
-                   "so it is incapable of serving files. The file you "
-                   "attempted to download is located at %s" % relpath)
+    Parameters
+    ----------
+    paths : iterable of str
+        The paths to add to the tar. Directories are added recursively
+    chunk_size : int, optional
+        The number of bytes read from the files at a time
 
+    Yields
+    ------
+    str
+        The consecutive chunks of the tar file
+
+    Notes
+    -----
+    The files are read in chunks and the tar is never fully kept in memory
+    nor written to disk
+    """
+    buf = _ChunkBuffer()
+    tar = tarfile.open(fileobj=buf, mode='w|')
+    for name, path in _tar_members(paths):
+        info = tar.gettarinfo(path, name)
+        # Without a file object only the header of the member is written, so
+        # its contents can be added in chunks
+        tar.addfile(info)
+        with open(path, 'rb') as f:
+            for chunk in iter(partial(f.read, chunk_size), b''):
+                tar.fileobj.write(chunk)
+                yield buf.consume()
+        blocks, remainder = divmod(info.size, tarfile.BLOCKSIZE)
+        if remainder:
+            tar.fileobj.write(
+                tarfile.NUL * (tarfile.BLOCKSIZE - remainder))
+            blocks += 1
+        tar.offset += blocks * tarfile.BLOCKSIZE
+    tar.close()
+    yield buf.consume()
+
+
+class BaseDownloadHandler(BaseHandler):
+    def _set_download_headers(self, fname):
         self.set_header('Content-Description', 'File Transfer')
         self.set_header('Content-Type', 'application/octet-stream')
         self.set_header('Content-Transfer-Encoding', 'binary')
         self.set_header('Expires',  '0')
         self.set_header('Cache-Control',  'no-cache')
-        self.set_header('X-Accel-Redirect', '/protected/' + relpath)
         self.set_header('Content-Disposition',
                         'attachment; filename=%s' % fname)
 
+    @coroutine
+    def _write_chunks(self, chunks):
+        """Writes the chunks, waiting for each of them to reach the client"""
+        for chunk in chunks:
+            if chunk:
+                self.write(chunk)
+                yield Task(self.flush)
+
+
+class DownloadHandler(BaseDownloadHandler):
+    @execute_as_transaction
+    def _get_file_info(self, filepath_id):
+        if not check_filepath_access(self.current_user, filepath_id):
+            raise QiitaPetAuthorizationError(
+                self.current_user, 'filepath id %s' % str(filepath_id))
+        rel_path = filepath_id_to_rel_path(filepath_id)
+        checksum = get_filepath_checksums([filepath_id])[filepath_id]
+        return get_db_files_base_dir(), rel_path, checksum
+
+    @authenticated
+    @coroutine
+    def get(self, filepath_id):
+        filepath_id = int(filepath_id)
+        # Check access to file
+        base_dir, rel_path, checksum = self._get_file_info(filepath_id)
+        fname = basename(rel_path)
+        self._set_download_headers(fname)
+
+        if qiita_config.use_nginx:
+            # nginx replaces this body with the file. The body is only seen
+            # if the request does not go through nginx
+            self.write("This installation of Qiita was not equipped with "
+                       "nginx, so it is incapable of serving files. The file "
+                       "you attempted to download is located at %s" % rel_path)
+            self.set_header('X-Accel-Redirect', '/protected/' + rel_path)
+            self.finish()
+            return
+
+        etag = '"%s"' % checksum
+        self.set_header('Etag', etag)
+        self.set_header('Accept-Ranges', 'bytes')
+        if _etag_matches(self.request.headers.get('If-None-Match'), etag):
+            self.set_status(304)
+            self.finish()
+            return
+
+        with open(join(base_dir, rel_path), 'rb') as f:
+            f.seek(0, 2)
+            size = f.tell()
+            try:
+                byte_range = _parse_range(
+                    self.request.headers.get('Range'), size)
+            except ValueError:
+                self.set_status(416)
+                self.set_header('Content-Range', 'bytes */%d' % size)
+                self.finish()
+                return
+            start, end = 0, size - 1
+            if byte_range is not None:
+                start, end = byte_range
+                self.set_status(206)
+                self.set_header('Content-Range',
+                                'bytes %d-%d/%d' % (start, end, size))
+            length = end - start + 1
+            self.set_header('Content-Length', length)
+
+            f.seek(start)
+            chunks = (f.read(min(DOWNLOAD_CHUNK_SIZE, length - offset))
+                      for offset in range(0, length, DOWNLOAD_CHUNK_SIZE))
+            yield self._write_chunks(chunks)
+        self.finish()
+
+
+class DownloadArtifactHandler(BaseDownloadHandler):
+    @execute_as_transaction
+    def _get_artifact_files(self, artifact_id):
+        try:
+            artifact = Artifact(artifact_id)
+        except QiitaDBUnknownIDError:
+            raise HTTPError(404)
+        filepaths = artifact.filepaths
+        for fid, _, _ in filepaths:
+            if not check_filepath_access(self.current_user, fid):
+                raise QiitaPetAuthorizationError(
+                    self.current_user, 'artifact id %s' % str(artifact_id))
+        checksums = get_filepath_checksums([fid for fid, _, _ in filepaths])
+        return [fp for _, fp, _ in filepaths], [
+            '%s:%s' % (fid, checksums[fid]) for fid, _, _ in filepaths]
+
+    @authenticated
+    @coroutine
+    def get(self, artifact_id):
+        """Streams a tar with all the files of the artifact"""
+        artifact_id = int(artifact_id)
+        paths, checksums = self._get_artifact_files(artifact_id)
+        self._set_download_headers('artifact_%d.tar' % artifact_id)
+        self.set_header('Content-Type', 'application/x-tar')
+
+        etag = '"%d"' % (crc32(','.join(checksums)) & 0xffffffff)
+        self.set_header('Etag', etag)
+        if _etag_matches(self.request.headers.get('If-None-Match'), etag):
+            self.set_status(304)
+            self.finish()
+            return
+
+        yield self._write_chunks(_tar_stream(paths))
         self.finish()
@@ -8,7 +8,7 @@
 
 from .listing_handlers import (ListStudiesHandler, StudyApprovalList,
                                ShareStudyAJAX, SearchStudiesAJAX,
-                               AutocompleteHandler)
+                               StudyListSamplesAJAX, AutocompleteHandler)
 from .edit_handlers import StudyEditHandler, CreateStudyAJAX
 from .ebi_handlers import EBISubmitHandler
 from .vamps_handlers import VAMPSHandler
@@ -34,4 +34,4 @@ __all__ = ['ListStudiesHandler', 'StudyApprovalList', 'ShareStudyAJAX',
            'StudyDeleteAjax', 'ArtifactAJAX', 'NewPrepTemplateAjax',
            'DataTypesMenuAJAX', 'StudyFilesAJAX', 'PrepTemplateSummaryAJAX',
            'ArtifactSummaryAJAX', 'WorkflowHandler', 'WorkflowRunHandler',
-           'JobAJAX', 'AutocompleteHandler']
+           'JobAJAX', 'AutocompleteHandler', 'StudyListSamplesAJAX']
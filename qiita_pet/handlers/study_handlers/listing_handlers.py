@@ -20,8 +20,11 @@ from qiita_db.user import User
 from qiita_db.study import Study
 from qiita_db.search import QiitaStudySearch
 from qiita_db.logger import LogEntry
-from qiita_db.exceptions import QiitaDBIncompatibleDatatypeError
-from qiita_db.util import (add_message, generate_study_list)
+from qiita_db.exceptions import (QiitaDBIncompatibleDatatypeError,
+                                 QiitaDBUnknownIDError)
+from qiita_db.util import (add_message, generate_study_list,
+                           get_study_list_page, get_artifacts_samples,
+                           STUDY_LIST_SORT_COLUMNS)
 from qiita_core.exceptions import IncompetentQiitaDeveloperError
 from qiita_core.util import execute_as_transaction
 from qiita_core.qiita_settings import qiita_config
@@ -32,14 +35,11 @@ from qiita_pet.handlers.util import (
     get_shared_links)
 
 
-@execute_as_transaction
-def _build_study_info(user, search_type, study_proc=None, proc_samples=None):
-    """Builds list of dicts for studies table, with all HTML formatted
+def _study_list_args(search_type, study_proc=None, proc_samples=None):
+    """Gets the arguments to select the studies of the studies table
 
     Parameters
     ----------
-    user : User object
-        logged in user
     search_type : choice, ['user', 'public']
         what kind of search to perform
     study_proc : dict of lists, optional
@@ -51,13 +51,12 @@ def _build_study_info(user, search_type, study_proc=None, proc_samples=None):
 
     Returns
     -------
-    infolist: list of dict of lists and dicts
-        study and processed data info for JSON serialiation for datatables
-        Each dict in the list is a single study, and contains the text
-
-    Notes
-    -----
-    Both study_proc and proc_samples must be passed, or neither passed.
+    list of int or None
+        The ids of the studies to select, None for all of them
+    bool
+        Whether the processed data of the studies should be built
+    list of str
+        The kinds of access the user should have on the studies
     """
     build_samples = False
     # Logic check to make sure both needed parts passed
@@ -70,20 +69,55 @@ def _build_study_info(user, search_type, study_proc=None, proc_samples=None):
     elif study_proc is None:
         build_samples = True
 
-    # get list of studies for table
+    # get list of studies for table, the permissions are checked on the query
     if search_type == 'user':
-        study_set = user.user_studies.union(user.shared_studies)
+        access = ['owned', 'shared']
     elif search_type == 'public':
-        study_set = Study.get_by_status('public')
+        access = ['public']
     else:
         raise ValueError('Not a valid search type')
+    study_ids = None
     if study_proc is not None:
-        study_set = study_set.intersection(study_proc)
-    if not study_set:
+        study_ids = list(study_proc)
+
+    return study_ids, build_samples, access
+
+
+@execute_as_transaction
+def _build_study_info(user, search_type, study_proc=None, proc_samples=None):
+    """Builds list of dicts for studies table, with all HTML formatted
+
+    Parameters
+    ----------
+    user : User object
+        logged in user
+    search_type : choice, ['user', 'public']
+        what kind of search to perform
+    study_proc : dict of lists, optional
+        Dictionary keyed on study_id that lists all processed data associated
+        with that study. Required if proc_samples given.
+    proc_samples : dict of lists, optional
+        Dictionary keyed on proc_data_id that lists all samples associated with
+        that processed data. Required if study_proc given.
+
+    Returns
+    -------
+    infolist: list of dict of lists and dicts
+        study and processed data info for JSON serialiation for datatables
+        Each dict in the list is a single study, and contains the text
+
+    Notes
+    -----
+    Both study_proc and proc_samples must be passed, or neither passed.
+    """
+    study_ids, build_samples, access = _study_list_args(
+        search_type, study_proc, proc_samples)
+    if study_ids is not None and not study_ids:
         # No studies left so no need to continue
         return []
 
-    return generate_study_list([s.id for s in study_set], build_samples)
+    return generate_study_list(study_ids, build_samples, user=user,
+                               access=access)
 
 
 class ListStudiesHandler(BaseHandler):
@@ -169,18 +203,53 @@ class ShareStudyAJAX(BaseHandler):
 
 
 class SearchStudiesAJAX(BaseHandler):
+    def _get_page_args(self):
+        """Gets the paging, sorting and filtering arguments of DataTables
+
+        Returns
+        -------
+        dict
+            The keyword arguments of `get_study_list_page`. By default, all
+            the studies sorted by id are returned
+
+        Notes
+        -----
+        The studies are sorted by id if the requested column can't be sorted
+        in the database, e.g. the columns without data
+        """
+        length = int(self.get_argument('length', -1))
+        kwargs = {'offset': int(self.get_argument('start', 0)),
+                  'limit': length if length >= 0 else None,
+                  'text': self.get_argument('search[value]', None)}
+        column = self.get_argument('order[0][column]', None)
+        if column is not None:
+            sort_column = self.get_argument('columns[%s][data]' % column, '')
+            if sort_column not in STUDY_LIST_SORT_COLUMNS:
+                sort_column = 'study_id'
+            kwargs['sort_column'] = sort_column
+            kwargs['descending'] = self.get_argument(
+                'order[0][dir]', 'asc') == 'desc'
+        return kwargs
+
     @authenticated
     @execute_as_transaction
     def get(self, ignore):
         user = self.get_argument('user')
         query = self.get_argument('query')
         search_type = self.get_argument('search_type')
-        echo = int(self.get_argument('sEcho'))
+        # DataTables sends the draw counter when the processing is done on
+        # the server, which needs to be sent back
+        echo = self.get_argument('draw', None)
+        echo = int(echo if echo is not None else self.get_argument('sEcho'))
 
         if user != self.current_user.id:
             raise HTTPError(403, 'Unauthorized search!')
         if search_type not in ['user', 'public']:
             raise HTTPError(400, 'Not a valid search type')
+        try:
+            page_args = self._get_page_args()
+        except ValueError:
+            raise HTTPError(400, 'Not valid paging arguments')
         if query:
             # Search for samples matching the query
             search = QiitaStudySearch()
@@ -211,35 +280,73 @@ class SearchStudiesAJAX(BaseHandler):
                 return
         else:
             study_proc = proc_samples = None
-        info = _build_study_info(self.current_user, search_type, study_proc,
-                                 proc_samples)
+        study_ids, build_samples, access = _study_list_args(
+            search_type, study_proc, proc_samples)
+        try:
+            total, filtered, page_ids = get_study_list_page(
+                study_ids, user=self.current_user, access=access,
+                **page_args)
+        except ValueError as e:
+            raise HTTPError(400, str(e))
+        # Only the studies of the requested page are built, in order
+        order = {s_id: i for i, s_id in enumerate(page_ids)}
+        info = sorted(generate_study_list(page_ids, build_samples),
+                      key=lambda s: order[s['study_id']])
         # linkifying data
-        len_info = len(info)
-        for i in range(len_info):
-            info[i]['shared'] = ", ".join([study_person_linkifier(element)
-                                           for element in info[i]['shared']])
-            info[i]['pmid'] = ", ".join([pubmed_linkifier([element])
-                                         for element in info[i]['pmid']])
-            info[i]['publication_doi'] = ", ".join([
+        for study in info:
+            study['shared'] = ", ".join([study_person_linkifier(element)
+                                         for element in study['shared']])
+            study['pmid'] = ", ".join([pubmed_linkifier([element])
+                                       for element in study['pmid']])
+            study['publication_doi'] = ", ".join([
                 doi_linkifier([element])
-                for element in info[i]['publication_doi']])
-            info[i]['pi'] = study_person_linkifier(info[i]['pi'])
+                for element in study['publication_doi']])
+            study['pi'] = study_person_linkifier(study['pi'])
 
-            info[i]['ebi_info'] = info[i]['ebi_submission_status']
-            ebi_study_accession = info[i]['ebi_study_accession']
+            study['ebi_info'] = study['ebi_submission_status']
+            ebi_study_accession = study['ebi_study_accession']
             if ebi_study_accession:
-                info[i]['ebi_info'] = '%s (%s)' % (
+                study['ebi_info'] = '%s (%s)' % (
                     ''.join([EBI_LINKIFIER.format(a)
                              for a in ebi_study_accession.split(',')]),
-                    info[i]['ebi_submission_status'])
+                    study['ebi_submission_status'])
+
+            # The sample lists are retrieved with StudyListSamplesAJAX when
+            # the row is expanded, only their size is sent with the table
+            for proc_info in study['proc_data_info']:
+                proc_info['number_samples'] = len(proc_info.pop('samples'))
 
         # build the table json
         results = {
             "sEcho": echo,
-            "iTotalRecords": len_info,
-            "iTotalDisplayRecords": len_info,
+            "iTotalRecords": total,
+            "iTotalDisplayRecords": filtered,
             "aaData": info
         }
 
         # return the json in compact form to save transmit size
         self.write(dumps(results, separators=(',', ':')))
+
+
+class StudyListSamplesAJAX(BaseHandler):
+    @authenticated
+    @execute_as_transaction
+    def get(self):
+        """Returns the samples of the processed data of the studies table
+
+        The ids of the processed data are passed, comma separated, in the
+        `pids` argument
+        """
+        try:
+            pids = [int(pid) for pid in self.get_argument('pids').split(',')]
+        except ValueError:
+            raise HTTPError(400, 'Not valid processed data ids')
+        for pid in pids:
+            try:
+                study = Artifact(pid).study
+            except QiitaDBUnknownIDError:
+                raise HTTPError(404, 'Processed data %d does not exist' % pid)
+            check_access(self.current_user, study, raise_error=True)
+
+        self.write(dumps({'samples': get_artifacts_samples(pids)},
+                         separators=(',', ':')))
@@ -354,20 +354,7 @@ class TestSearchStudiesAJAX(TestHandlerBase):
                     'sortmerna_e_value': 1,
                     'sortmerna_coverage': 0.97,
                     'threads': 1,
-                    'samples': ['1.SKB1.640202', '1.SKB2.640194',
-                                '1.SKB3.640195', '1.SKB4.640189',
-                                '1.SKB5.640181', '1.SKB6.640176',
-                                '1.SKB7.640196', '1.SKB8.640193',
-                                '1.SKB9.640200', '1.SKD1.640179',
-                                '1.SKD2.640178', '1.SKD3.640198',
-                                '1.SKD4.640185', '1.SKD5.640186',
-                                '1.SKD6.640190', '1.SKD7.640191',
-                                '1.SKD8.640184', '1.SKD9.640182',
-                                '1.SKM1.640183', '1.SKM2.640199',
-                                '1.SKM3.640197', '1.SKM4.640180',
-                                '1.SKM5.640177', '1.SKM6.640187',
-                                '1.SKM7.640188', '1.SKM8.640201',
-                                '1.SKM9.640192']
+                    'number_samples': 27
                     }, {
                     'pid': 5,
                     'processed_date': '2012-10-02 17:30:00',
@@ -383,20 +370,7 @@ class TestSearchStudiesAJAX(TestHandlerBase):
                     'sortmerna_e_value': 1,
                     'sortmerna_coverage': 0.97,
                     'threads': 1,
-                    'samples': ['1.SKB1.640202', '1.SKB2.640194',
-                                '1.SKB3.640195', '1.SKB4.640189',
-                                '1.SKB5.640181', '1.SKB6.640176',
-                                '1.SKB7.640196', '1.SKB8.640193',
-                                '1.SKB9.640200', '1.SKD1.640179',
-                                '1.SKD2.640178', '1.SKD3.640198',
-                                '1.SKD4.640185', '1.SKD5.640186',
-                                '1.SKD6.640190', '1.SKD7.640191',
-                                '1.SKD8.640184', '1.SKD9.640182',
-                                '1.SKM1.640183', '1.SKM2.640199',
-                                '1.SKM3.640197', '1.SKM4.640180',
-                                '1.SKM5.640177', '1.SKM6.640187',
-                                '1.SKM7.640188', '1.SKM8.640201',
-                                '1.SKM9.640192']
+                    'number_samples': 27
                     }, {
                     'pid': 6,
                     'processed_date': '2012-10-02 17:30:00',
@@ -412,38 +386,12 @@ class TestSearchStudiesAJAX(TestHandlerBase):
                     'sortmerna_e_value': 1,
                     'sortmerna_coverage': 0.97,
                     'threads': 1,
-                    'samples': ['1.SKB1.640202', '1.SKB2.640194',
-                                '1.SKB3.640195', '1.SKB4.640189',
-                                '1.SKB5.640181', '1.SKB6.640176',
-                                '1.SKB7.640196', '1.SKB8.640193',
-                                '1.SKB9.640200', '1.SKD1.640179',
-                                '1.SKD2.640178', '1.SKD3.640198',
-                                '1.SKD4.640185', '1.SKD5.640186',
-                                '1.SKD6.640190', '1.SKD7.640191',
-                                '1.SKD8.640184', '1.SKD9.640182',
-                                '1.SKM1.640183', '1.SKM2.640199',
-                                '1.SKM3.640197', '1.SKM4.640180',
-                                '1.SKM5.640177', '1.SKM6.640187',
-                                '1.SKM7.640188', '1.SKM8.640201',
-                                '1.SKM9.640192']
+                    'number_samples': 27
                     }, {
                     'pid': 7,
                     'processed_date': '2012-10-02 17:30:00',
                     'data_type': '16S',
-                    'samples': ['1.SKB1.640202', '1.SKB2.640194',
-                                '1.SKB3.640195', '1.SKB4.640189',
-                                '1.SKB5.640181', '1.SKB6.640176',
-                                '1.SKB7.640196', '1.SKB8.640193',
-                                '1.SKB9.640200', '1.SKD1.640179',
-                                '1.SKD2.640178', '1.SKD3.640198',
-                                '1.SKD4.640185', '1.SKD5.640186',
-                                '1.SKD6.640190', '1.SKD7.640191',
-                                '1.SKD8.640184', '1.SKD9.640182',
-                                '1.SKM1.640183', '1.SKM2.640199',
-                                '1.SKM3.640197', '1.SKM4.640180',
-                                '1.SKM5.640177', '1.SKM6.640187',
-                                '1.SKM7.640188', '1.SKM8.640201',
-                                '1.SKM9.640192']
+                    'number_samples': 27
                     }]
                 }]
             }
@@ -518,5 +466,84 @@ class TestSearchStudiesAJAX(TestHandlerBase):
         self.assertEqual(response.code, 200)
         self.assertEqual(loads(response.body), self.empty)
 
+    def test_get_server_side(self):
+        args = {'user': 'test@foo.bar', 'search_type': 'user', 'query': '',
+                'sEcho': '1021', 'draw': '3', 'start': '0', 'length': '10',
+                'search[value]': 'cannabis', 'order[0][column]': '2',
+                'order[0][dir]': 'desc', 'columns[2][data]': 'study_title'}
+        response = self.get('/study/search/', args)
+        self.assertEqual(response.code, 200)
+        self.json['sEcho'] = 3
+        self.assertEqual(loads(response.body), self.json)
+
+        # Filtered out
+        args['search[value]'] = 'no study has this'
+        response = self.get('/study/search/', args)
+        self.assertEqual(response.code, 200)
+        self.assertEqual(loads(response.body), {
+            'aaData': [], 'iTotalDisplayRecords': 0, 'iTotalRecords': 1,
+            'sEcho': 3})
+
+        # Out of the last page
+        args['search[value]'] = ''
+        args['start'] = '10'
+        response = self.get('/study/search/', args)
+        self.assertEqual(response.code, 200)
+        self.assertEqual(loads(response.body), {
+            'aaData': [], 'iTotalDisplayRecords': 1, 'iTotalRecords': 1,
+            'sEcho': 3})
+
+        # The columns that are not in the database are sorted by study id
+        args['columns[2][data]'] = 'ebi_info'
+        response = self.get('/study/search/', args)
+        self.assertEqual(response.code, 200)
+        self.assertEqual(loads(response.body)['iTotalDisplayRecords'], 1)
+
+        args['columns[2][data]'] = 'study_title'
+        args['length'] = 'all'
+        response = self.get('/study/search/', args)
+        self.assertEqual(response.code, 400)
+
+    def test_get_server_side_column_without_data(self):
+        # The first column has no data, and DataTables may send it as the
+        # sort column
+        args = {'user': 'test@foo.bar', 'search_type': 'user', 'query': '',
+                'draw': '1', 'start': '0', 'length': '10',
+                'search[value]': '', 'order[0][column]': '0',
+                'order[0][dir]': 'asc', 'columns[0][data]': ''}
+        response = self.get('/study/search/', args)
+        self.assertEqual(response.code, 200)
+        self.json['sEcho'] = 1
+        self.assertEqual(loads(response.body), self.json)
+
+
+class TestStudyListSamplesAJAX(TestHandlerBase):
+    def test_get(self):
+        response = self.get('/study/list/samples/', {'pids': '4,7'})
+        self.assertEqual(response.code, 200)
+        samples = ['1.SKB1.640202', '1.SKB2.640194', '1.SKB3.640195',
+                   '1.SKB4.640189', '1.SKB5.640181', '1.SKB6.640176',
+                   '1.SKB7.640196', '1.SKB8.640193', '1.SKB9.640200',
+                   '1.SKD1.640179', '1.SKD2.640178', '1.SKD3.640198',
+                   '1.SKD4.640185', '1.SKD5.640186', '1.SKD6.640190',
+                   '1.SKD7.640191', '1.SKD8.640184', '1.SKD9.640182',
+                   '1.SKM1.640183', '1.SKM2.640199', '1.SKM3.640197',
+                   '1.SKM4.640180', '1.SKM5.640177', '1.SKM6.640187',
+                   '1.SKM7.640188', '1.SKM8.640201', '1.SKM9.640192']
+        self.assertEqual(loads(response.body),
+                         {'samples': {'4': samples, '7': samples}})
+
+    def test_get_errors(self):
+        response = self.get('/study/list/samples/', {'pids': '4,a'})
+        self.assertEqual(response.code, 400)
+        response = self.get('/study/list/samples/', {'pids': '1000'})
+        self.assertEqual(response.code, 404)
+
+        BaseHandler.get_current_user = Mock(
+            return_value=User("demo@microbio.me"))
+        response = self.get('/study/list/samples/', {'pids': '4'})
+        self.assertEqual(response.code, 403)
+
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,125 @@
+from unittest import TestCase, main
+from tempfile import mkstemp, mkdtemp
+from os import close, remove, makedirs
+from os.path import join, exists, basename
+from shutil import rmtree
+from io import BytesIO
+import tarfile
+
+from qiita_pet.test.tornado_test_base import TestHandlerBase
+from qiita_pet.handlers.download import _parse_range, _tar_stream
+import qiita_db as qdb
+
+
+class TestDownloadUtils(TestCase):
+    def setUp(self):
+        self._clean_up_files = []
+
+    def tearDown(self):
+        for fp in self._clean_up_files:
+            if exists(fp):
+                rmtree(fp)
+
+    def test_parse_range(self):
+        self.assertIsNone(_parse_range(None, 10))
+        self.assertIsNone(_parse_range('items=0-5', 10))
+        self.assertIsNone(_parse_range('bytes=0-1,4-5', 10))
+        self.assertEqual(_parse_range('bytes=2-5', 10), (2, 5))
+        self.assertEqual(_parse_range('bytes=2-', 10), (2, 9))
+        self.assertEqual(_parse_range('bytes=2-50', 10), (2, 9))
+        self.assertEqual(_parse_range('bytes=-3', 10), (7, 9))
+        self.assertEqual(_parse_range('bytes=-30', 10), (0, 9))
+        with self.assertRaises(ValueError):
+            _parse_range('bytes=10-', 10)
+        with self.assertRaises(ValueError):
+            _parse_range('bytes=5-2', 10)
+        with self.assertRaises(ValueError):
+            _parse_range('bytes=-0', 10)
+
+    def test_tar_stream(self):
+        base = mkdtemp()
+        self._clean_up_files.append(base)
+        fp = join(base, 'seqs.fna')
+        with open(fp, 'w') as f:
+            f.write('>seq1\nACGT\n' * 100)
+        dp = join(base, 'sortmerna_picked_otus')
+        makedirs(dp)
+        with open(join(dp, 'otu_map.txt'), 'w') as f:
+            f.write('otu1\tseq1\n')
+
+        chunks = list(_tar_stream([fp, dp], chunk_size=100))
+        self.assertTrue(len(chunks) > 2)
+        with tarfile.open(fileobj=BytesIO(b''.join(chunks))) as tar:
+            self.assertEqual(
+                tar.getnames(),
+                ['seqs.fna', 'sortmerna_picked_otus/otu_map.txt'])
+            self.assertEqual(tar.extractfile('seqs.fna').read(),
+                             b'>seq1\nACGT\n' * 100)
+            self.assertEqual(
+                tar.extractfile('sortmerna_picked_otus/otu_map.txt').read(),
+                b'otu1\tseq1\n')
+
+
+class TestDownloadHandler(TestHandlerBase):
+    database = True
+
+    def setUp(self):
+        super(TestDownloadHandler, self).setUp()
+        fd, fp = mkstemp(suffix='_seqs.fastq')
+        close(fd)
+        self.contents = b'@seq1\nACGTACGT\n+\nAAAAAAAA\n'
+        with open(fp, 'wb') as f:
+            f.write(self.contents)
+        self.filepath_id = qdb.util.insert_filepaths(
+            [(fp, "raw_forward_seqs")], 1, "FASTQ", "filepath")[0]
+        with qdb.sql_connection.TRN:
+            sql = """INSERT INTO qiita.artifact_filepath
+                            (artifact_id, filepath_id)
+                        VALUES (%s, %s)"""
+            qdb.sql_connection.TRN.add(sql, [1, self.filepath_id])
+            qdb.sql_connection.TRN.execute()
+        self.filepath = join(
+            qdb.util.get_db_files_base_dir(),
+            qdb.util.filepath_id_to_rel_path(self.filepath_id))
+        self.etag = '"%s"' % qdb.util.get_filepath_checksums(
+            [self.filepath_id])[self.filepath_id]
+
+    def tearDown(self):
+        if exists(self.filepath):
+            remove(self.filepath)
+        super(TestDownloadHandler, self).tearDown()
+
+    def test_download(self):
+        response = self.get('/download/%d' % self.filepath_id)
+        self.assertEqual(response.code, 200)
+        self.assertEqual(response.body, self.contents)
+        self.assertEqual(response.headers['Etag'], self.etag)
+        self.assertEqual(response.headers['Content-Disposition'],
+                         'attachment; filename=%s' % basename(self.filepath))
+
+    def test_download_range(self):
+        response = self.get('/download/%d' % self.filepath_id,
+                            headers={'Range': 'bytes=6-13'})
+        self.assertEqual(response.code, 206)
+        self.assertEqual(response.body, b'ACGTACGT')
+        self.assertEqual(response.headers['Content-Range'],
+                         'bytes 6-13/%d' % len(self.contents))
+
+        response = self.get('/download/%d' % self.filepath_id,
+                            headers={'Range': 'bytes=1000-'})
+        self.assertEqual(response.code, 416)
+        self.assertEqual(response.headers['Content-Range'],
+                         'bytes */%d' % len(self.contents))
+
+    def test_download_not_modified(self):
+        response = self.get('/download/%d' % self.filepath_id,
+                            headers={'If-None-Match': self.etag})
+        self.assertEqual(response.code, 304)
+
+        response = self.get('/download/%d' % self.filepath_id,
+                            headers={'If-None-Match': '"other"'})
+        self.assertEqual(response.code, 200)
+
+
+if __name__ == "__main__":
+    main()
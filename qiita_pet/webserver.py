@@ -31,13 +31,15 @@ from qiita_pet.handlers.study_handlers import (
     StudyDeleteAjax, ArtifactAdminAJAX, ArtifactAJAX,
     NewPrepTemplateAjax, DataTypesMenuAJAX, StudyFilesAJAX,
     PrepTemplateSummaryAJAX, ArtifactSummaryAJAX,
-    WorkflowHandler, WorkflowRunHandler, JobAJAX, AutocompleteHandler)
+    WorkflowHandler, WorkflowRunHandler, JobAJAX, AutocompleteHandler,
+    StudyListSamplesAJAX)
 from qiita_pet.handlers.websocket_handlers import (
     MessageHandler, SelectedSocketHandler, SelectSamplesHandler)
 from qiita_pet.handlers.logger_handlers import LogEntryViewerHandler
 from qiita_pet.handlers.upload import UploadFileHandler, StudyUploadFileHandler
 from qiita_pet.handlers.stats import StatsHandler
-from qiita_pet.handlers.download import DownloadHandler
+from qiita_pet.handlers.download import (
+    DownloadHandler, DownloadArtifactHandler)
 from qiita_pet.handlers.prep_template import PrepTemplateHandler
 from qiita_pet.handlers.ontology import OntologyHandler
 from qiita_db.handlers.processing_job import (JobHandler, HeartbeatHandler,
@@ -109,6 +111,7 @@ class Application(tornado.web.Application):
             (r"/study/process/job/", JobAJAX),
             (r"/study/process/", ProcessArtifactHandler),
             (r"/study/list/socket/", SelectSamplesHandler),
+            (r"/study/list/samples/", StudyListSamplesAJAX),
             (r"/study/search/(.*)", SearchStudiesAJAX),
             (r"/study/new_artifact/", NewArtifactHandler),
             (r"/study/files/", StudyFilesAJAX),
@@ -136,6 +139,7 @@ class Application(tornado.web.Application):
             (r"/check_study/", CreateStudyAJAX),
             (r"/stats/", StatsHandler),
             (r"/download/(.*)", DownloadHandler),
+            (r"/download_artifact/(.*)", DownloadArtifactHandler),
             (r"/vamps/(.*)", VAMPSHandler),
             # Plugin handlers - the order matters here so do not change
             # qiita_db/jobs/(.*) should go after any of the